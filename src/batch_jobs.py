@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批量换脸 - 按任务清单处理多组 (视频, 人脸)，模型在整个批次中只加载一次
+
+face_swap_cli 每次只处理一个视频，每次启动都要重新加载dlib和InsightFace模型。
+这里：
+    * 任务清单为CSV(带表头)或JSON(对象列表)，每个任务包含 video、face，
+      可选的 output，以及与命令行同名的选项(如 swapper、crf、tracking)，
+      任务中的选项覆盖命令行给出的批次默认选项
+    * 只创建一个FaceSwapEngine加载模型，每个任务使用 clone_for_job 得到的副本，
+      副本共享模型，各自保存路径、选项和处理状态
+    * 多个任务可以在线程池中同时处理，流水线线程数按并发数分摊
+    * 每个任务完成后把结果报告原子写入JSON文件，中途中断也能看到已完成的任务
+
+用法:
+    python batch_jobs.py jobs.csv --concurrency 2 --report report.json --crf 18
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import concurrent.futures
+
+from face_swap_cli import add_option_arguments, apply_options, create_app, process_video, output_folder
+from progress_reporter import ProgressReporter, LoggingSink
+
+logger = logging.getLogger("batch_jobs")
+
+JOB_FIELDS = ('video', 'face', 'output')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'n', 'off', '')
+
+
+def load_jobs(path):
+    """
+    读取任务清单，返回任务字典列表
+
+    相对路径按清单文件所在目录解析；CSV中的空单元格视为未设置
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        rows = data.get('jobs', []) if isinstance(data, dict) else data
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = [{key.strip(): value.strip() for key, value in row.items() if key and value is not None}
+                    for row in csv.DictReader(f)]
+
+    jobs = []
+    for number, row in enumerate(rows, 1):
+        job = {key: value for key, value in row.items() if value != ""}
+        missing = [field for field in ('video', 'face') if not job.get(field)]
+        if missing:
+            raise ValueError(f"任务 {number} 缺少字段: {', '.join(missing)}")
+        for field in JOB_FIELDS:
+            if job.get(field):
+                job[field] = os.path.join(base_dir, os.path.expanduser(job[field]))
+        jobs.append(job)
+    return jobs
+
+
+def coerce_option(parser, dest, value):
+    """按命令行参数的定义转换任务清单中的选项值，未知选项抛出ValueError"""
+    action = next((a for a in parser._actions if a.dest == dest and a.option_strings), None)
+    if action is None:
+        raise ValueError(f"未知选项: {dest}")
+    if action.nargs == 0:
+        # store_true 开关
+        if isinstance(value, str):
+            text = value.strip().lower()
+            if text not in TRUE_VALUES + FALSE_VALUES:
+                raise ValueError(f"选项 {dest} 需要布尔值: {value}")
+            return text in TRUE_VALUES
+        return bool(value)
+    # 字符串按命令行同样的方式转换；自定义的参数类型(如检测尺寸)对JSON中的数字也要校验
+    if action.type is not None and (isinstance(value, str) or action.type not in (int, float)):
+        try:
+            value = action.type(value)
+        except (TypeError, ValueError, argparse.ArgumentTypeError):
+            raise ValueError(f"选项 {dest} 的值无效: {value}")
+    if action.choices is not None and value not in action.choices:
+        raise ValueError(f"选项 {dest} 的值 {value} 不在 {list(action.choices)} 中")
+    return value
+
+
+def job_arguments(parser, defaults, job):
+    """合并批次默认选项和任务自己的选项，返回与命令行相同结构的Namespace"""
+    values = vars(defaults).copy()
+    for key, value in job.items():
+        if key not in JOB_FIELDS:
+            values[key.replace('-', '_')] = coerce_option(parser, key.replace('-', '_'), value)
+    return argparse.Namespace(**values)
+
+
+def default_output_path(job, output_dir):
+    name = os.path.splitext(os.path.basename(job['video']))[0]
+    face = os.path.splitext(os.path.basename(job['face']))[0]
+    return os.path.join(output_dir, f"{name}_{face}_swapped.mp4")
+
+
+class StatusRecorder:
+    """记录最后一条状态消息的进度输出端，任务失败时作为错误原因"""
+
+    def __init__(self):
+        self.text = None
+
+    def __call__(self, event):
+        if event['kind'] == 'status':
+            self.text = event['text']
+
+
+class BatchReport:
+    """批处理结果报告，每次更新都原子写回JSON文件"""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self._lock = threading.Lock()
+        self.save()
+
+    def update_job(self, index, **fields):
+        with self._lock:
+            self.data['jobs'][index].update(fields)
+            self._save_locked()
+
+    def finish(self):
+        with self._lock:
+            jobs = self.data['jobs']
+            self.data['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            self.data['summary'] = {status: sum(1 for job in jobs if job['status'] == status)
+                                    for status in ('done', 'failed', 'skipped')}
+            self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".report_", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2, default=str)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def run_job(base_app, job_args, job, index, report):
+    """在工作线程中处理一个任务，结果写入报告"""
+    job_logger = logging.getLogger(f"batch_jobs.job{index}")
+    report.update_job(index, status='running', started=time.strftime('%Y-%m-%d %H:%M:%S'))
+    job_logger.info(f"开始处理: {job['video']} + {job['face']} -> {job['output']}")
+    recorder = StatusRecorder()
+    start = time.perf_counter()
+    app = None
+    try:
+        # 创建引擎副本和设置选项也可能失败(如模型加载出错)，只记为本任务失败
+        app = base_app.clone_for_job()
+        app.progress_reporter = ProgressReporter(sinks=[LoggingSink(job_logger)])
+        apply_options(app, job_args)
+        result = process_video(app, job['video'], job['face'], job['output'], sinks=[recorder])
+        error = None if result else (recorder.text or "处理失败，请查看日志")
+    except Exception as e:
+        job_logger.exception(f"任务出错: {e}")
+        result, error = False, str(e)
+    elapsed = round(time.perf_counter() - start, 3)
+    metrics = app.job_metrics if app is not None else {}
+
+    if result:
+        report.update_job(index, status='done', result=result, elapsed=elapsed, metrics=metrics)
+        job_logger.info(f"完成: {result} ({elapsed:.1f}秒)")
+    else:
+        report.update_job(index, status='failed', error=error, elapsed=elapsed, metrics=metrics)
+        job_logger.error(f"失败: {error}")
+    return bool(result)
+
+
+def run_batch(base_app, parser, defaults, jobs, report_path, concurrency=1, output_dir=None, skip_existing=False):
+    """
+    处理任务列表，返回报告数据
+
+    选项错误的任务直接记为失败，不影响其他任务
+    """
+    output_dir = output_dir or output_folder
+    concurrency = max(1, int(concurrency))
+    report = BatchReport(report_path, {
+        'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'concurrency': concurrency,
+        'jobs': [{'index': i, 'video': job['video'], 'face': job['face'], 'output': None, 'status': 'pending'}
+                 for i, job in enumerate(jobs)],
+    })
+
+    runnable = []
+    for index, job in enumerate(jobs):
+        job = dict(job)
+        job['output'] = job.get('output') or default_output_path(job, output_dir)
+        report.update_job(index, output=job['output'])
+        try:
+            job_args = job_arguments(parser, defaults, job)
+        except (ValueError, TypeError) as e:
+            report.update_job(index, status='failed', error=str(e))
+            logger.error(f"任务 {index} 选项错误: {e}")
+            continue
+        if concurrency > 1 and job_args.segment_workers <= 1:
+            # 多个任务同时处理时按并发数分摊CPU核心
+            job_args.pipeline_threads = max(1, (os.cpu_count() or 4) // concurrency)
+        if skip_existing and os.path.exists(job['output']):
+            report.update_job(index, status='skipped', result=job['output'])
+            logger.info(f"任务 {index} 的输出已存在，跳过: {job['output']}")
+            continue
+        runnable.append((index, job, job_args))
+
+    logger.info(f"批处理: {len(jobs)} 个任务, 待处理 {len(runnable)} 个, 并发数 {concurrency}")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        futures = [executor.submit(run_job, base_app, job_args, job, index, report)
+                   for index, job, job_args in runnable]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+    report.finish()
+    return report.data
+
+
+def parse_args(argv=None):
+    """解析批处理命令行参数，换脸和编码选项作为所有任务的默认值"""
+    parser = argparse.ArgumentParser(description="按任务清单批量换脸")
+    parser.add_argument("manifest", help="任务清单(CSV或JSON)，字段: video, face, output(可选)和任意命令行选项")
+    group = parser.add_argument_group("批处理选项")
+    group.add_argument("--concurrency", type=int, default=1, help="同时处理的任务数，所有任务共享同一份模型")
+    group.add_argument("--report", metavar="PATH", help="结果报告路径，默认为清单旁的 <清单名>_report.json")
+    group.add_argument("--output-dir", metavar="DIR", help="未指定output的任务的输出目录")
+    group.add_argument("--skip-existing", action="store_true", help="跳过输出文件已存在的任务")
+    add_option_arguments(parser)
+    return parser, parser.parse_args(argv)
+
+
+def main():
+    """批处理的主函数"""
+    parser, args = parse_args()
+    try:
+        jobs = load_jobs(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"读取任务清单失败: {e}")
+        sys.exit(2)
+    report_path = args.report or os.path.splitext(os.path.abspath(args.manifest))[0] + "_report.json"
+
+    # 模型只在这里加载一次，所有任务共享
+    logger.info("正在初始化模型...")
+    load_start = time.perf_counter()
+    base_app = create_app(args)
+    logger.info(f"模型加载完成，用时 {time.perf_counter() - load_start:.1f}秒")
+
+    report = run_batch(base_app, parser, args, jobs, report_path, concurrency=args.concurrency,
+                       output_dir=args.output_dir, skip_existing=args.skip_existing)
+    summary = report['summary']
+    print(f"\n批处理完成: 成功 {summary['done']}, 失败 {summary['failed']}, 跳过 {summary['skipped']}")
+    print(f"结果报告: {report_path}")
+    if summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+人脸区域颜色校正 - 只在掩码的边界框(ROI)内转换色彩空间和统计
+
+掩码通常只覆盖人脸凸包，整帧转换LAB、拆分通道、构造整帧三通道掩码
+的开销与分辨率成正比，而真正需要处理的只是人脸附近的一小块区域：
+    * mask_roi 求出掩码的边界框，所有转换和统计都在这块区域内完成
+    * 统计量只在掩码内计算，校正结果只写回掩码覆盖的像素
+    * ReferenceStatsCache 缓存参考图像(原始帧)的统计量，同一镜头内相邻帧
+      人脸位置变化不大时直接复用，省去参考区域的色彩空间转换
+    * 人脸掩码只在ROI内构造和羽化，校正结果按羽化后的alpha在ROI内混合
+"""
+
+import bisect
+import threading
+
+import cv2
+import numpy as np
+
+
+def mask_roi(mask):
+    """掩码非零像素的边界框 (x, y, w, h)，掩码全为零时返回None"""
+    x, y, w, h = cv2.boundingRect(np.ascontiguousarray(mask, dtype=np.uint8))
+    if w == 0 or h == 0:
+        return None
+    return x, y, w, h
+
+
+def pad_roi(roi, pad, image_shape):
+    """把ROI向四周扩展 pad 像素并裁剪到图像范围内，结果为空时返回None"""
+    x, y, w, h = roi
+    img_h, img_w = image_shape[:2]
+    x0, y0 = max(0, x - pad), max(0, y - pad)
+    x1, y1 = min(img_w, x + w + pad), min(img_h, y + h + pad)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def hull_roi_mask(points, image_shape, pad=0):
+    """
+    点集凸包的掩码，只分配凸包边界框(向外扩展 pad 像素)大小的内存
+
+    返回 (roi, ROI大小的uint8掩码)；凸包完全在图像外时返回 (None, None)
+    """
+    hull = cv2.convexHull(np.asarray(points, dtype=np.float32).reshape(-1, 2)).astype(np.int32)
+    roi = pad_roi(cv2.boundingRect(hull), pad, image_shape)
+    if roi is None:
+        return None, None
+    mask = np.zeros((roi[3], roi[2]), dtype=np.uint8)
+    cv2.fillConvexPoly(mask, hull - np.int32(roi[:2]), 255)
+    return roi, mask
+
+
+def feather_mask(mask, feather):
+    """把uint8掩码的边缘羽化为0-1的float32 alpha，feather 为羽化半径(像素)"""
+    alpha = mask.astype(np.float32) * (1.0 / 255.0)
+    if feather > 0:
+        ksize = 2 * int(feather) + 1
+        alpha = cv2.GaussianBlur(alpha, (ksize, ksize), 0)
+    return alpha
+
+
+def blend_into(image, roi, patch, alpha):
+    """在ROI内按 alpha 把 patch 原地混合进 image"""
+    x, y, w, h = roi
+    area = image[y:y + h, x:x + w]
+    area[...] = cv2.blendLinear(patch, area, alpha, 1.0 - alpha)
+
+
+def masked_mean_std(image, mask):
+    """掩码内各通道的均值和标准差，返回两个长度为通道数的float64数组"""
+    mean, std = cv2.meanStdDev(image, mask=mask)
+    return mean.ravel(), std.ravel()
+
+
+class ReferenceStatsCache:
+    """
+    参考区域颜色统计量的缓存
+
+    同一位置(ROI各边变化不超过 tolerance 像素)的统计量最多复用 max_reuse 次，
+    之后重新计算，避免镜头内光照缓慢变化时统计量过时。给出帧索引时只在
+    同一镜头内、相距不超过 max_gap 帧的帧之间复用，多个工作线程乱序处理帧
+    也不会跨镜头取到其他画面的统计量。
+    """
+
+    def __init__(self, max_reuse=4, tolerance=8, max_entries=8, max_gap=8):
+        self.max_reuse = max_reuse
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self.max_gap = max_gap
+        self.hits = 0
+        self.misses = 0
+        self._entries = []          # [(key, roi, 统计量, 已复用次数, 帧索引)]
+        self._scene_cuts = []       # 镜头切换处的帧索引，升序
+        self._lock = threading.Lock()
+
+    def get(self, key, roi, compute, frame_index=None):
+        """
+        key: 区分调用方和校正方式的标识，如 ('color_correct', 'lab')；
+             不同调用方的掩码不同，统计量不能互用
+        roi: 参考区域 (x, y, w, h)
+        compute: 无参数函数，缓存未命中时调用并返回统计量
+        frame_index: 参考图像所在的帧索引，None表示不限制
+        """
+        with self._lock:
+            for i, (entry_key, entry_roi, stats, uses, entry_index) in enumerate(self._entries):
+                if (entry_key == key and uses < self.max_reuse and self._close(entry_roi, roi)
+                        and self._same_scene(entry_index, frame_index)):
+                    self._entries[i] = (entry_key, entry_roi, stats, uses + 1, entry_index)
+                    self.hits += 1
+                    return stats
+
+        stats = compute()
+        with self._lock:
+            self.misses += 1
+            # 同一位置的旧条目被替换，其他人脸的条目保留
+            self._entries = [entry for entry in self._entries
+                             if not (entry[0] == key and self._close(entry[1], roi))]
+            self._entries.append((key, roi, stats, 0, frame_index))
+            del self._entries[:-self.max_entries]
+        return stats
+
+    def _close(self, a, b):
+        return max(abs(p - q) for p, q in zip(a, b)) <= self.tolerance
+
+    def _same_scene(self, entry_index, frame_index):
+        """两帧相距不超过 max_gap 且之间没有镜头切换"""
+        if entry_index is None or frame_index is None:
+            return entry_index is None and frame_index is None
+        if abs(frame_index - entry_index) > self.max_gap:
+            return False
+        return bisect.bisect_right(self._scene_cuts, entry_index) == bisect.bisect_right(self._scene_cuts, frame_index)
+
+    def scene_cut(self, frame_index):
+        """
+        记录从 frame_index 开始的新镜头并丢弃已有统计量
+
+        需要在该帧进入处理阶段之前调用(如在解码线程中)，之后切换点两侧的帧不再互相复用
+        """
+        with self._lock:
+            self._entries = []
+            bisect.insort(self._scene_cuts, frame_index)
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._scene_cuts = []
+
+
+def transfer_stats(target, target_stats, reference_stats, channels=None):
+    """
+    把 target 各通道的均值和标准差调整为参考统计量，返回float32数组
+
+    channels: 只调整这些通道，None表示全部通道
+    """
+    target_mean, target_std = target_stats
+    reference_mean, reference_std = reference_stats
+    scale = reference_std / np.maximum(target_std, 1e-3)
+    offset = reference_mean - target_mean * scale
+    if channels is not None:
+        keep = np.ones(len(scale), dtype=bool)
+        keep[list(channels)] = False
+        scale[keep] = 1.0
+        offset[keep] = 0.0
+    return target.astype(np.float32) * scale.astype(np.float32) + offset.astype(np.float32)
+
+
+def paste_masked(image, roi, patch, mask):
+    """把ROI大小的 patch 按 mask 写回 image 的副本"""
+    x, y, w, h = roi
+    result = image.copy()
+    np.copyto(result[y:y + h, x:x + w], patch, where=mask[..., None] if patch.ndim == 3 else mask)
+    return result
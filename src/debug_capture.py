@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+调试图像采集 - 按帧采样、后台线程异步写入
+
+换脸过程中的中间结果(掩码、无缝克隆前后的图像等)只在排查问题时需要。
+DebugCapture 默认关闭；开启后：
+    * 'failures' 模式只保存处理失败或走备选路径的帧
+    * 'sample' 模式另外每隔 interval 帧保存一帧的全部中间结果
+    * 图像在调用线程中复制后放入有界队列，由后台线程写盘，
+      队列满时直接丢弃，不阻塞处理线程
+    * 文件名带帧索引，如 000120_before_clone_mask.jpg，多个线程不会互相覆盖
+"""
+
+import os
+import queue
+import logging
+import itertools
+import threading
+
+import cv2
+
+logger = logging.getLogger("debug_capture")
+
+DEBUG_MODES = ("off", "failures", "sample")
+
+_STOP = object()
+
+
+class DebugCapture:
+    """异步的调试图像写入器"""
+
+    def __init__(self, directory, mode="off", interval=100, max_queue=32):
+        """
+        directory: 调试图像目录
+        mode: 'off' / 'failures' / 'sample'
+        interval: sample 模式下每隔多少帧保存一次
+        max_queue: 等待写盘的图像数上限
+        """
+        if mode not in DEBUG_MODES:
+            raise ValueError(f"未知的调试采集模式: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.interval = max(1, int(interval))
+        self.saved = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._sequence = itertools.count()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def wants(self, frame_index, failure=False):
+        """该帧的中间结果是否需要保存"""
+        if self.mode == "off":
+            return False
+        if failure:
+            return True
+        if self.mode != "sample":
+            return False
+        return frame_index is None or frame_index % self.interval == 0
+
+    def save(self, frame_index, name, image, failure=False):
+        """
+        采样命中时把图像放入写盘队列，返回是否已放入
+
+        frame_index 未知时使用递增序号命名
+        """
+        if image is None or not self.wants(frame_index, failure):
+            return False
+        if frame_index is None:
+            prefix = f"n{next(self._sequence):06d}"
+        else:
+            prefix = f"{frame_index:06d}"
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((os.path.join(self.directory, f"{prefix}_{name}.jpg"), image.copy()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._writer_loop, name="debug-capture", daemon=True)
+                self._thread.start()
+
+    def _writer_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            path, image = item
+            try:
+                if cv2.imwrite(path, image):
+                    self.saved += 1
+                else:
+                    logger.warning(f"无法写入调试图像: {path}")
+            except Exception as e:
+                logger.warning(f"写入调试图像 {path} 时出错: {e}")
+
+    def close(self):
+        """等待队列中的图像写完并停止后台线程"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+        if self.saved or self.dropped:
+            logger.info(f"调试图像: 已保存{self.saved}张，队列满丢弃{self.dropped}张 -> {self.directory}")
@@ -0,0 +1,1683 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+无界面的换脸引擎 - 模型管理、逐帧换脸和视频任务
+
+Tk界面、Qt界面、命令行、批处理和任务队列服务都通过 FaceSwapEngine 处理视频：
+    * 本模块不导入任何GUI工具包，也不导入moviepy
+    * EngineModels 在第一次使用时才加载各个模型：只用传统方法的任务不会导入
+      InsightFace和ONNX Runtime，只用inswapper的任务不会加载dlib特征点模型
+    * 同一个引擎的任务副本(clone_for_job)共享同一份 EngineModels
+    * 选项是普通属性，界面可以设置为Tkinter变量，统一通过 get_option 读取
+    * 任务队列服务运行时，process_video_via_server 把任务交给服务处理，本进程不加载模型
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+import importlib.util
+import multiprocessing
+import concurrent.futures
+
+# 设置环境变量，解决OpenMP冲突问题
+os.environ.setdefault('KMP_DUPLICATE_LIB_OK', 'TRUE')
+
+import cv2
+import numpy as np
+
+from source_face_cache import SourceFaceCache
+from face_analysers import TargetAnalyserPool, DEFAULT_DET_SIZE, read_probe_frames, parse_det_size
+from face_tracker import KeyframeFaceTracker
+from frame_process_pool import FrameProcessPool
+from batched_swapper import BatchedInswapper
+from video_pipeline import VideoPipeline, PipelineStage, FrameItem, ProcessingCancelled
+from progress_reporter import ProgressReporter, LoggingSink
+from video_encoder import open_video_writer
+from face_mesh import SourceFaceMesh
+from debug_capture import DebugCapture
+from face_landmarks import LandmarkExtractor, shape_to_array
+from scaled_detection import ScaledFaceDetector
+from frame_gate import FrameSimilarityGate, assign_reference, shared_detection
+import job_client
+from segmented_video import (SegmentManifest, plan_segments, probe_keyframes, file_identity,
+                             concat_segments)
+from color_correction import (ReferenceStatsCache, mask_roi, pad_roi, hull_roi_mask, feather_mask, blend_into,
+                              masked_mean_std, transfer_stats, paste_masked)
+
+logger = logging.getLogger("engine")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 影响输出画面的选项，分段处理时写入清单签名
+SEGMENT_SIGNATURE_OPTIONS = (
+    'swapper_var', 'swap_method_var', 'detector_var', 'multi_scale_var', 'color_correction_var',
+    'smoothing_var', 'face_tracking_var', 'keyframe_interval', 'frame_gate_var', 'static_frame_threshold',
+    'scene_cut_threshold', 'max_reused_frames', 'detection_max_side', 'detection_min_face',
+    'warp_cache_tolerance', 'det_size', 'video_encoder', 'encoder_codec', 'encoder_crf', 'encoder_preset',
+)
+
+# 不影响输出画面、但需要传给分段工作进程的选项
+SEGMENT_WORKER_OPTIONS = (
+    'swap_batch_size', 'stage_workers', 'pipeline_queue_size', 'reorder_buffer_mb', 'encoder_threads',
+    'debug_capture_mode', 'debug_capture_interval',
+)
+
+# 其余处理选项，复制应用实例时与上面两组一起取当前值
+JOB_OPTIONS = (
+    'process_pool_var', 'process_workers', 'keep_audio', 'segment_seconds', 'segment_workers', 'keep_segments',
+    'pipeline_threads',
+)
+
+
+def load_dlib():
+    """导入dlib，只有传统方法需要"""
+    import dlib
+    return dlib
+
+
+def insightface_available():
+    """是否安装了InsightFace和ONNX Runtime，只检查不导入"""
+    return all(importlib.util.find_spec(name) is not None for name in ("insightface", "onnxruntime"))
+
+
+def load_insightface():
+    """导入InsightFace，未安装时返回None；ONNX Runtime只检查是否安装，由InsightFace加载模型时导入"""
+    try:
+        if importlib.util.find_spec("onnxruntime") is None:
+            raise ImportError("No module named 'onnxruntime'")
+        import insightface
+    except ImportError as e:
+        logger.warning(f"InsightFace模块不可用，请安装: pip install insightface onnx onnxruntime ({e})")
+        return None
+    try:
+        from ignore_ssl_warnings import patch_insightface_download
+        # 修补insightface下载功能
+        patch_insightface_download()
+    except ImportError:
+        logger.warning("无法导入ignore_ssl_warnings模块")
+    return insightface
+
+
+class EngineModels:
+    """
+    按需加载的模型集合，同一个引擎及其任务副本共享一份
+
+    每个模型在第一次访问时加载并缓存，加载失败(文件不存在等)时缓存为None，
+    可以在多个线程中同时访问
+    """
+
+    def __init__(self, models_folder, predictor_path=None, cascade_path=None, inswapper_path=None):
+        self.models_folder = models_folder
+        self.cascade_path = cascade_path or os.path.join(models_folder, "haarcascade_frontalface_default.xml")
+        self.predictor_path = predictor_path or os.path.join(models_folder, "shape_predictor_68_face_landmarks.dat")
+        self.inswapper_path = inswapper_path or os.path.join(models_folder, "inswapper_128.onnx")
+        self._models = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name, loader):
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = loader()
+            return self._models[name]
+
+    def loaded(self):
+        """已经加载成功的模型名称"""
+        with self._lock:
+            return sorted(name for name, model in self._models.items() if model is not None)
+
+    @property
+    def detector(self):
+        return self._get('detector', lambda: load_dlib().get_frontal_face_detector())
+
+    @property
+    def predictor(self):
+        return self._get('predictor', self._load_predictor)
+
+    @property
+    def face_cascade(self):
+        return self._get('face_cascade', self._load_cascade)
+
+    @property
+    def face_analyser(self):
+        return self._get('face_analyser', self._load_face_analyser)
+
+    @property
+    def inswapper(self):
+        return self._get('inswapper', self._load_inswapper)
+
+    @property
+    def target_analysers(self):
+        # 目标帧只需要检测框和关键点，使用共享检测模型的纯检测分析器
+        return self._get('target_analysers', lambda: TargetAnalyserPool(self.face_analyser))
+
+    @property
+    def batch_swapper(self):
+        # 视频换脸时把一个帧窗口内的所有人脸合并成批次推理
+        return self._get('batch_swapper',
+                         lambda: BatchedInswapper(self.inswapper) if self.inswapper is not None else None)
+
+    def _load_predictor(self):
+        if not os.path.exists(self.predictor_path):
+            logger.warning(f"特征点预测模型文件不存在: {self.predictor_path}")
+            return None
+        try:
+            predictor = load_dlib().shape_predictor(self.predictor_path)
+            logger.info("成功加载特征点预测模型")
+            return predictor
+        except Exception as e:
+            logger.error(f"加载特征点预测模型失败: {e}")
+            return None
+
+    def _load_cascade(self):
+        """加载OpenCV级联分类器，模型目录中没有时从OpenCV安装目录复制"""
+        if not os.path.exists(self.cascade_path):
+            try:
+                opencv_haarcascade = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+                if os.path.exists(opencv_haarcascade):
+                    shutil.copy(opencv_haarcascade, self.cascade_path)
+                    logger.info(f"已从OpenCV复制级联分类器文件到: {self.cascade_path}")
+            except (ImportError, AttributeError, OSError) as e:
+                logger.error(f"查找OpenCV级联分类器出错: {e}")
+                logger.info("请从https://github.com/opencv/opencv/blob/master/data/haarcascades/haarcascade_frontalface_default.xml下载")
+
+        if not os.path.exists(self.cascade_path):
+            logger.warning(f"未找到级联分类器文件: {self.cascade_path}")
+            return None
+        try:
+            cascade = cv2.CascadeClassifier(self.cascade_path)
+        except Exception as e:
+            logger.error(f"初始化分类器时出错: {e}")
+            return None
+        if cascade.empty():
+            logger.warning(f"无法加载级联分类器，文件可能损坏: {self.cascade_path}")
+            return None
+        logger.info("成功加载级联分类器")
+        return cascade
+
+    def _load_face_analyser(self):
+        """加载用于检测和提取面部特征的FaceAnalysis，没有inswapper模型时不加载"""
+        if not os.path.exists(self.inswapper_path):
+            logger.warning(f"InsightFace模型文件不存在: {self.inswapper_path}")
+            return None
+        insightface = load_insightface()
+        if insightface is None:
+            return None
+
+        # 设置允许本地模型，正常方式失败(如SSL问题)时禁止下载直接加载buffalo_l目录
+        os.environ['INSIGHTFACE_ALLOW_LOCAL_MODEL'] = '1'
+        try:
+            face_analyser = insightface.app.FaceAnalysis(
+                name="buffalo_l",
+                root=self.models_folder,
+                providers=['CPUExecutionProvider'],
+                allowed_modules=['detection', 'recognition']
+            )
+            face_analyser.prepare(ctx_id=0, det_size=(DEFAULT_DET_SIZE, DEFAULT_DET_SIZE))
+            return face_analyser
+        except Exception as e:
+            logger.warning(f"使用正常方式初始化face_analyser失败: {e}")
+
+        buffalo_dir = os.path.join(self.models_folder, 'buffalo_l')
+        if not os.path.exists(buffalo_dir):
+            logger.error(f"buffalo_l目录不存在: {buffalo_dir}")
+            return None
+        try:
+            face_analyser = insightface.app.FaceAnalysis(
+                name="buffalo_l",
+                root=self.models_folder,
+                providers=['CPUExecutionProvider'],
+                allowed_modules=['detection', 'recognition'],
+                download=False  # 禁止下载
+            )
+            face_analyser.prepare(ctx_id=0, det_size=(DEFAULT_DET_SIZE, DEFAULT_DET_SIZE))
+            logger.info("成功从本地加载buffalo_l模型")
+            return face_analyser
+        except Exception as e:
+            logger.error(f"从本地加载buffalo_l模型失败: {e}")
+            return None
+
+    def _load_inswapper(self):
+        if not os.path.exists(self.inswapper_path):
+            logger.warning(f"InsightFace模型文件不存在: {self.inswapper_path}")
+            return None
+        insightface = load_insightface()
+        if insightface is None:
+            return None
+        try:
+            inswapper = insightface.model_zoo.get_model(
+                self.inswapper_path,
+                providers=['CPUExecutionProvider'],
+                download=False,
+                download_zip=False
+            )
+            logger.info(f"成功加载InsightFace模型: {self.inswapper_path}")
+            return inswapper
+        except Exception as e:
+            logger.error(f"加载InsightFace模型失败: {e}")
+            return None
+
+
+class FaceSwapEngine:
+    """无界面的换脸引擎，模型在第一次使用时加载"""
+
+    def __init__(self, models=None, base_dir=None):
+        """
+        models: 共享的 EngineModels，None时按 base_dir 下的models目录新建
+        base_dir: 项目根目录，默认为src的上一级目录
+        """
+        # 进度和状态通过限流的报告器分发给日志和各个界面
+        self.progress_reporter = ProgressReporter(sinks=[LoggingSink(logger)])
+
+        # 存储路径
+        self.video_path = ""
+        self.face_images = []
+        self.selected_face_index = -1
+        self.output_path = ""
+        self.total_frames = 0  # 最近一次处理的视频总帧数
+
+        # 设置默认文件夹路径
+        self.base_dir = base_dir or BASE_DIR
+        self.output_folder = os.path.join(self.base_dir, "output_videos")
+        self.models_folder = os.path.join(self.base_dir, "models")
+        self.logs_folder = os.path.join(self.base_dir, "logs")
+        for folder in [self.output_folder, self.models_folder, self.logs_folder]:
+            os.makedirs(folder, exist_ok=True)
+
+        # 模型按需加载，任务副本共享同一份
+        self.models = models or EngineModels(self.models_folder)
+        self.landmark_extractor = LandmarkExtractor()  # 特征点输出缓冲区按线程复用
+
+        # 源人脸缓存，避免每帧重复解码和分析同一张源图片
+        self.source_face_cache = SourceFaceCache()
+
+        # 初始化高级选项
+        self.detection_confidence = 0.5  # 人脸检测置信度阈值
+        self.multi_scale_detection = True  # 启用多尺度检测
+        self.face_tracking_var = False  # 视频中使用关键帧检测+光流跟踪代替逐帧检测
+        self.keyframe_interval = 5  # 跟踪模式下完整检测的间隔帧数
+        self.frame_gate_var = False  # 画面几乎不变的帧复用上一个参考帧的人脸检测结果
+        self.static_frame_threshold = 1.5  # 缩略图平均灰度差不超过该值视为相似帧
+        self.scene_cut_threshold = 30.0  # 缩略图平均灰度差超过该值视为镜头切换，强制重新检测
+        self.max_reused_frames = 15  # 同一参考帧最多连续复用的帧数
+        self.process_pool_var = False  # 传统方法使用多进程处理帧
+        self.process_workers = None  # 工作进程数，None表示使用全部CPU核心
+        self.detection_max_side = 960  # 传统方法在长边缩小到该像素数的帧上检测人脸，0表示使用原始分辨率
+        self.detection_min_face = 100  # 检测到人脸后自动调整缩放比例，使缩小后的人脸约为该像素数
+        self.warp_cache_tolerance = 1.0  # 特征点最大位移不超过该像素数时复用上一次的变形坐标场
+        self.swap_batch_size = 8  # inswapper批量推理的帧窗口大小，1表示逐帧推理
+        self.stage_workers = {}  # 按阶段名覆盖流水线并行线程数，如 {'detect': 2, 'swap': 1}
+        self.pipeline_queue_size = 8  # 流水线阶段之间队列的最大帧数
+        self.reorder_buffer_mb = 512  # 已解码未写出帧的内存上限(MB)
+        self.video_encoder = "auto"  # 视频写入方式: auto(有ffmpeg时用ffmpeg) / ffmpeg / opencv
+        self.encoder_codec = "libx264"  # ffmpeg视频编码器，如 libx264、libx265
+        self.encoder_crf = 20  # ffmpeg编码质量，越小质量越高
+        self.encoder_preset = "medium"  # ffmpeg编码速度预设
+        self.encoder_threads = 0  # ffmpeg编码线程数，0表示自动
+        self.keep_audio = True  # 不重新编码直接复制原视频音轨
+        self.segment_seconds = 0  # 按该秒数分段处理并记录清单，中断后可以续传，0表示不分段
+        self.keep_segments = False  # 分段处理完成后保留片段文件和清单
+        self.segment_workers = 1  # 分段处理时并行的工作进程数，每个进程加载自己的模型
+        self.pipeline_threads = None  # 每个流水线阶段的默认线程数，None表示CPU核心数
+        self.det_size = "auto"  # inswapper目标帧检测尺寸: auto(按视频前几帧选择) 或固定的像素数
+        self.debug_capture_mode = "off"  # 调试图像采集: off / failures(只保存失败帧) / sample(另外按间隔采样)
+        self.debug_capture_interval = 100  # sample模式下每隔多少帧保存一次中间结果
+        self.debug_capture = self.create_debug_capture()
+        self.color_stats_cache = ReferenceStatsCache()  # 原始帧人脸区域的颜色统计量，同一镜头内相邻帧之间复用
+        self.scaled_detector = self.create_scaled_detector()
+        self.job_metrics = {}  # 最近一次视频处理的统计信息
+        self.cancel_event = threading.Event()  # 设置后正在处理的视频在读入下一帧前中止
+
+    # 模型和模型路径都来自共享的 EngineModels，第一次访问时加载
+    detector = property(lambda self: self.models.detector)
+    predictor = property(lambda self: self.models.predictor)
+    face_cascade = property(lambda self: self.models.face_cascade)
+    face_analyser = property(lambda self: self.models.face_analyser)
+    inswapper = property(lambda self: self.models.inswapper)
+    target_analysers = property(lambda self: self.models.target_analysers)
+    target_analyser = property(lambda self: self.models.target_analysers.default)
+    batch_swapper = property(lambda self: self.models.batch_swapper)
+    cascade_path = property(lambda self: self.models.cascade_path)
+    predictor_path = property(lambda self: self.models.predictor_path)
+    inswapper_path = property(lambda self: self.models.inswapper_path)
+
+    def insightface_face_swap(self, frame, source_img=None, source_face=None, target_faces=None):
+        """使用InsightFace进行人脸替换
+        
+        source_face为缓存的源人脸Face对象；未提供时才从source_img中分析
+        target_faces为跟踪得到的目标人脸；未提供时对当前帧做完整检测
+        """
+        try:
+            # 检查人脸分析器和交换器
+            if self.face_analyser is None or self.inswapper is None:
+                return frame  # 直接返回原始帧
+            
+            # 检查输入帧是否有效
+            if frame is None or frame.size == 0:
+                return frame
+            
+            # 检测和分析人脸（InsightFace使用BGR输入）
+            input_faces = target_faces if target_faces is not None else self.target_analyser.get(frame)
+            if len(input_faces) == 0:
+                return frame  # 没有检测到人脸
+                
+            # 没有缓存的源人脸时分析源图像
+            if source_face is None:
+                if source_img is None:
+                    return frame
+                source_face = SourceFaceCache.select_face(self.face_analyser.get(source_img))
+                if source_face is None:
+                    return frame  # 源图像中没有检测到人脸
+            
+            # 替换每个检测到的人脸
+            result = frame.copy()
+            for face in input_faces:
+                # 应用人脸交换
+                result = self.inswapper.get(result, face, source_face, paste_back=True)
+            
+            # 应用颜色校正（如果启用）
+            if self.get_option('color_correction_var', False):
+                result = self.apply_face_color_correction(result, frame, input_faces)
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"InsightFace换脸过程出错: {e}", exc_info=True)
+            return frame  # 出错时返回原始帧
+    
+    def apply_face_color_correction(self, result, frame, faces, frame_index=None, feather=10):
+        """按每张人脸关键点凸包区域对换脸结果做颜色校正，只在羽化后的人脸区域内混合"""
+        result = result.copy()
+        for face in faces:
+            try:
+                # 面部区域蒙版只在凸包附近的ROI内构造，四周留出羽化的空间
+                roi, mask = hull_roi_mask(face.kps, frame.shape, pad=feather)
+                if roi is not None:
+                    self.balance_face_roi(result, frame, roi, mask, feather, frame_index)
+            except Exception as e:
+                logger.error(f"颜色平衡调整出错: {e}")
+        return result
+    
+    def adjust_color_balance(self, target_img, source_img, mask=None, blur_amount=0):
+        """
+        调整目标图像的颜色平衡以匹配源图像
+        这是一个简化版的颜色校正，适用于InsightFace处理后的结果；
+        给出掩码时只处理掩码边界框内的区域，统计量只在掩码内计算，
+        blur_amount 为掩码边缘的羽化半径(像素)
+        """
+        try:
+            if mask is None:
+                roi = (0, 0, target_img.shape[1], target_img.shape[0])
+                roi_mask = np.full(target_img.shape[:2], 255, dtype=np.uint8)
+            else:
+                roi = mask_roi(mask)
+                if roi is None:
+                    return target_img
+                roi = pad_roi(roi, blur_amount, target_img.shape)
+                x, y, w, h = roi
+                roi_mask = mask[y:y+h, x:x+w].astype(np.uint8)
+            
+            result = target_img.copy()
+            self.balance_face_roi(result, source_img, roi, roi_mask, blur_amount)
+            return result
+            
+        except Exception as e:
+            logger.error(f"颜色平衡调整出错: {e}")
+            return target_img
+    
+    def balance_face_roi(self, target_img, source_img, roi, roi_mask, feather=0, frame_index=None):
+        """在ROI内调整 target_img 的亮度分布以匹配源图像，按羽化后的掩码原地混合"""
+        x, y, w, h = roi
+        target_roi = target_img[y:y+h, x:x+w]
+        
+        # 转换为LAB色彩空间，原始帧的统计量在相邻帧之间复用
+        target_lab = cv2.cvtColor(target_roi, cv2.COLOR_BGR2LAB)
+        source_stats = self.color_stats_cache.get(('balance_face_roi', 'lab'), roi, lambda: masked_mean_std(
+            cv2.cvtColor(source_img[y:y+h, x:x+w], cv2.COLOR_BGR2LAB), roi_mask), frame_index)
+        
+        # 只调整亮度通道
+        adjusted_lab = transfer_stats(target_lab, masked_mean_std(target_lab, roi_mask), source_stats, channels=[0])
+        adjusted_img = cv2.cvtColor(np.clip(adjusted_lab, 0, 255).astype(np.uint8), cv2.COLOR_LAB2BGR)
+        
+        # alpha混合(0.7)平滑过渡，与羽化后的掩码合成一个权重图
+        alpha = feather_mask(roi_mask, feather) * 0.7
+        blend_into(target_img, roi, adjusted_img, alpha)
+    
+    def process_video(self):
+        """处理视频的主函数，应用人脸替换效果并保存结果"""
+        try:
+            # 检查是否选择了视频
+            if not self.video_path:
+                # 使用回调或UI更新状态
+                self.update_status("请先选择一个视频文件")
+                return False
+            
+            # 检查视频文件是否存在
+            if not os.path.exists(self.video_path):
+                self.update_status(f"视频文件不存在: {self.video_path}")
+                return False
+            
+            # 检查是否选择了人脸图片
+            if not self.face_images or self.selected_face_index < 0 or self.selected_face_index >= len(self.face_images):
+                self.update_status("请先选择一张人脸图片")
+                return False
+            
+            # 检查人脸图片是否存在
+            target_face_path = self.face_images[self.selected_face_index]
+            if not os.path.exists(target_face_path):
+                self.update_status(f"人脸图片不存在: {target_face_path}")
+                return False
+            
+            # 检查是否设置了输出路径
+            if not self.output_path:
+                # 根据输入文件创建一个默认输出路径
+                video_dir = os.path.dirname(self.video_path)
+                video_name = os.path.basename(self.video_path)
+                base_name, ext = os.path.splitext(video_name)
+                self.output_path = os.path.join(video_dir, f"{base_name}_face_swap{ext}")
+            
+            # 更新状态
+            self.update_status("正在处理视频...")
+            self.job_metrics = {'video_path': self.video_path, 'output_path': self.output_path}
+            
+            # 初始化日志文件
+            os.makedirs(self.logs_folder, exist_ok=True)
+            
+            # 打开视频
+            video = cv2.VideoCapture(self.video_path)
+            if not video.isOpened():
+                self.update_status(f"无法打开视频文件: {self.video_path}")
+                return False
+            
+            # 获取视频基本信息
+            width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = video.get(cv2.CAP_PROP_FPS)
+            total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+            
+            # 保存视频总帧数，供其他函数使用
+            self.total_frames = total_frames
+            
+            # 创建目录
+            os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+            
+            # 输出文件
+            output_file = self.output_path
+            
+            # 检查文件是否已存在，如果存在则添加时间戳
+            if os.path.exists(output_file):
+                base_name, ext = os.path.splitext(output_file)
+                output_file = f"{base_name}_{int(time.time())}{ext}"
+                self.output_path = output_file
+            
+            # 更新状态
+            logger.info(f"视频信息: {width}x{height}, {fps}fps, {total_frames}帧")
+            logger.info(f"输出文件: {output_file}")
+            self.update_status(f"正在处理视频: {width}x{height}, {fps}fps, {total_frames}帧")
+            
+            # 开始计时，进度按写出的帧数报告
+            self.progress_reporter.start(total_frames)
+            job_start = time.perf_counter()
+            
+            if self.get_option('segment_seconds', 0) or (self.get_option('segment_workers', 1) or 1) > 1:
+                # 分段处理: 每段单独编码并记录到清单，中断后重新运行时跳过已完成的片段
+                try:
+                    frame_count = self.process_video_segmented(video, target_face_path, fps, total_frames)
+                finally:
+                    video.release()
+            else:
+                # 帧通过管道送给ffmpeg编码并复制原视频音轨，没有ffmpeg时退回OpenCV
+                try:
+                    out = self.open_output_writer(
+                        output_file, width, height, fps,
+                        audio_source=self.video_path if self.get_option('keep_audio', True) else None)
+                except Exception:
+                    video.release()
+                    raise
+                try:
+                    frame_count = self.run_video_frames(video, out, target_face_path, (height, width, 3))
+                finally:
+                    # 释放资源
+                    video.release()
+                    out.release()
+            
+            elapsed = time.perf_counter() - job_start
+            self.job_metrics.update({
+                'frames': frame_count,
+                'elapsed': round(elapsed, 3),
+                'fps': round(frame_count / elapsed, 2) if elapsed > 0 else 0.0,
+            })
+            
+            # 更新状态
+            self.update_status("处理完成!")
+            self.progress_reporter.finish("完成")
+            
+            logger.info(f"视频处理完成: {self.output_path}")
+            return self.output_path
+            
+        except Exception as e:
+            logger.exception(f"处理视频时出错: {e}")
+            self.update_status(f"错误: {str(e)}")
+            return False
+            
+    def process_video_via_server(self, url=None, poll_interval=1.0):
+        """
+        把当前视频提交给任务队列服务处理并等待完成，返回值与 process_video 相同
+
+        进度和状态通过本引擎的进度报告器分发给界面；设置 cancel_event 时取消服务中的任务
+        """
+        if not self.video_path or not self.face_images or not (0 <= self.selected_face_index < len(self.face_images)):
+            self.update_status("请先选择视频文件和人脸图片")
+            return False
+        target_face_path = self.face_images[self.selected_face_index]
+        try:
+            job = job_client.submit_job(self.video_path, target_face_path, self.output_path or None,
+                                        job_client.job_options(self), url=url)
+        except (OSError, ValueError, RuntimeError) as e:
+            self.update_status(f"提交任务失败: {e}")
+            return False
+        
+        self.update_status(f"任务已提交到任务队列服务: {job['id']}")
+        self.progress_reporter.start()
+        last_status = None
+        
+        def on_update(job):
+            nonlocal last_status
+            if job['status'] != last_status:
+                last_status = job['status']
+                if job['status'] == job_client.QUEUED:
+                    self.update_status("任务排队中...")
+                elif job['status'] == job_client.RUNNING:
+                    self.update_status("任务队列服务正在处理视频...")
+            self.progress_reporter.set_percent(job.get('progress') or 0.0)
+        
+        try:
+            job = job_client.poll(job['id'], on_update, interval=poll_interval, url=url,
+                                  cancel_event=self.cancel_event)
+        except (OSError, ValueError, RuntimeError) as e:
+            self.update_status(f"查询任务状态失败: {e}")
+            return False
+        
+        self.job_metrics = job.get('metrics') or {}
+        if job['status'] == job_client.DONE:
+            self.output_path = job['result']
+            self.update_status("处理完成!")
+            self.progress_reporter.finish("完成")
+            return job['result']
+        if job['status'] == job_client.CANCELLED:
+            self.update_status("任务已取消")
+        else:
+            self.update_status(f"错误: {job.get('error') or '处理失败'}")
+        return False
+    
+    def open_output_writer(self, output_file, width, height, fps, audio_source=None):
+        """按编码选项创建视频写入器"""
+        return open_video_writer(
+            output_file, width, height, fps,
+            backend=self.get_option('video_encoder', "auto"),
+            codec=self.get_option('encoder_codec', "libx264"),
+            crf=self.get_option('encoder_crf', 20),
+            preset=self.get_option('encoder_preset', "medium"),
+            threads=self.get_option('encoder_threads', 0),
+            audio_source=audio_source,
+        )
+    
+    def run_video_frames(self, video, out, target_face_path, frame_shape, first_index=0, frame_limit=None,
+                         progress_offset=0):
+        """
+        用处理流水线把 video 当前位置起的帧换脸后写入 out，返回写出的帧数
+        
+        first_index: 第一帧的帧索引，分段处理时为片段的起始帧
+        frame_limit: 最多读取的帧数，None表示读到视频结尾
+        progress_offset: 报告进度时加上的已完成帧数
+        """
+        height, width = frame_shape[:2]
+        
+        # 每个处理阶段的默认并行线程数，多个片段进程并行时由 pipeline_threads 分摊CPU核心
+        max_workers = self.get_option('pipeline_threads', None) or os.cpu_count() or 4  # 如果无法获取CPU核心数，则默认使用4个线程
+        
+        # 如果使用InsightFace，由于GPU内存限制，减少工作线程数量
+        if self.get_option('swapper_var') == "inswapper" and self.inswapper is not None:
+            # GPU模式下最多使用2个换脸线程，否则模型会占用大量显存
+            max_workers = min(2, max_workers)
+            logger.info(f"使用InsightFace，限制工作线程数为: {max_workers}")
+        
+        # 调试图像由后台线程写盘，处理结束时等待写完
+        self.debug_capture = self.create_debug_capture()
+        self.color_stats_cache.clear()
+        self.scaled_detector = self.create_scaled_detector()
+        
+        # 解码 → 检测 → 换脸 → 融合 → 编码，各阶段通过有界队列连接
+        stages, tracker, frame_pool, gate = self.create_video_stages(target_face_path, frame_shape, max_workers)
+        
+        def read_frames():
+            index = first_index
+            end = None if frame_limit is None else first_index + frame_limit
+            while end is None or index < end:
+                if self.cancel_event.is_set():
+                    raise ProcessingCancelled("任务已取消")
+                ret, frame = video.read()
+                if not ret:
+                    break
+                yield FrameItem(index, frame)
+                index += 1
+        
+        # 相似帧门控在解码线程中按顺序为每一帧指定参考帧，镜头切换时丢弃缓存的颜色统计量
+        frames = read_frames() if gate is None else assign_reference(
+            gate, read_frames(), on_scene_cut=self.color_stats_cache.scene_cut)
+        
+        # 编码阶段在单独的线程中按帧索引顺序写出，处理失败的帧已替换为原始帧
+        frame_count = 0
+        
+        def write_frame(index, frame):
+            nonlocal frame_count
+            try:
+                out.write(frame)
+            except Exception as e:
+                logger.error(f"写入帧 {index} 时出错: {e}")
+            
+            # 更新进度，报告器负责限流
+            frame_count += 1
+            self.progress_reporter.update(progress_offset + frame_count)
+            
+            # 每500帧记录一次各阶段状态
+            if frame_count % 500 == 0:
+                logger.info(f"流水线状态: {pipeline.format_stats()}")
+        
+        # 重排缓冲区按内存上限换算成帧数，某一帧很慢时解码端会等待
+        frame_bytes = width * height * 3
+        reorder_capacity = int(self.get_option('reorder_buffer_mb', 512) * 1024 * 1024 // max(1, frame_bytes))
+        pipeline = VideoPipeline(frames, stages, write_frame, reorder_capacity=reorder_capacity,
+                                 start_index=first_index)
+        try:
+            pipeline.run()
+        finally:
+            if frame_pool is not None:
+                frame_pool.close()
+            self.debug_capture.close()
+        
+        if tracker is not None:
+            logger.info(f"人脸跟踪统计: 关键帧 {tracker.keyframes}, 跟踪帧 {tracker.tracked_frames}")
+            self.job_metrics['tracker'] = {'keyframes': tracker.keyframes, 'tracked_frames': tracker.tracked_frames}
+        if gate is not None:
+            logger.info(f"相似帧门控统计: {gate.stats()}")
+            self.job_metrics['frame_gate'] = gate.stats()
+        self.job_metrics['stages'] = pipeline.stats()
+        logger.info(f"流水线状态: {pipeline.format_stats()}")
+        return frame_count
+    
+    def segment_signature(self, target_face_path, segment_seconds):
+        """分段清单的签名: 输入文件和影响输出的处理选项，任何一项变化都不能沿用已完成的片段"""
+        return {
+            'video': file_identity(self.video_path),
+            'face': file_identity(target_face_path),
+            'segment_seconds': segment_seconds,
+            'options': {name: self.get_option(name) for name in SEGMENT_SIGNATURE_OPTIONS},
+        }
+    
+    def process_video_segmented(self, video, target_face_path, fps, total_frames):
+        """
+        分段处理视频，返回输出视频的总帧数
+        
+        片段和清单保存在输出文件旁的 <输出文件名>.parts 目录中，全部片段完成后
+        拼接为输出文件；输入和选项不变时重新运行会跳过已完成的片段
+        """
+        work_dir = os.path.splitext(self.output_path)[0] + ".parts"
+        segment_seconds = float(self.get_option('segment_seconds', 0))
+        workers = int(self.get_option('segment_workers', 1) or 1)
+        if not segment_seconds:
+            # 只设置了并行进程数时按进程数把视频均分为同样多的片段
+            segment_seconds = total_frames / (fps or 25) / workers if total_frames > 0 else 0
+        
+        # 分段边界对齐到关键帧，定位片段起点时不需要从更早的关键帧解码
+        keyframes = probe_keyframes(self.video_path, fps)
+        segments = plan_segments(total_frames, fps, segment_seconds, keyframes)
+        manifest = SegmentManifest.open(work_dir, self.segment_signature(target_face_path, segment_seconds), segments)
+        pending = manifest.pending()
+        logger.info(f"分段处理: 共 {len(manifest.segments)} 个片段, 待处理 {len(pending)} 个, 工作目录: {work_dir}")
+        
+        workers = min(workers, len(pending))
+        if workers > 1:
+            self.run_segments_parallel(manifest, pending, target_face_path, workers)
+        for segment in manifest.pending():
+            # 单进程依次处理；并行处理时只剩下工作进程失败后未完成的片段
+            self.update_status(f"正在处理片段 {segment['index'] + 1}/{len(manifest.segments)}")
+            try:
+                frames, elapsed = self.encode_segment(
+                    video, target_face_path, segment, manifest.temp_path(segment), manifest.segment_path(segment),
+                    progress_offset=manifest.done_frames())
+            except Exception as e:
+                manifest.mark_failed(segment['index'], e)
+                raise
+            manifest.mark_done(segment['index'], frames, elapsed)
+        
+        self.update_status("正在拼接视频片段...")
+        concat_segments([manifest.segment_path(s) for s in manifest.segments], self.output_path,
+                        audio_source=self.video_path if self.get_option('keep_audio', True) else None)
+        
+        self.job_metrics['segments'] = {
+            'count': len(manifest.segments),
+            'resumed': len(manifest.segments) - len(pending),
+            'work_dir': work_dir,
+        }
+        frame_count = manifest.done_frames()
+        if not self.get_option('keep_segments', False):
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return frame_count
+    
+    def encode_segment(self, video, target_face_path, segment, temp_path, final_path, progress_offset=0):
+        """
+        处理一个片段并编码为 final_path，返回 (帧数, 耗时秒数)
+        
+        片段先写入临时文件，完整写完后才替换为正式文件名；音轨在拼接时统一复制
+        """
+        width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = video.get(cv2.CAP_PROP_FPS)
+        start, end = segment['start'], segment['end']
+        video.set(cv2.CAP_PROP_POS_FRAMES, start)
+        
+        out = self.open_output_writer(temp_path, width, height, fps)
+        segment_start = time.perf_counter()
+        try:
+            frames = self.run_video_frames(
+                video, out, target_face_path, (height, width, 3), first_index=start,
+                frame_limit=None if end is None else end - start, progress_offset=progress_offset)
+        finally:
+            out.release()
+        os.replace(temp_path, final_path)
+        return frames, time.perf_counter() - segment_start
+    
+    def run_segments_parallel(self, manifest, pending, target_face_path, workers):
+        """
+        把待处理的片段分给多个工作进程，每个进程加载自己的检测和换脸模型
+        
+        每完成一个片段就写入清单；某个片段失败时记录到清单，其余片段继续处理，
+        失败的片段由调用方在主进程中重试
+        """
+        options = {name: self.get_option(name) for name in SEGMENT_SIGNATURE_OPTIONS + SEGMENT_WORKER_OPTIONS}
+        # 流水线线程和OpenCV线程按进程数分摊，避免多个进程争抢CPU核心
+        threads = max(1, (os.cpu_count() or 4) // workers)
+        options['pipeline_threads'] = threads
+        options['process_pool_var'] = False
+        
+        # 主进程只调度片段，不为选择检测尺寸加载InsightFace模型：尺寸固定时直接传给各片段，
+        # auto时每个工作进程在第一个片段探测一次，之后的片段沿用
+        det_size = None
+        if self.get_option('swapper_var') == "inswapper":
+            det_size = parse_det_size(self.get_option('det_size', "auto"))
+            if det_size == "auto":
+                det_size = None
+        
+        logger.info(f"并行处理 {len(pending)} 个片段: {workers} 个工作进程, 每个进程 {threads} 个线程")
+        self.update_status(f"正在并行处理 {len(pending)} 个片段 ({workers} 个进程)")
+        
+        # 使用spawn启动工作进程，不继承主进程中已初始化的ONNX Runtime/CUDA状态
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_segment_worker,
+            initargs=(options, threads, self.base_dir),
+        )
+        try:
+            futures = {
+                executor.submit(_run_segment, self.video_path, target_face_path, segment,
+                                manifest.temp_path(segment), manifest.segment_path(segment), det_size): segment
+                for segment in pending
+            }
+            remaining = set(futures)
+            while remaining:
+                # 取消时不再启动新的片段，正在处理的片段完成后退出
+                if self.cancel_event.is_set():
+                    raise ProcessingCancelled("任务已取消")
+                done, remaining = concurrent.futures.wait(
+                    remaining, timeout=1.0, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    segment = futures[future]
+                    try:
+                        frames, elapsed = future.result()
+                    except Exception as e:
+                        logger.error(f"片段 {segment['index']} 处理失败: {e}")
+                        manifest.mark_failed(segment['index'], e)
+                        continue
+                    manifest.mark_done(segment['index'], frames, elapsed)
+                    self.progress_reporter.update(manifest.done_frames())
+                    logger.info(f"片段 {segment['index']} 完成: {frames}帧, {elapsed:.1f}秒")
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def create_video_stages(self, target_face_path, frame_shape, max_workers):
+        """
+        创建视频流水线的处理阶段，返回 (阶段列表, 人脸跟踪器, 进程池, 相似帧门控)
+        
+        源人脸只在这里分析一次；源图像中没有人脸时返回空阶段列表，视频原样输出
+        """
+        stage_workers = self.get_option('stage_workers', None) or {}
+        queue_size = self.get_option('pipeline_queue_size', 8)
+        stages = []
+        tracker = None
+        frame_pool = None
+        gate = self.create_frame_gate()
+        
+        if self.get_option('swapper_var') == "inswapper" and self.inswapper is not None and self.face_analyser is not None:
+            source_entry = self.source_face_cache.get(target_face_path, self.face_analyser)
+            if source_entry is None:
+                raise ValueError(f"无法读取人脸图片: {target_face_path}")
+            source_face = source_entry.face
+            if source_face is None:
+                logger.warning("源图像中未检测到人脸，输出原始视频")
+                return stages, tracker, frame_pool, None
+            
+            target_analyser = self.select_target_analyser()
+            
+            # 跟踪模式下检测阶段只能有一个线程，保证按帧顺序检测/跟踪
+            if self.get_option('face_tracking_var', False):
+                tracker = KeyframeFaceTracker(keyframe_interval=self.get_option('keyframe_interval', 5))
+                logger.info(f"启用人脸跟踪，关键帧间隔: {tracker.keyframe_interval}")
+                
+                def detect(item):
+                    item.faces = shared_detection(item, lambda: tracker.update(item.frame, target_analyser.get))
+                detect_workers = 1
+            else:
+                def detect(item):
+                    item.faces = shared_detection(item, lambda: target_analyser.get(item.frame))
+                detect_workers = stage_workers.get('detect', max_workers)
+            stages.append(PipelineStage("detect", detect, workers=detect_workers, queue_size=queue_size))
+            
+            # 一批帧中的所有人脸合并成一次推理
+            def swap(items):
+                results = self.batch_swapper.swap_frames(
+                    [item.frame for item in items], [item.faces for item in items], source_face)
+                for item, result in zip(items, results):
+                    item.result = result
+            stages.append(PipelineStage("swap", swap, workers=stage_workers.get('swap', max_workers),
+                                        batch_size=self.get_option('swap_batch_size', 8), queue_size=queue_size))
+            
+            if self.get_option('color_correction_var', False):
+                def blend(item):
+                    if item.faces and item.result is not None:
+                        item.result = self.apply_face_color_correction(item.result, item.frame, item.faces, item.index)
+                stages.append(PipelineStage("blend", blend, workers=stage_workers.get('blend', max_workers),
+                                            queue_size=queue_size))
+            return stages, tracker, frame_pool, gate
+        
+        # 传统方法在一个阶段内完成检测、换脸和融合，可选使用进程池，帧通过共享内存传递
+        if self.get_option('process_pool_var', False):
+            frame_pool = self.create_traditional_pool(frame_shape)
+        if frame_pool is not None:
+            if gate is not None:
+                logger.info("进程池模式下不使用相似帧门控")
+                gate = None
+            
+            def swap(item):
+                _, item.result = frame_pool.submit(item.index, item.frame).result()
+            # 每个工作进程对应两个提交线程，保证进程始终有帧可处理
+            swap_workers = stage_workers.get('swap', frame_pool.max_workers * 2)
+        else:
+            detector_choice = self.get_option('detector_var', "dlib")
+            use_multi_scale = self.get_option('multi_scale_var', True)
+            source_entry = self.source_face_cache.get(target_face_path)
+            if source_entry is None:
+                raise ValueError(f"无法读取人脸图片: {target_face_path}")
+            
+            # 源图像的人脸特征点只计算一次
+            target_landmarks = self.get_source_landmarks(source_entry, detector_choice)
+            if target_landmarks is None:
+                logger.warning("源图像中未检测到人脸，输出原始视频")
+                return stages, tracker, frame_pool, None
+            
+            def detect_landmarks(item):
+                rgb_frame = cv2.cvtColor(item.frame, cv2.COLOR_BGR2RGB)
+                return self.detect_frame_landmarks(item.frame, rgb_frame, detector_choice, use_multi_scale, copy=True)
+            
+            def swap(item):
+                landmarks = None
+                if item.reference is not None:
+                    # 相似帧复用参考帧的特征点
+                    landmarks = shared_detection(item, lambda: detect_landmarks(item))
+                    if landmarks is None:
+                        item.result = item.frame
+                        return
+                item.result = self.process_frame_traditional(
+                    item.frame,
+                    source_entry.image,
+                    target_landmarks,
+                    detector_choice,
+                    use_multi_scale,
+                    frame_index=item.index,
+                    landmarks=landmarks
+                )
+            swap_workers = stage_workers.get('swap', max_workers)
+        stages.append(PipelineStage("swap", swap, workers=swap_workers, queue_size=queue_size))
+        return stages, tracker, frame_pool, gate
+    
+    def create_frame_gate(self):
+        """按选项创建相似帧门控，未开启时返回None"""
+        if not self.get_option('frame_gate_var', False):
+            return None
+        return FrameSimilarityGate(
+            static_threshold=self.get_option('static_frame_threshold', 1.5),
+            scene_threshold=self.get_option('scene_cut_threshold', 30.0),
+            max_reuse=self.get_option('max_reused_frames', 15),
+        )
+    
+    def select_target_analyser(self):
+        """按选项选择目标帧检测尺寸，auto时根据视频前几帧的分辨率和人脸大小选择"""
+        if 'det_size' in self.job_metrics:
+            # 分段处理时同一任务的各片段沿用第一次选择的尺寸
+            return self.target_analysers.get(self.job_metrics['det_size'])
+        det_size = parse_det_size(self.get_option('det_size', "auto"))
+        if det_size == "auto":
+            det_size, probe = self.target_analysers.choose_size(read_probe_frames(self.video_path))
+            self.job_metrics['det_probe'] = probe
+            logger.info(f"自动选择检测尺寸: {det_size}, 探测结果: {probe}")
+        if not self.target_analysers.dynamic:
+            det_size = DEFAULT_DET_SIZE
+        self.job_metrics['det_size'] = det_size
+        return self.target_analysers.get(det_size)
+    
+    def create_traditional_pool(self, frame_shape):
+        """为传统方法创建进程池，源人脸特征点在主进程中计算一次后传给工作进程"""
+        target_face_path = self.face_images[self.selected_face_index]
+        detector_choice = self.get_option('detector_var', "dlib")
+        source_entry = self.source_face_cache.get(target_face_path)
+        if source_entry is None:
+            return None
+        target_landmarks = self.get_source_landmarks(source_entry, detector_choice)
+        if target_landmarks is None:
+            logger.warning("源图片中未检测到人脸，不使用进程池")
+            return None
+        
+        options = {
+            'base_dir': self.base_dir,
+            'swap_method_var': self.get_option('swap_method_var', "advanced"),
+            'color_correction_var': self.get_option('color_correction_var', True),
+            'smoothing_var': self.get_option('smoothing_var', 50),
+            'detector_var': detector_choice,
+            'multi_scale_var': self.get_option('multi_scale_var', True),
+            'warp_cache_tolerance': self.get_option('warp_cache_tolerance', 1.0),
+            'debug_capture_mode': self.get_option('debug_capture_mode', "off"),
+            'debug_capture_interval': self.get_option('debug_capture_interval', 100),
+            'detection_max_side': self.get_option('detection_max_side', 960),
+            'detection_min_face': self.get_option('detection_min_face', 100),
+        }
+        return FrameProcessPool(
+            frame_shape,
+            create_traditional_worker,
+            (options, self.predictor_path, self.cascade_path, source_entry.image, target_landmarks),
+            max_workers=self.process_workers,
+        )
+    
+    def get_option(self, name, default=None):
+        """读取处理选项，兼容Tkinter变量和Qt界面直接设置的普通值"""
+        value = getattr(self, name, default)
+        if hasattr(value, 'get') and not isinstance(value, dict):
+            return value.get()
+        return value
+    
+    def clone_for_job(self):
+        """
+        创建与本实例共享模型的无界面引擎，可以在另一个线程中同时处理其他视频
+        
+        模型和源人脸缓存是共享的；选项在复制时取当前值，进度报告器、调试采集等
+        每个任务的状态各自独立
+        """
+        app = FaceSwapEngine(models=self.models, base_dir=self.base_dir)
+        app.source_face_cache = self.source_face_cache
+        for name in SEGMENT_SIGNATURE_OPTIONS + SEGMENT_WORKER_OPTIONS + JOB_OPTIONS:
+            if hasattr(self, name):
+                setattr(app, name, self.get_option(name))
+        app.stage_workers = dict(app.stage_workers or {})
+        app.video_path = self.video_path
+        app.face_images = list(self.face_images)
+        app.selected_face_index = self.selected_face_index
+        app.output_path = self.output_path
+        app.debug_capture = app.create_debug_capture()
+        app.scaled_detector = app.create_scaled_detector()
+        return app
+    
+    def create_debug_capture(self):
+        """按当前选项创建调试图像采集器，图像保存在 base_dir 下的debug目录"""
+        return DebugCapture(
+            os.path.join(self.base_dir, "debug"),
+            mode=self.get_option('debug_capture_mode', "off"),
+            interval=self.get_option('debug_capture_interval', 100),
+        )
+    
+    def create_scaled_detector(self):
+        """按当前选项创建缩小分辨率的人脸检测器，每个视频重新估计人脸尺寸"""
+        return ScaledFaceDetector(
+            max_side=self.get_option('detection_max_side', 960),
+            min_face=self.get_option('detection_min_face', 100),
+        )
+    
+    def process_single_frame(self, frame):
+        """
+        对单帧做人脸替换，供界面预览使用，返回处理后的帧
+
+        使用与视频处理相同的换脸方法和选项；源图片无法读取时返回None
+        """
+        target_face_path = self.face_images[self.selected_face_index]
+        if self.get_option('swapper_var') == "inswapper" and self.inswapper is not None and self.face_analyser is not None:
+            source_entry = self.source_face_cache.get(target_face_path, self.face_analyser)
+            if source_entry is None:
+                return None
+            return self.insightface_face_swap(frame, source_face=source_entry.face)
+        
+        source_entry = self.source_face_cache.get(target_face_path)
+        if source_entry is None:
+            return None
+        detector_choice = self.get_option('detector_var', "dlib")
+        target_landmarks = self.get_source_landmarks(source_entry, detector_choice)
+        if target_landmarks is None:
+            logger.warning("源图像中未检测到人脸")
+            return frame
+        return self.process_frame_traditional(
+            frame, source_entry.image, target_landmarks, detector_choice, self.get_option('multi_scale_var', True))
+    
+    def get_source_mesh(self, source_image, source_landmarks):
+        """获取源人脸的三角网格，源图像或特征点变化时重新计算"""
+        cached = getattr(self, '_source_mesh', None)
+        if cached is not None and cached.image is source_image and np.array_equal(cached.landmarks, source_landmarks):
+            return cached
+        mesh = SourceFaceMesh(source_image, source_landmarks)
+        self._source_mesh = mesh
+        return mesh
+    
+    def get_source_landmarks(self, source_entry, detector_choice):
+        """获取源人脸图片的68点特征点，结果按检测器类型缓存在源人脸条目中"""
+        if detector_choice in source_entry.landmarks:
+            return source_entry.landmarks[detector_choice]
+        
+        target_landmarks = None
+        target_rgb = cv2.cvtColor(source_entry.image, cv2.COLOR_BGR2RGB)
+        if detector_choice == "dlib":
+            target_faces = self.detector(target_rgb, 1)
+            if len(target_faces) > 0:
+                target_landmarks = self.landmark_extractor.predict(self.predictor, target_rgb, target_faces[0], copy=True)
+        elif self.face_cascade is not None:  # OpenCV检测器
+            target_gray = cv2.cvtColor(source_entry.image, cv2.COLOR_BGR2GRAY)
+            target_faces = self.face_cascade.detectMultiScale(
+                target_gray, 
+                scaleFactor=1.1, 
+                minNeighbors=5,
+                minSize=(30, 30)
+            )
+            
+            if len(target_faces) > 0:
+                x, y, w, h = target_faces[0]
+                target_face_rect = load_dlib().rectangle(int(x), int(y), int(x+w), int(y+h))
+                target_landmarks = self.landmark_extractor.predict(
+                    self.predictor, target_rgb, target_face_rect, copy=True)
+        
+        source_entry.landmarks[detector_choice] = target_landmarks
+        return target_landmarks
+    
+    def update_progress(self, value, text=None):
+        """按百分比更新进度，经报告器限流后分发给日志和界面"""
+        self.progress_reporter.set_percent(value, text)
+            
+    def update_status(self, text):
+        """更新状态文本，支持无UI模式"""
+        self.progress_reporter.status(text)
+            
+    def advanced_face_swap(self, frame, rgb_frame, landmarks, target_image, target_landmarks, frame_index=None):
+        """使用改进的方法进行人脸替换"""
+        try:
+            # 确保所有特征点都是正确的数据类型
+            landmarks = np.array(landmarks, dtype=np.int32)
+            target_landmarks = np.array(target_landmarks, dtype=np.int32)
+            
+            # 计算凸包 - 使用完整的68点凸包计算
+            hull = cv2.convexHull(landmarks)
+            
+            # 创建掩码 - 增加调试输出
+            mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+            cv2.fillConvexPoly(mask, hull, 255)
+            
+            # 调试掩码
+            mask_sum = np.sum(mask)
+            logger.debug(f"原始掩码像素和: {mask_sum}, 是否为零: {mask_sum == 0}")
+            
+            # 如果掩码全为零，尝试使用更简单的方法创建掩码
+            if mask_sum == 0:
+                logger.debug("尝试使用备选方法创建掩码")
+                mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+                x, y, w, h = cv2.boundingRect(landmarks)
+                # 使用椭圆填充而不是凸多边形
+                center = (x + w//2, y + h//2)
+                axes = (w//2, h//2)
+                cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
+                mask_sum = np.sum(mask)
+                logger.debug(f"备选掩码像素和: {mask_sum}")
+                
+                # 保存调试图像
+                self.debug_capture.save(frame_index, "face_mask_debug", mask, failure=True)
+            
+            # 三角剖分只依赖源人脸特征点的拓扑，每个源人脸只计算一次
+            rect = cv2.boundingRect(hull)
+            mesh = self.get_source_mesh(target_image, target_landmarks)
+            
+            # 如果三角形数量过少，可能是人脸检测不准确
+            if len(mesh) < 10:
+                logger.warning("三角形数量过少，可能是人脸检测不准确")
+                # 保存一个调试图像，显示特征点
+                if self.debug_capture.wants(frame_index, failure=True):
+                    debug_frame = frame.copy()
+                    for point in landmarks:
+                        cv2.circle(debug_frame, (int(point[0]), int(point[1])), 2, (0, 255, 0), -1)
+                    self.debug_capture.save(frame_index, "frame_landmarks_debug", debug_frame, failure=True)
+                
+                # 尝试使用更简单的方法进行人脸替换
+                logger.debug("尝试使用备选方法进行人脸替换")
+                return self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks, frame_index)
+            
+            # 整个人脸区域的分段仿射变形合并为一次 cv2.remap
+            field = mesh.warp_field(landmarks, frame.shape, self.get_option('warp_cache_tolerance', 1.0))
+            if field is None:
+                return frame
+            result_img = field.apply(target_image, frame)
+            
+            # 创建无缝克隆的掩码
+            center_face = (rect[0] + rect[2]//2, rect[1] + rect[3]//2)
+            
+            # 添加调试信息
+            logger.debug(f"人脸中心点: {center_face}, 图像尺寸: {frame.shape[:2]}")
+            
+            # 确保掩码和图像大小匹配
+            if mask.shape[:2] != frame.shape[:2]:
+                mask = cv2.resize(mask, (frame.shape[1], frame.shape[0]))
+            
+            # 确保中心点在图像内部
+            if 0 <= center_face[0] < frame.shape[1] and 0 <= center_face[1] < frame.shape[0]:
+                try:
+                    # 确保掩码和图像大小完全匹配
+                    if mask.shape[:2] != frame.shape[:2]:
+                        mask = cv2.resize(mask, (frame.shape[1], frame.shape[0]))
+                    
+                    # 检查掩码是否有效（至少有一些非零像素）
+                    mask_sum = np.sum(mask)
+                    logger.debug(f"最终掩码像素和: {mask_sum}")
+                    
+                    if mask_sum > 0:
+                        # 计算掩码的边界框，确保在图像内部
+                        mask_indices = np.where(mask > 0)
+                        if len(mask_indices[0]) > 0 and len(mask_indices[1]) > 0:
+                            y_min, y_max = np.min(mask_indices[0]), np.max(mask_indices[0])
+                            x_min, x_max = np.min(mask_indices[1]), np.max(mask_indices[1])
+                            
+                            # 确保边界框完全在图像内部
+                            if (0 <= x_min < x_max < frame.shape[1] and 
+                                0 <= y_min < y_max < frame.shape[0]):
+                                # 保存无缝克隆前的掩码和图像用于调试
+                                debug = self.debug_capture
+                                debug.save(frame_index, "before_clone_mask", mask)
+                                debug.save(frame_index, "before_clone_result", result_img)
+                                debug.save(frame_index, "before_clone_frame", frame)
+                                
+                                try:
+                                    # 确保输入图像是8位无符号整数类型
+                                    result_img_8u = result_img.astype(np.uint8)
+                                    frame_8u = frame.astype(np.uint8)
+                                    mask_8u = mask.astype(np.uint8)
+                                    
+                                    # 尝试使用无缝克隆
+                                    seamless_result = cv2.seamlessClone(
+                                        result_img_8u, frame_8u, mask_8u, center_face, cv2.NORMAL_CLONE)
+                                        
+                                    # 保存无缝克隆后的图像用于调试
+                                    debug.save(frame_index, "after_clone_result", seamless_result)
+                                except Exception as e:
+                                    logger.warning(f"无缝克隆时出错: {e}")
+                                    debug.save(frame_index, "failed_clone_result", result_img, failure=True)
+                                    debug.save(frame_index, "failed_clone_mask", mask, failure=True)
+                                    # 如果无缝克隆失败，使用 Poisson 混合
+                                    try:
+                                        # 使用掩码直接混合
+                                        mask_3ch = cv2.merge([mask, mask, mask])
+                                        # 归一化掩码
+                                        mask_norm = mask_3ch.astype(float) / 255.0
+                                        
+                                        # 确保数据类型一致
+                                        result_img_float = result_img.astype(np.float32)
+                                        frame_float = frame.astype(np.float32)
+                                        
+                                        # 直接混合
+                                        seamless_result = (result_img_float * mask_norm + 
+                                                          frame_float * (1 - mask_norm)).astype(np.uint8)
+                                    except Exception as e2:
+                                        logger.warning(f"Poisson混合时出错: {e2}")
+                                        seamless_result = result_img.astype(np.uint8)
+                            else:
+                                logger.debug("掩码边界框超出图像范围，跳过无缝克隆")
+                                seamless_result = result_img.astype(np.uint8)
+                        else:
+                            logger.debug("掩码中没有有效像素，跳过无缝克隆")
+                            seamless_result = result_img.astype(np.uint8)
+                    else:
+                        logger.debug("掩码全为零，跳过无缝克隆")
+                        seamless_result = result_img.astype(np.uint8)
+                except Exception as e:
+                    logger.error(f"无缝克隆时出错: {e}", exc_info=True)
+                    seamless_result = result_img.astype(np.uint8)
+            else:
+                logger.debug(f"中心点 {center_face} 超出图像范围 {frame.shape[:2]}，跳过无缝克隆")
+                seamless_result = result_img.astype(np.uint8)
+            
+            # 按平滑度设置羽化人脸边缘
+            seamless_result = self.smooth_face_edge(seamless_result, frame, mask)
+            
+            # 如果启用了颜色校正
+            if self.get_option('color_correction_var', True):
+                try:
+                    # 获取面部区域的掩码
+                    face_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+                    cv2.fillConvexPoly(face_mask, hull, 255)
+                    
+                    # 应用颜色校正
+                    seamless_result = self.color_correct(seamless_result, frame, face_mask, frame_index)
+                    # 确保颜色校正后的图像是8位无符号整数类型
+                    seamless_result = seamless_result.astype(np.uint8)
+                except Exception as e:
+                    logger.warning(f"颜色校正时出错: {e}")
+                    # 如果颜色校正失败，继续使用未校正的结果
+                    seamless_result = seamless_result.astype(np.uint8)
+            
+            # 增强替换效果 - 增加对比度
+            try:
+                x, y, w, h = cv2.boundingRect(landmarks)
+                face_area = seamless_result[y:y+h, x:x+w].copy()
+                # 应用对比度增强
+                enhanced_face = cv2.addWeighted(face_area, 1.2, face_area, 0, 5)
+                seamless_result[y:y+h, x:x+w] = enhanced_face
+            except Exception as e:
+                logger.warning(f"增强对比度时出错: {e}")
+            
+            # 与原始帧进行对比，确保结果有差异
+            seamless_result = seamless_result.astype(np.uint8)
+            frame_8u = frame.astype(np.uint8)
+            diff = cv2.absdiff(seamless_result, frame_8u)
+            diff_mean = np.mean(diff)
+            
+            if diff_mean < 5:  # 如果差异很小，可能是替换失败
+                logger.warning(f"处理前后图像差异很小 ({diff_mean})，可能替换失败")
+                # 尝试使用简化方法
+                return self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks, frame_index)
+            
+            # 确保返回值不是原始帧的副本
+            if np.array_equal(seamless_result, frame):
+                logger.warning("结果与原始帧相同，尝试使用简化替换方法")
+                return self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks, frame_index)
+            
+            # 最终确保返回的是8位无符号整数类型
+            return seamless_result.astype(np.uint8)
+        except Exception as e:
+            logger.error(f"人脸替换过程中出错: {e}", exc_info=True)
+            return self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks, frame_index)  # 出错时使用简化方法
+    
+    def simple_face_swap(self, frame, rgb_frame, landmarks, target_image, target_landmarks, frame_index=None):
+        """
+        简化的人脸替换方法，使用基本的图像处理技术
+        当高级三角剖分方法失败时作为备选方案
+        """
+        try:
+            # 获取源人脸和目标人脸的边界框
+            src_face_rect = cv2.boundingRect(landmarks)
+            target_face_rect = cv2.boundingRect(target_landmarks)
+            
+            x, y, w, h = src_face_rect
+            x2, y2, w2, h2 = target_face_rect
+            
+            logger.debug(f"简化替换：源人脸位置 ({x},{y},{w},{h}), 目标人脸位置 ({x2},{y2},{w2},{h2})")
+            
+            # 保存原始帧的副本
+            orig_frame = frame.copy()
+            
+            # 提取源人脸和目标人脸
+            src_face = frame[y:y+h, x:x+w]
+            target_face = target_image[y2:y2+h2, x2:x2+w2]
+            
+            # 调整目标人脸大小以匹配源人脸
+            target_face_resized = cv2.resize(target_face, (w, h))
+            
+            # 创建人脸掩码 - 使用椭圆形状
+            face_mask = np.zeros((h, w), dtype=np.uint8)
+            center = (w // 2, h // 2)
+            # 稍微缩小椭圆以避免包含背景
+            axes = (int(w * 0.45), int(h * 0.55))
+            cv2.ellipse(face_mask, center, axes, 0, 0, 360, 255, -1)
+            
+            # 应用高斯模糊使边缘平滑
+            face_mask = cv2.GaussianBlur(face_mask, (15, 15), 10)
+            
+            # 将掩码转换为3通道浮点形式
+            face_mask_3ch = cv2.merge([face_mask, face_mask, face_mask])
+            face_mask_3ch = face_mask_3ch.astype(float) / 255.0
+            
+            # 确保src_face与target_face_resized的数据类型一致
+            src_face = src_face.astype(np.float32)
+            target_face_resized = target_face_resized.astype(np.float32)
+            
+            # 基于掩码融合两个人脸
+            blended_face = (target_face_resized * face_mask_3ch + 
+                           src_face * (1 - face_mask_3ch))
+            blended_face = blended_face.astype(np.uint8)
+            
+            # 创建输出图像
+            result = frame.copy()
+            result[y:y+h, x:x+w] = blended_face
+            
+            # 应用颜色校正
+            if self.get_option('color_correction_var', True):
+                try:
+                    # 创建全局掩码
+                    global_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+                    global_mask[y:y+h, x:x+w] = face_mask
+                    
+                    # 应用颜色校正
+                    result = self.enhanced_color_correct(result, orig_frame, global_mask, frame_index)
+                    # 确保颜色校正后的图像是8位无符号整数类型
+                    result = result.astype(np.uint8)
+                except Exception as e:
+                    logger.warning(f"颜色校正出错: {e}")
+                    # 确保结果是8位无符号整数类型
+                    result = result.astype(np.uint8)
+            
+            # 确保result和orig_frame类型一致后再比较
+            result = result.astype(np.uint8)
+            orig_frame = orig_frame.astype(np.uint8)
+            
+            # 使用整体图像的差异来验证替换是否有效
+            diff = cv2.absdiff(result, orig_frame)
+            mean_diff = np.mean(diff)
+            
+            logger.debug(f"简化替换方法的平均差异: {mean_diff}")
+            
+            # 如果差异太小，可能替换效果不明显，强化替换效果
+            if mean_diff < 5:
+                logger.debug("简化替换效果不明显，尝试直接复制人脸")
+                
+                # 直接复制目标人脸到源位置
+                # 但仍保持边缘平滑过渡
+                global_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+                cv2.ellipse(global_mask, (x + w//2, y + h//2), 
+                           (int(w * 0.45), int(h * 0.55)), 0, 0, 360, 255, -1)
+                
+                # 应用高斯模糊
+                global_mask = cv2.GaussianBlur(global_mask, (31, 31), 11)
+                
+                # 创建3通道掩码
+                mask_3ch = cv2.merge([global_mask, global_mask, global_mask])
+                mask_float = mask_3ch.astype(float) / 255.0
+                
+                # 创建包含目标人脸的图像
+                face_area = np.zeros_like(frame, dtype=np.float32)
+                face_area[y:y+h, x:x+w] = target_face_resized
+                
+                # 确保类型一致性
+                orig_frame_float = orig_frame.astype(np.float32)
+                
+                # 在全图范围内进行混合
+                result = (face_area * mask_float + 
+                         orig_frame_float * (1 - mask_float)).astype(np.uint8)
+                
+                # 加强效果 - 增加目标人脸的对比度
+                face_only = result[y:y+h, x:x+w].copy()
+                # 应用对比度增强
+                face_contrast = cv2.addWeighted(face_only, 1.2, face_only, 0, 0)
+                result[y:y+h, x:x+w] = face_contrast
+                
+                # 应用颜色校正
+                if self.get_option('color_correction_var', True):
+                    try:
+                        result = self.enhanced_color_correct(result, orig_frame, global_mask, frame_index)
+                        # 确保颜色校正后的图像是8位无符号整数类型
+                        result = result.astype(np.uint8)
+                    except Exception as e:
+                        logger.warning(f"颜色校正出错: {e}")
+                        # 确保结果是8位无符号整数类型
+                        result = result.astype(np.uint8)
+            
+            # 保存调试图像
+            debug = self.debug_capture
+            debug.save(frame_index, "simple_swap_result", result)
+            debug.save(frame_index, "simple_swap_orig", orig_frame)
+            debug.save(frame_index, "simple_swap_mask", global_mask if 'global_mask' in locals() else face_mask)
+            
+            # 最终确保返回的是8位无符号整数类型
+            return result.astype(np.uint8)
+            
+        except Exception as e:
+            logger.error(f"简化人脸替换方法失败: {e}", exc_info=True)
+            # 失败时返回原始帧，确保是8位无符号整数类型
+            return frame.astype(np.uint8)
+    
+    def smooth_face_edge(self, result, frame, mask):
+        """
+        羽化换脸结果的边缘：在掩码ROI内按羽化后的掩码把结果与原始帧混合
+
+        平滑度 smoothing_var 取0-100，每10对应1像素的羽化半径，0表示保持原来的硬边缘
+        """
+        feather = int(round(float(self.get_option('smoothing_var', 50)) / 10.0))
+        roi = mask_roi(mask) if feather > 0 else None
+        if roi is None:
+            return result
+        x, y, w, h = pad_roi(roi, feather, frame.shape)
+        alpha = feather_mask(mask[y:y+h, x:x+w], feather)
+        smoothed = result.copy()
+        smoothed[y:y+h, x:x+w] = cv2.blendLinear(result[y:y+h, x:x+w], frame[y:y+h, x:x+w], alpha, 1.0 - alpha)
+        return smoothed
+    
+    def enhanced_color_correct(self, target_img, source_img, mask, frame_index=None):
+        """增强版的颜色校正函数，逐通道匹配掩码内的均值和标准差，只处理掩码边界框内的区域"""
+        try:
+            # 确保掩码是正确的类型和大小
+            if mask.shape[:2] != target_img.shape[:2]:
+                logger.debug(f"掩码大小 {mask.shape} 与目标图像大小 {target_img.shape[:2]} 不匹配")
+                mask = cv2.resize(mask, (target_img.shape[1], target_img.shape[0]))
+            
+            # 检查掩码是否有效
+            roi = mask_roi(mask > 10)
+            if roi is None:
+                logger.debug("颜色校正: 掩码中没有前景区域")
+                return target_img.astype(np.uint8)
+            x, y, w, h = roi
+            roi_mask = mask[y:y+h, x:x+w].astype(np.uint8)
+            fg_mask = roi_mask > 10  # 将掩码转换为布尔值
+            
+            # 计算掩码内各通道的均值和标准差，原始帧的统计量在相邻帧之间复用
+            target_roi = target_img[y:y+h, x:x+w]
+            source_stats = self.color_stats_cache.get(
+                ('enhanced_color_correct', 'channels'), roi,
+                lambda: masked_mean_std(source_img[y:y+h, x:x+w], roi_mask), frame_index)
+            
+            # 标准化，然后调整到源图像的分布
+            corrected = transfer_stats(target_roi, masked_mean_std(target_roi, roi_mask), source_stats)
+            corrected = np.clip(corrected, 0, 255).astype(np.uint8)
+            
+            # 只把前景区域写回
+            return paste_masked(target_img.astype(np.uint8, copy=False), roi, corrected, fg_mask)
+        except Exception as e:
+            logger.error(f"增强颜色校正时出错: {e}", exc_info=True)
+            return target_img.astype(np.uint8)  # 如果出错，返回原始图像
+
+    def shape_to_np(self, shape):
+        """将dlib的shape转换为numpy数组"""
+        return shape_to_array(shape)
+
+    def color_correct(self, target_img, source_img, mask, frame_index=None):
+        """对目标图像进行颜色校正，使其与源图像的颜色匹配，只处理掩码边界框内的区域"""
+        try:
+            # 确保掩码是正确的类型和大小
+            if mask.shape[:2] != target_img.shape[:2]:
+                logger.debug(f"掩码大小 {mask.shape} 与目标图像大小 {target_img.shape[:2]} 不匹配")
+                # 调整掩码大小以匹配目标图像
+                mask = cv2.resize(mask, (target_img.shape[1], target_img.shape[0]))
+            
+            # 确保掩码是 CV_8U 类型
+            mask = mask.astype(np.uint8)
+            roi = mask_roi(mask)
+            if roi is None:
+                return target_img.astype(np.uint8)
+            x, y, w, h = roi
+            roi_mask = mask[y:y+h, x:x+w]
+            
+            # 只转换边界框内的区域，原始帧的统计量在相邻帧之间复用
+            target_lab = cv2.cvtColor(target_img[y:y+h, x:x+w], cv2.COLOR_BGR2LAB)
+            source_stats = self.color_stats_cache.get(('color_correct', 'lab'), roi, lambda: masked_mean_std(
+                cv2.cvtColor(source_img[y:y+h, x:x+w], cv2.COLOR_BGR2LAB), roi_mask), frame_index)
+            
+            # 调整目标图像的亮度和颜色
+            adjusted = transfer_stats(target_lab, masked_mean_std(target_lab, roi_mask), source_stats)
+            target_corrected = cv2.cvtColor(np.clip(adjusted, 0, 255).astype(np.uint8), cv2.COLOR_LAB2BGR)
+            
+            # 使用掩码应用颜色校正
+            return paste_masked(target_img.astype(np.uint8, copy=False), roi, target_corrected, roi_mask > 0)
+        except Exception as e:
+            logger.error(f"颜色校正时出错: {e}", exc_info=True)
+            return target_img.astype(np.uint8)  # 如果出错，返回原始图像
+
+    def detect_frame_landmarks(self, frame, rgb_frame, detector_choice, use_multi_scale, copy=False):
+        """
+        检测帧中第一张人脸的68点特征点，没有人脸或提取失败时返回None
+        
+        copy=False时返回特征点提取器的线程缓冲区，同一线程下一次检测时会被覆盖
+        """
+        if detector_choice == "dlib":
+            # 使用dlib人脸检测器
+            # 在缩小的帧上检测，人脸框映射回原始分辨率
+            upsample = 1 if use_multi_scale else 0
+            faces = self.scaled_detector.detect_dlib(self.detector, rgb_frame, upsample)
+            
+            if len(faces) == 0:
+                return None
+            
+            # 从第一个检测到的人脸获取特征点，特征点在原始分辨率上预测
+            try:
+                return self.landmark_extractor.predict(self.predictor, rgb_frame, load_dlib().rectangle(*faces[0]), copy=copy)
+            except Exception as lm_e:
+                logger.error(f"dlib提取特征点失败: {lm_e}")
+                return None
+        else:
+            # 使用OpenCV人脸检测器
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = self.scaled_detector.detect_cascade(self.face_cascade, gray, 1.3, 5)
+            
+            if len(faces) == 0:
+                return None
+            
+            # 从第一个检测到的人脸获取特征点
+            try:
+                # 首先尝试使用dlib特征点检测
+                rect = load_dlib().rectangle(*faces[0])
+                return self.landmark_extractor.predict(self.predictor, rgb_frame, rect, copy=copy)
+            except Exception as cv_lm_e:
+                logger.error(f"OpenCV+dlib提取特征点失败: {cv_lm_e}")
+                return None
+    
+    def process_frame_traditional(self, frame, target_image, target_landmarks, detector_choice, use_multi_scale,
+                                  frame_index=None, landmarks=None):
+        """使用传统方法处理单个视频帧，target_image 为BGR源图像，给出landmarks时跳过人脸检测"""
+        try:
+            # 转换帧到RGB格式以供处理
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            
+            # 检测人脸
+            if landmarks is None:
+                landmarks = self.detect_frame_landmarks(frame, rgb_frame, detector_choice, use_multi_scale)
+                if landmarks is None:
+                    # 如果未检测到人脸，返回原始帧
+                    return frame
+            
+            # 如果未找到有效的特征点，返回原始帧
+            if len(landmarks) == 0:
+                logger.warning("未能提取有效的面部特征点")
+                return frame
+            
+            # 选择换脸方法 - 高级或简单
+            try:
+                if self.get_option('swap_method_var', "advanced") == "advanced":
+                    result = self.advanced_face_swap(
+                        frame, rgb_frame, landmarks, target_image, target_landmarks, frame_index)
+                else:
+                    result = self.simple_face_swap(
+                        frame, rgb_frame, landmarks, target_image, target_landmarks, frame_index)
+                
+                # 应用颜色校正
+                if self.get_option('color_correction_var', True):
+                    # 创建基于特征点的掩码
+                    mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+                    hull = cv2.convexHull(landmarks)
+                    cv2.fillConvexPoly(mask, hull, 255)
+                    
+                    # 确保掩码有效
+                    if np.sum(mask) > 0:
+                        result = self.color_correct(result, frame, mask, frame_index)
+                
+                return result
+            except Exception as swap_e:
+                logger.error(f"执行人脸替换时出错: {swap_e}", exc_info=True)
+                return frame
+                
+        except Exception as e:
+            logger.error(f"传统方法处理帧时出错: {e}", exc_info=True)
+            return frame
+
+
+def create_traditional_worker(options, predictor_path, cascade_path, source_image, source_landmarks):
+    """进程池工作进程的初始化函数：加载一次dlib和级联分类器，返回逐帧处理函数"""
+    options = dict(options)
+    models = EngineModels(os.path.dirname(predictor_path), predictor_path=predictor_path, cascade_path=cascade_path)
+    app = FaceSwapEngine(models=models, base_dir=options.pop('base_dir', None))
+    for name, value in options.items():
+        setattr(app, name, value)
+    app.debug_capture = app.create_debug_capture()
+    app.scaled_detector = app.create_scaled_detector()
+
+    def process(frame, index=None):
+        return app.process_frame_traditional(
+            frame, source_image, source_landmarks, options['detector_var'], options['multi_scale_var'],
+            frame_index=index)
+
+    return process
+
+# 分段工作进程内的换脸引擎，由 _init_segment_worker 创建
+_segment_app = None
+# 工作进程第一次自动选择的检测尺寸，同一进程的后续片段沿用
+_segment_det_size = None
+
+
+def _init_segment_worker(options, threads, base_dir=None):
+    """分段工作进程初始化：创建该进程自己的引擎，模型在处理第一个片段时加载"""
+    global _segment_app
+    cv2.setNumThreads(threads)
+    _segment_app = FaceSwapEngine(base_dir=base_dir)
+    for name, value in options.items():
+        setattr(_segment_app, name, value)
+
+
+def _run_segment(video_path, face_path, segment, temp_path, final_path, det_size=None):
+    """在工作进程中处理一个片段，返回 (帧数, 耗时秒数)"""
+    global _segment_det_size
+    app = _segment_app
+    app.video_path = video_path
+    app.face_images = [face_path]
+    app.selected_face_index = 0
+    det_size = det_size if det_size is not None else _segment_det_size
+    app.job_metrics = {} if det_size is None else {'det_size': det_size}
+
+    video = cv2.VideoCapture(video_path)
+    if not video.isOpened():
+        raise RuntimeError(f"无法打开视频文件: {video_path}")
+    try:
+        if segment['end'] is not None:
+            app.progress_reporter.start(segment['end'] - segment['start'])
+        else:
+            app.progress_reporter.start(max(0, int(video.get(cv2.CAP_PROP_FRAME_COUNT)) - segment['start']))
+        result = app.encode_segment(video, face_path, segment, temp_path, final_path)
+    finally:
+        video.release()
+    _segment_det_size = app.job_metrics.get('det_size', _segment_det_size)
+    return result
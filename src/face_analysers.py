@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+拆分的人脸分析器 - 目标帧只做检测，源人脸才做检测+识别
+
+inswapper 换脸只需要目标人脸的检测框和5点关键点，识别特征只用于源人脸
+和身份匹配。DetectionOnlyAnalyser 复用 FaceAnalysis 已加载的检测模型，
+不会再创建新的ONNX会话，逐帧处理时省掉 ArcFace 识别推理。
+
+检测输入尺寸不再固定为640：TargetAnalyserPool 根据视频前几帧的分辨率
+和人脸大小选择尺寸，按尺寸缓存分析器。检测模型的输入形状是动态的，
+不同尺寸共用同一个ONNX会话。
+
+直接运行本模块可以对比两种分析器在同一段视频上的耗时：
+    python face_analysers.py 视频路径 [帧数]
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+
+logger = logging.getLogger("face_analysers")
+
+# FaceAnalysis.prepare 使用的检测输入尺寸，也是自动选择的上限
+DEFAULT_DET_SIZE = 640
+
+# 自动选择检测尺寸时的候选值，均为32的倍数
+DET_SIZES = (160, 320, 480, 640)
+
+
+def parse_det_size(value):
+    """
+    解析检测尺寸选项：'auto'、像素数(如 640) 或 '宽x高'(如 640x640)
+
+    检测输入是正方形且边长必须是32的倍数，返回 'auto' 或整数边长；无效时抛出ValueError
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"检测尺寸无效: {value}")
+    if isinstance(value, int):
+        size = value
+    else:
+        text = str(value).strip().lower()
+        if text == "auto":
+            return "auto"
+        parts = text.replace("*", "x").split("x")
+        if len(parts) > 2 or not all(p.strip().isdigit() for p in parts):
+            raise ValueError(f"检测尺寸应为 auto、像素数或 宽x高: {value}")
+        sides = {int(p) for p in parts}
+        if len(sides) != 1:
+            raise ValueError(f"检测尺寸必须是正方形: {value}")
+        size = sides.pop()
+    if size <= 0 or size % 32:
+        raise ValueError(f"检测尺寸必须是32的正整数倍: {value}")
+    return size
+
+
+class DetectionOnlyAnalyser:
+    """只运行检测模型的分析器，接口与 FaceAnalysis.get 相同"""
+
+    def __init__(self, face_analyser, det_size=None):
+        """det_size: 检测输入尺寸 (宽, 高)，None表示使用 prepare 时设置的尺寸"""
+        from insightface.app.common import Face
+
+        self._face_cls = Face
+        self.face_analyser = face_analyser
+        self.det_model = face_analyser.det_model
+        self.det_size = tuple(det_size) if det_size else None
+
+    def get(self, img, max_num=0):
+        """检测人脸，返回只包含 bbox/kps/det_score 的Face列表"""
+        bboxes, kpss = self.det_model.detect(img, input_size=self.det_size, max_num=max_num, metric='default')
+        if bboxes.shape[0] == 0:
+            return []
+        faces = []
+        for i in range(bboxes.shape[0]):
+            kps = kpss[i] if kpss is not None else None
+            faces.append(self._face_cls(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+        return faces
+
+
+def create_target_analyser(face_analyser):
+    """为目标帧创建检测专用分析器；分析器不可用时返回None"""
+    if face_analyser is None:
+        return None
+    if getattr(face_analyser, 'det_model', None) is None:
+        logger.warning("人脸分析器中没有检测模型，目标帧将使用完整分析")
+        return face_analyser
+    if set(getattr(face_analyser, 'models', {})) <= {'detection'}:
+        # 已经是纯检测分析器，无需包装
+        return face_analyser
+    return DetectionOnlyAnalyser(face_analyser)
+
+
+def has_dynamic_det_input(face_analyser):
+    """检测模型的ONNX输入宽高是否为动态，只有动态输入才能按视频改变检测尺寸"""
+    try:
+        shape = face_analyser.det_model.session.get_inputs()[0].shape
+        return not isinstance(shape[2], int) and not isinstance(shape[3], int)
+    except Exception:
+        return False
+
+
+def read_probe_frames(video_path, count=5, step=6):
+    """从视频开头每隔 step 帧读取一帧，最多 count 帧，用于选择检测尺寸"""
+    import cv2
+
+    frames = []
+    cap = cv2.VideoCapture(video_path)
+    try:
+        index = 0
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % step == 0:
+                frames.append(frame)
+            index += 1
+    finally:
+        cap.release()
+    return frames
+
+
+class TargetAnalyserPool:
+    """按检测输入尺寸缓存的目标帧分析器，并根据探测帧自动选择尺寸"""
+
+    def __init__(self, face_analyser, sizes=DET_SIZES, default_size=DEFAULT_DET_SIZE, min_face=40):
+        """
+        sizes: 自动选择时的候选尺寸
+        default_size: prepare 时设置的尺寸，也是自动选择的上限
+        min_face: 缩放到检测输入后人脸宽度的最小像素数
+        """
+        self.face_analyser = face_analyser
+        self.sizes = tuple(sorted(s for s in sizes if s <= default_size)) or (default_size,)
+        self.default_size = default_size
+        self.min_face = min_face
+        self.dynamic = face_analyser is not None and has_dynamic_det_input(face_analyser)
+        self.default = create_target_analyser(face_analyser)
+        self._analysers = {}
+        self._lock = threading.Lock()
+
+    def get(self, det_size=None):
+        """返回指定检测尺寸的分析器；模型输入尺寸固定时始终返回默认分析器"""
+        if det_size is None or det_size == self.default_size or not self.dynamic:
+            return self.default
+        with self._lock:
+            analyser = self._analysers.get(det_size)
+            if analyser is None:
+                analyser = DetectionOnlyAnalyser(self.face_analyser, (det_size, det_size))
+                self._analysers[det_size] = analyser
+                logger.info(f"创建检测尺寸为 {det_size} 的目标帧分析器")
+            return analyser
+
+    def choose_size(self, frames):
+        """
+        根据探测帧选择检测尺寸，返回 (尺寸, 探测信息字典)
+
+        检测尺寸不超过帧的长边(向上取整到32)，并保证最小的人脸缩放后
+        至少有 min_face 像素；探测帧中没有人脸时只按分辨率选择
+        """
+        info = {'probe_frames': len(frames), 'min_face_px': None, 'frame_side': None}
+        if not frames or self.default is None or not self.dynamic:
+            return self.default_size, info
+
+        frame_side = max(frames[0].shape[:2])
+        face_sizes = []
+        for frame in frames:
+            for face in self.default.get(frame):
+                x1, y1, x2, y2 = face.bbox[:4]
+                face_sizes.append(min(x2 - x1, y2 - y1))
+
+        # 检测输入比帧还大时只是在放大图像，没有意义
+        target = min(self.default_size, -(-frame_side // 32) * 32)
+        if face_sizes:
+            smallest = float(min(face_sizes))
+            target = min(target, self.min_face * frame_side / max(smallest, 1.0))
+            info['min_face_px'] = round(smallest, 1)
+        info['frame_side'] = frame_side
+
+        size = next((s for s in self.sizes if s >= target), self.sizes[-1])
+        return size, info
+
+
+def benchmark(analysers, frames, repeat=1):
+    """对每个分析器在给定帧上计时，返回 {名称: 每帧毫秒数}"""
+    results = {}
+    for name, analyser in analysers.items():
+        analyser.get(frames[0])  # 预热
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for frame in frames:
+                analyser.get(frame)
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed * 1000.0 / (len(frames) * repeat)
+    return results
+
+
+def main():
+    """对比完整分析和仅检测在视频前N帧上的耗时"""
+    if len(sys.argv) < 2:
+        print("使用方法: python face_analysers.py [视频文件路径] [帧数(默认50)]")
+        return
+
+    import cv2
+    import insightface
+
+    logging.basicConfig(level=logging.INFO)
+    video_path = sys.argv[1]
+    num_frames = int(sys.argv[2]) if len(sys.argv) >= 3 else 50
+    models_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        print(f"无法读取视频帧: {video_path}")
+        return
+
+    os.environ['INSIGHTFACE_ALLOW_LOCAL_MODEL'] = '1'
+    face_analyser = insightface.app.FaceAnalysis(
+        name="buffalo_l",
+        root=models_folder,
+        providers=['CPUExecutionProvider'],
+        allowed_modules=['detection', 'recognition']
+    )
+    face_analyser.prepare(ctx_id=0, det_size=(DEFAULT_DET_SIZE, DEFAULT_DET_SIZE))
+
+    results = benchmark({
+        "检测+识别": face_analyser,
+        "仅检测": create_target_analyser(face_analyser),
+    }, frames)
+    for name, ms in results.items():
+        print(f"{name}: {ms:.1f} ms/帧")
+    full, det_only = results["检测+识别"], results["仅检测"]
+    if det_only > 0:
+        print(f"加速比: {full / det_only:.2f}x ({len(frames)}帧)")
+
+    pool = TargetAnalyserPool(face_analyser)
+    det_size, probe = pool.choose_size(frames[:5])
+    print(f"自动选择的检测尺寸: {det_size} ({probe})")
+    if det_size != DEFAULT_DET_SIZE:
+        ms = benchmark({"auto": pool.get(det_size)}, frames)["auto"]
+        print(f"仅检测({det_size}): {ms:.1f} ms/帧")
+
+
+if __name__ == "__main__":
+    main()
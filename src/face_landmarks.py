@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+dlib特征点提取 - 转换为NumPy数组并复用输出内存
+
+原来的 shape_to_np 对每张人脸调用68次 shape.part(i)，并逐行写入新分配的
+numpy数组，逐行赋值的开销比预测本身还大。dlib的Python接口没有把特征点
+整体导出为数组的方法，逐点读取坐标无法避免，这里把其余开销降到最低：
+    * shape_to_array 只遍历一次 shape.parts()，用 np.fromiter 直接填充int32数组，
+      不经过Python列表和逐行赋值
+    * LandmarkExtractor.predict 把结果写入每个线程各自的 (68, 2) int32缓冲区，
+      帧间复用不重新分配
+
+predict 返回的是缓冲区本身，同一线程下一次调用时会被覆盖；
+需要长期保存(例如缓存源人脸特征点)时传入 copy=True。
+"""
+
+import threading
+
+import numpy as np
+
+NUM_LANDMARKS = 68
+
+
+def _part_coords(shape):
+    for point in shape.parts():
+        yield point.x
+        yield point.y
+
+
+def shape_to_array(shape, out=None):
+    """
+    把dlib的 full_object_detection 转换为 (点数, 2) 的int32数组
+
+    out: 可选的输出数组，形状必须为 (点数, 2)、类型为int32且内存连续
+    """
+    count = shape.num_parts
+    coords = np.fromiter(_part_coords(shape), dtype=np.int32, count=count * 2).reshape(count, 2)
+    if out is None:
+        return coords
+    out[...] = coords
+    return out
+
+
+class LandmarkExtractor:
+    """带输出缓冲区复用的dlib特征点提取器，可以在多个线程中共用"""
+
+    def __init__(self, num_points=NUM_LANDMARKS):
+        self.num_points = num_points
+        self._local = threading.local()
+
+    def _buffer(self):
+        """当前线程的输出缓冲区"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = np.empty((self.num_points, 2), dtype=np.int32)
+            self._local.buffer = buffer
+        return buffer
+
+    def predict(self, predictor, image, rect, copy=False):
+        """预测单个人脸框的特征点，返回 (点数, 2) 的int32数组"""
+        result = shape_to_array(predictor(image, rect), out=self._buffer())
+        return result.copy() if copy else result
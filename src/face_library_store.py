@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+人脸库持久化特征存储 - 为人脸图片库保存检测框、5点关键点和512维识别特征
+
+存储位于人脸库目录下的 .face_store 文件夹：
+    embeddings.npy  N x 512 float32 特征矩阵，以内存映射方式读取
+    index.json      文件名 -> {mtime, size, sha1, row, bbox, kps, det_score}
+
+刷新时按文件修改时间/大小增量判断，只有内容哈希变化的图片才会重新检测和识别。
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger("face_library_store")
+
+STORE_DIRNAME = ".face_store"
+INDEX_FILENAME = "index.json"
+EMBEDDINGS_FILENAME = "embeddings.npy"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+EMBEDDING_DIM = 512
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    """计算文件内容的SHA1哈希"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class FaceLibraryStore:
+    """单个人脸库目录的持久化特征存储"""
+
+    def __init__(self, library_dir, store_dir=None):
+        self.library_dir = os.path.abspath(library_dir)
+        self.store_dir = store_dir or os.path.join(self.library_dir, STORE_DIRNAME)
+        self.index_path = os.path.join(self.store_dir, INDEX_FILENAME)
+        self.embeddings_path = os.path.join(self.store_dir, EMBEDDINGS_FILENAME)
+
+        self._lock = threading.RLock()
+        self._records = {}
+        self._embeddings = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self._load()
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+    def _load(self):
+        """读取索引并以内存映射方式打开特征矩阵"""
+        if not os.path.exists(self.index_path) or not os.path.exists(self.embeddings_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            embeddings = np.load(self.embeddings_path, mmap_mode='r')
+            if embeddings.ndim != 2 or embeddings.shape[1] != EMBEDDING_DIM:
+                raise ValueError(f"特征矩阵形状异常: {embeddings.shape}")
+            records = index.get('faces', {})
+            if any(r.get('row', -1) >= len(embeddings) for r in records.values()):
+                raise ValueError("索引与特征矩阵不一致")
+            self._records = records
+            self._embeddings = embeddings
+            logger.info(f"已加载人脸特征库: {len(self._records)} 张图片 ({self.store_dir})")
+        except Exception as e:
+            logger.warning(f"人脸特征库损坏，将重新建立: {e}")
+            self._records = {}
+            self._embeddings = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    def _save(self, embeddings):
+        """原子地写入特征矩阵和索引，然后重新建立内存映射"""
+        os.makedirs(self.store_dir, exist_ok=True)
+        # 先释放旧的内存映射，Windows下映射中的文件无法被替换
+        self._embeddings = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+        tmp_embeddings = self.embeddings_path + ".tmp"
+        with open(tmp_embeddings, 'wb') as f:
+            np.save(f, np.ascontiguousarray(embeddings, dtype=np.float32))
+        os.replace(tmp_embeddings, self.embeddings_path)
+
+        tmp_index = self.index_path + ".tmp"
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'dim': EMBEDDING_DIM, 'faces': self._records},
+                      f, ensure_ascii=False, indent=1)
+        os.replace(tmp_index, self.index_path)
+
+        self._embeddings = np.load(self.embeddings_path, mmap_mode='r')
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def _key(self, image_path):
+        return os.path.relpath(os.path.abspath(image_path), self.library_dir)
+
+    def contains(self, image_path):
+        """判断图片是否位于本人脸库中"""
+        return os.path.dirname(os.path.abspath(image_path)) == self.library_dir
+
+    def lookup(self, image_path):
+        """
+        返回图片的有效记录及其特征向量 (record, embedding)
+
+        文件的修改时间或大小与记录不符时视为失效，返回 (None, None)。
+        """
+        with self._lock:
+            record = self._records.get(self._key(image_path))
+            if record is None:
+                return None, None
+            try:
+                stat = os.stat(image_path)
+            except OSError:
+                return None, None
+            if record['mtime'] != stat.st_mtime or record['size'] != stat.st_size:
+                return None, None
+            row = record.get('row', -1)
+            if row < 0:
+                return record, None
+            return record, np.array(self._embeddings[row], dtype=np.float32)
+
+    def get_face(self, image_path):
+        """把存储的记录还原为InsightFace的Face对象，可直接作为inswapper的源人脸"""
+        record, embedding = self.lookup(image_path)
+        if record is None or embedding is None:
+            return None
+        from insightface.app.common import Face
+        return Face(bbox=np.array(record['bbox'], dtype=np.float32),
+                    kps=np.array(record['kps'], dtype=np.float32),
+                    det_score=record.get('det_score', 1.0),
+                    embedding=embedding)
+
+    def embedding_matrix(self):
+        """返回 (文件名列表, 特征矩阵)，供身份匹配使用"""
+        with self._lock:
+            names = [k for k, r in self._records.items() if r.get('row', -1) >= 0]
+            rows = [self._records[k]['row'] for k in names]
+            return names, np.asarray(self._embeddings[rows], dtype=np.float32)
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+    def list_images(self):
+        """列出人脸库目录中的所有图片"""
+        if not os.path.isdir(self.library_dir):
+            return []
+        return [os.path.join(self.library_dir, f) for f in sorted(os.listdir(self.library_dir))
+                if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+    def refresh(self, face_analyser, image_paths=None):
+        """
+        增量刷新人脸库
+
+        修改时间和大小不变的图片直接跳过；内容哈希不变的图片只更新时间戳；
+        其余图片用face_analyser重新检测和识别。已删除的图片会从索引中移除。
+        只给出部分图片时只更新这些图片，其他图片的记录保持不变。
+        返回重新分析的图片数量。
+        """
+        full = image_paths is None
+        if full:
+            image_paths = self.list_images()
+        image_paths = [p for p in image_paths if self.contains(p)]
+
+        with self._lock:
+            old_records = dict(self._records)
+
+        # 检测和识别在锁外进行，刷新期间源人脸缓存仍可以读写存储
+        updates = {}        # 文件名 -> 新记录
+        vectors = {}        # 文件名 -> 新特征向量
+        touched = {}        # 文件名 -> 内容不变、只需更新时间戳的记录
+        removed = set()
+        seen = set()
+        for path in image_paths:
+            key = self._key(path)
+            seen.add(key)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                removed.add(key)
+                continue
+            record = old_records.get(key)
+            if record is not None and record['mtime'] == stat.st_mtime and record['size'] == stat.st_size:
+                continue
+
+            if record is not None and file_sha1(path) == record.get('sha1'):
+                # 时间戳变了但内容没变时沿用旧结果
+                touched[key] = dict(record, mtime=stat.st_mtime, size=stat.st_size)
+                continue
+            if face_analyser is None:
+                removed.add(key)
+                continue
+            record, embedding = self._analyse(path, stat, face_analyser)
+            if record is None:
+                removed.add(key)
+                continue
+            updates[key] = record
+            if embedding is not None:
+                vectors[key] = embedding
+        if full:
+            removed.update(key for key in old_records if key not in seen)
+        removed &= set(old_records)
+        if not updates and not touched and not removed:
+            return 0
+
+        # 只在合并结果时持锁，以当前记录为基础，刷新期间 update 写入的结果不会丢失
+        with self._lock:
+            records = dict(self._records)
+            for key in removed:
+                records.pop(key, None)
+            for key, record in touched.items():
+                current = records.get(key)
+                if current is not None and current.get('sha1') == record.get('sha1'):
+                    records[key] = dict(current, mtime=record['mtime'], size=record['size'])
+            records.update(updates)
+            self._commit(records, vectors)
+            logger.info(f"人脸特征库已更新: 共{len(records)}张图片，重新分析{len(updates)}张")
+        return len(updates)
+
+    def update(self, image_path, face):
+        """写入单张图片的分析结果（源人脸缓存未命中时调用）"""
+        if not self.contains(image_path) or getattr(face, 'embedding', None) is None:
+            return
+        stat = os.stat(image_path)
+        key = self._key(image_path)
+        record = self._make_record(image_path, stat, face, 0)
+        with self._lock:
+            records = dict(self._records)
+            records[key] = record
+            self._commit(records, {key: face.embedding})
+
+    def _commit(self, records, vectors):
+        """
+        按记录重新排列特征矩阵并保存，需要持有锁
+
+        vectors中的图片使用新的特征向量，其余图片沿用当前矩阵中的行；
+        不再被引用的行在这里丢弃，矩阵不会因为重新分析而增长
+        """
+        rows = []
+        compacted = {}
+        for key, record in records.items():
+            if key in vectors:
+                embedding = vectors[key]
+            elif record.get('row', -1) >= 0:
+                embedding = self._embeddings[record['row']]
+            else:
+                embedding = None
+            if embedding is None:
+                compacted[key] = dict(record, row=-1)
+            else:
+                compacted[key] = dict(record, row=len(rows))
+                rows.append(np.array(embedding, dtype=np.float32))
+        matrix = np.stack(rows) if rows else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        del rows
+        self._records = compacted
+        self._save(matrix)
+
+    def _analyse(self, path, stat, face_analyser):
+        """对单张图片做检测和识别，返回 (record, embedding)"""
+        import cv2
+        from source_face_cache import SourceFaceCache
+
+        image = cv2.imread(path)
+        if image is None:
+            logger.warning(f"无法读取人脸图片: {path}")
+            return None, None
+        try:
+            face = SourceFaceCache.select_face(face_analyser.get(image))
+        except Exception as e:
+            logger.error(f"分析人脸图片时出错: {path} ({e})")
+            return None, None
+
+        if face is None or getattr(face, 'embedding', None) is None:
+            # 记录未检测到人脸的图片，避免下次启动重复检测
+            return self._make_record(path, stat, None, -1), None
+        return self._make_record(path, stat, face, 0), face.embedding
+
+    @staticmethod
+    def _make_record(path, stat, face, row):
+        record = {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'sha1': file_sha1(path),
+            'row': row,
+        }
+        if face is not None:
+            record['bbox'] = [float(v) for v in face.bbox]
+            record['kps'] = [[float(x), float(y)] for x, y in face.kps]
+            record['det_score'] = float(getattr(face, 'det_score', 1.0))
+        return record
+
+
+# 已注册的人脸库，按目录共享同一个存储实例
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_library_store(library_dir):
+    """获取（必要时创建）人脸库目录对应的特征存储"""
+    library_dir = os.path.abspath(library_dir)
+    with _stores_lock:
+        store = _stores.get(library_dir)
+        if store is None:
+            store = FaceLibraryStore(library_dir)
+            _stores[library_dir] = store
+        return store
+
+
+def find_library_store(image_path):
+    """返回包含该图片的已注册人脸库存储，不在任何人脸库中时返回None"""
+    with _stores_lock:
+        return _stores.get(os.path.dirname(os.path.abspath(image_path)))
+
+
+def refresh_library_async(library_dir, get_face_analyser, image_paths=None):
+    """
+    在后台线程中增量刷新人脸库，避免阻塞界面启动
+
+    get_face_analyser 是返回分析器的无参函数，在后台线程中才调用，
+    引擎的模型按需加载，界面线程不会因此等待模型加载
+    """
+    store = get_library_store(library_dir)
+
+    def _run():
+        try:
+            store.refresh(get_face_analyser(), image_paths)
+        except Exception as e:
+            logger.error(f"刷新人脸特征库失败: {e}")
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    return store
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+源人脸三角网格 - 传统换脸方法的德劳内三角剖分只计算一次
+
+68点特征点的拓扑是固定的，三角形索引列表可以由源人脸特征点计算一次后
+用于所有视频帧。逐帧的分段仿射变形不再逐个三角形 warpAffine，而是：
+    * 把帧中的三角形栅格化成人脸区域内的三角形编号图
+    * 批量求出所有三角形从帧到源图像的逆仿射矩阵
+    * 按编号查表，一次向量化计算得到整个人脸区域的 cv2.remap 坐标场
+最后只需一次 cv2.remap。帧间特征点移动很小时直接复用缓存的坐标场。
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("face_mesh")
+
+
+def delaunay_triangles(points):
+    """计算点集的德劳内三角剖分，返回 (T, 3) 的点索引数组"""
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    x, y, w, h = cv2.boundingRect(points)
+    subdiv = cv2.Subdiv2D((x - 1, y - 1, w + 2, h + 2))
+
+    # 三角形顶点坐标与插入的坐标完全一致，用字典直接查回索引
+    index = {}
+    for i, (px, py) in enumerate(points):
+        key = (float(px), float(py))
+        if key in index:
+            continue
+        index[key] = i
+        subdiv.insert(key)
+
+    triangles = []
+    for t in subdiv.getTriangleList():
+        ids = [index.get((float(t[0]), float(t[1]))),
+               index.get((float(t[2]), float(t[3]))),
+               index.get((float(t[4]), float(t[5])))]
+        if None not in ids:
+            triangles.append(ids)
+    return np.array(triangles, dtype=np.int32).reshape(-1, 3)
+
+
+def triangle_rects(tri_points):
+    """批量计算三角形的边界矩形，与 cv2.boundingRect 对整数点的结果一致，返回 (T, 4)"""
+    mins = tri_points.min(axis=1)
+    maxs = tri_points.max(axis=1)
+    return np.concatenate([mins, maxs - mins + 1], axis=1).astype(np.int32)
+
+
+class WarpField:
+    """人脸区域的 cv2.remap 坐标场"""
+
+    __slots__ = ('landmarks', 'frame_size', 'roi', 'map_x', 'map_y', 'mask')
+
+    def __init__(self, landmarks, frame_size, roi, map_x, map_y, mask):
+        self.landmarks = landmarks      # 生成坐标场时的帧特征点 (N, 2) float32
+        self.frame_size = frame_size    # (高, 宽)
+        self.roi = roi                  # 人脸区域 (x, y, w, h)
+        self.map_x = map_x
+        self.map_y = map_y
+        self.mask = mask                # 人脸区域内被三角形覆盖的像素，bool
+
+    def apply(self, source_image, frame):
+        """把源图像变形到帧的人脸区域，返回新的帧"""
+        x, y, w, h = self.roi
+        warped = cv2.remap(source_image, self.map_x, self.map_y, cv2.INTER_LINEAR,
+                           borderMode=cv2.BORDER_CONSTANT)
+        result = frame.copy()
+        area = result[y:y + h, x:x + w]
+        np.copyto(area, warped, where=self.mask[..., None] if area.ndim == 3 else self.mask)
+        return result
+
+
+class SourceFaceMesh:
+    """源人脸的三角网格，以及按帧特征点生成的 remap 坐标场缓存"""
+
+    def __init__(self, image, landmarks, cache_size=4):
+        self.image = image
+        self.landmarks = np.asarray(landmarks, dtype=np.int32).reshape(-1, 2)
+
+        triangles = delaunay_triangles(self.landmarks)
+        tri_points = self.landmarks[triangles]                  # (T, 3, 2)
+        rects = triangle_rects(tri_points)
+
+        # 源图像范围外的三角形无法取样，直接丢弃
+        img_h, img_w = image.shape[:2]
+        inside = ((rects[:, 0] >= 0) & (rects[:, 1] >= 0)
+                  & (rects[:, 0] + rects[:, 2] <= img_w) & (rects[:, 1] + rects[:, 3] <= img_h))
+
+        keep = inside & _nondegenerate(tri_points)
+        self.triangles = triangles[keep]
+        # 源三角形顶点矩阵，列为 (x, y)，用于求帧到源图像的逆仿射
+        self._src_cols = tri_points[keep].transpose(0, 2, 1).astype(np.float64)   # (T, 2, 3)
+
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._fields = OrderedDict()
+        self._fields_lock = threading.Lock()
+        logger.debug(f"源人脸三角网格: {len(self.triangles)}个三角形")
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def warp_field(self, landmarks, frame_size, tolerance=1.0):
+        """
+        获取帧特征点对应的 remap 坐标场
+
+        最近使用的坐标场中有特征点最大位移不超过 tolerance 像素的，直接复用；
+        人脸完全在帧外时返回None
+        """
+        landmarks = np.asarray(landmarks, dtype=np.float32).reshape(-1, 2)
+        frame_size = tuple(frame_size[:2])
+        with self._fields_lock:
+            for key, field in self._fields.items():
+                if field.frame_size == frame_size and np.abs(field.landmarks - landmarks).max() <= tolerance:
+                    self._fields.move_to_end(key)
+                    self.cache_hits += 1
+                    return field
+
+        field = self._build_field(landmarks, frame_size)
+        with self._fields_lock:
+            self.cache_misses += 1
+            if field is not None:
+                self._fields[id(field)] = field
+                while len(self._fields) > self.cache_size:
+                    self._fields.popitem(last=False)
+        return field
+
+    def _build_field(self, landmarks, frame_size):
+        frame_h, frame_w = frame_size
+        dst = landmarks[self.triangles]                          # (T, 3, 2)
+
+        # 人脸区域：所有帧三角形的边界矩形，裁剪到帧内
+        x0 = max(0, int(np.floor(dst[..., 0].min())))
+        y0 = max(0, int(np.floor(dst[..., 1].min())))
+        x1 = min(frame_w, int(np.ceil(dst[..., 0].max())) + 1)
+        y1 = min(frame_h, int(np.ceil(dst[..., 1].max())) + 1)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        w, h = x1 - x0, y1 - y0
+
+        # 帧三角形(人脸区域坐标)的齐次矩阵，列为 (x, y, 1)；退化的三角形不参与
+        local = dst.astype(np.float64) - (x0, y0)
+        valid = _nondegenerate(local)
+        dst_h = np.concatenate([local.transpose(0, 2, 1), np.ones((len(local), 1, 3))], axis=1)
+
+        # 逆仿射 A · D = S  =>  A = S · D⁻¹，把人脸区域坐标映射到源图像坐标
+        # 表的第0行对应三角形外的像素，映射到源图像外(-1, -1)
+        table = np.zeros((len(local) + 1, 2, 3), dtype=np.float32)
+        table[0, :, 2] = -1
+        if valid.any():
+            table[1:][valid] = np.matmul(self._src_cols[valid], np.linalg.inv(dst_h[valid]))
+
+        # 栅格化三角形编号图，编号从1开始，0表示不属于任何三角形
+        labels = np.zeros((h, w), dtype=np.int32)
+        polygons = np.round(local).astype(np.int32)
+        for i in np.flatnonzero(valid):
+            cv2.fillConvexPoly(labels, polygons[i], int(i) + 1)
+
+        # 按编号查表，一次计算出整个区域的坐标场
+        affine = table[labels]                                   # (h, w, 2, 3)
+        xs = np.arange(w, dtype=np.float32)[None, :]
+        ys = np.arange(h, dtype=np.float32)[:, None]
+        map_x = affine[..., 0, 0] * xs + affine[..., 0, 1] * ys + affine[..., 0, 2]
+        map_y = affine[..., 1, 0] * xs + affine[..., 1, 1] * ys + affine[..., 1, 2]
+        return WarpField(landmarks, frame_size, (x0, y0, w, h),
+                         map_x.astype(np.float32), map_y.astype(np.float32), labels > 0)
+
+
+def _nondegenerate(tri_points, eps=1e-6):
+    """三角形面积不为零的掩码，tri_points 为 (T, 3, 2)"""
+    if len(tri_points) == 0:
+        return np.zeros(0, dtype=bool)
+    p = np.asarray(tri_points, dtype=np.float64)
+    v1 = p[:, 1] - p[:, 0]
+    v2 = p[:, 2] - p[:, 0]
+    return np.abs(v1[:, 0] * v2[:, 1] - v1[:, 1] * v2[:, 0]) > eps
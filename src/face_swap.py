@@ -1,6 +1,7 @@
 import os
 import sys
 import time  # 添加time模块导入
+import shutil
 
 # 设置环境变量，解决OpenMP冲突问题
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
@@ -47,7 +48,6 @@ if not os.path.exists(init_tcl_path):
         # 尝试从anaconda基础环境中复制
         base_tcl_path = os.path.join(os.path.dirname(os.path.dirname(python_path)), 'Library', 'lib', 'tcl8.6', 'init.tcl')
         if os.path.exists(base_tcl_path):
-            import shutil
             shutil.copy(base_tcl_path, init_tcl_path)
             print(f"已修复init.tcl文件: {init_tcl_path}")
             
@@ -113,58 +113,29 @@ namespace eval ::tk {
     except Exception as e:
         print(f"修复tk.tcl时出错: {e}")
 
-# 导入SSL验证忽略模块
-try:
-    from ignore_ssl_warnings import patch_insightface_download
-    # 修补insightface下载功能
-    patch_insightface_download()
-except ImportError:
-    print("警告：无法导入ignore_ssl_warnings模块")
-
 try:
     # 首先导入基础模块
     import cv2
-    import numpy as np
-    import dlib
     
     # 导入GUI相关模块
     from PIL import Image, ImageTk
     import tkinter as tk
     from tkinter import filedialog, messagebox, ttk
     import threading
-    
-    # 导入视频处理相关模块
-    import imageio_ffmpeg
-    import moviepy.config as mpconfig
-    import moviepy
-    
-    # 设置moviepy的ffmpeg路径
-    moviepy.config.FFMPEG_BINARY = imageio_ffmpeg.get_ffmpeg_exe()
-    moviepy.config.IMAGEMAGICK_BINARY = "convert"
-    if hasattr(moviepy.config, 'PYTHON_BINARY'):
-        moviepy.config.PYTHON_BINARY = os.path.join(python_path, 'python.exe')
-    
-    import concurrent.futures
-    from moviepy.editor import VideoFileClip
     import logging
+
     
-    # 尝试导入insightface库
-    try:
-        import insightface
-        import onnxruntime
-        INSIGHTFACE_AVAILABLE = True
-        print("成功导入InsightFace模块")
-    except ImportError as e:
-        INSIGHTFACE_AVAILABLE = False
-        print(f"导入InsightFace模块时出错: {e}")
-        print("请安装InsightFace: pip install insightface onnx onnxruntime")
-        
     print("所有基础模块已成功导入")
     
 except ImportError as e:
     print(f"导入模块时出错: {e}")
     sys.exit(1)
 
+from face_library_store import refresh_library_async
+from progress_reporter import TkProgressSink
+from engine import FaceSwapEngine, insightface_available
+from job_client import server_available
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -177,12 +148,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger("face_swap")
 
-class FaceSwapApp:
+class FaceSwapApp(FaceSwapEngine):
+    """Tkinter界面，视频处理和换脸都来自 FaceSwapEngine"""
+    
     def __init__(self, root):
-        # 防止局部变量遮蔽全局变量
-        global cv2, dlib, INSIGHTFACE_AVAILABLE
-        
         self.root = root
+        FaceSwapEngine.__init__(self)
         
         # 设置一些基本颜色，即使没有UI也需要
         self.primary_color = "#4287f5"     # 主色调蓝色
@@ -194,24 +165,15 @@ class FaceSwapApp:
         
         # 如果root不为None，则设置标题和大小
         if self.root is not None:
-        self.root.title("人脸替换应用 - InsightFace版")
-        self.root.geometry("1200x800")
+            self.root.title("人脸替换应用 - InsightFace版")
+            self.root.geometry("1200x800")
         
             # 设置应用程序图标和全局字体
             self.set_app_appearance()
         
-        # 存储路径
-        self.video_path = ""
-        self.face_images = []
-        self.selected_face_index = -1
-        self.output_path = ""
-        
-        # 设置默认文件夹路径
-        self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        # 界面自动加载的视频和人脸图片所在文件夹
         self.data_folder = os.path.join(self.base_dir, "data")
-        self.output_folder = os.path.join(self.base_dir, "output_videos")
-        self.models_folder = os.path.join(self.base_dir, "models")
-        self.logs_folder = os.path.join(self.base_dir, "logs")
+        os.makedirs(self.data_folder, exist_ok=True)
         
         # 初始化视频播放相关变量
         self.video_player = None
@@ -221,119 +183,18 @@ class FaceSwapApp:
         self.play_thread = None
         self.duration = 0  # 初始化视频时长
         self.fps = 0  # 初始化帧率
-        self.total_frames = 0  # 初始化总帧数
-        
-        # 确保文件夹存在
-        for folder in [self.data_folder, self.output_folder, self.models_folder, self.logs_folder]:
-            os.makedirs(folder, exist_ok=True)
-        
-        # 初始化模型路径
-        self.cascade_path = os.path.join(self.models_folder, "haarcascade_frontalface_default.xml")
-        self.predictor_path = os.path.join(self.models_folder, "shape_predictor_68_face_landmarks.dat")
-        self.inswapper_path = os.path.join(self.models_folder, "inswapper_128.onnx")
-        
-        # 检查并初始化OpenCV级联分类器
-        self.init_cascade_classifier()
-        
-        # 初始化dlib人脸检测器
-        self.detector = dlib.get_frontal_face_detector()
-        self.predictor = None
-        
-        # 检查并加载dlib特征点预测器
-        if os.path.exists(self.predictor_path):
-            try:
-                self.predictor = dlib.shape_predictor(self.predictor_path)
-                logger.info("成功加载特征点预测模型")
-            except Exception as e:
-                logger.error(f"加载特征点预测模型失败: {e}")
-        else:
-            logger.warning(f"特征点预测模型文件不存在: {self.predictor_path}")
-        
-        # 初始化InsightFace模型
-        self.face_analyser = None
-        self.inswapper = None
-        
-        if INSIGHTFACE_AVAILABLE:
-            try:
-                if os.path.exists(self.inswapper_path):
-                    # 初始化face_analyser用于检测和提取面部特征
-                    # 添加verify=False参数禁用SSL验证，并设置允许本地模型
-                    os.environ['INSIGHTFACE_ALLOW_LOCAL_MODEL'] = '1'
-                    # 使用try-except确保初始化不会因为SSL问题而失败
-                    try:
-                        self.face_analyser = insightface.app.FaceAnalysis(
-                            name="buffalo_l", 
-                            root=self.models_folder,
-                            providers=['CPUExecutionProvider'],
-                            allowed_modules=['detection', 'recognition']
-                        )
-                        self.face_analyser.prepare(ctx_id=0, det_size=(640, 640))
-                    except Exception as e:
-                        logger.warning(f"使用正常方式初始化face_analyser失败: {e}")
-                        # 尝试直接加载buffalo_l目录下的模型
-                        buffalo_dir = os.path.join(self.models_folder, 'buffalo_l')
-                        if os.path.exists(buffalo_dir):
-                            try:
-                                self.face_analyser = insightface.app.FaceAnalysis(
-                                    name="buffalo_l", 
-                                    root=self.models_folder,
-                                    providers=['CPUExecutionProvider'],
-                                    allowed_modules=['detection', 'recognition'],
-                                    download=False  # 禁止下载
-                                )
-                                self.face_analyser.prepare(ctx_id=0, det_size=(640, 640))
-                                logger.info("成功从本地加载buffalo_l模型")
-                            except Exception as e2:
-                                logger.error(f"从本地加载buffalo_l模型失败: {e2}")
-                                import traceback
-                                traceback.print_exc()
-                        else:
-                            logger.error(f"buffalo_l目录不存在: {buffalo_dir}")
-                    
-                    # 初始化inswapper模型
-                    if os.path.exists(self.inswapper_path):
-                        try:
-                            self.inswapper = insightface.model_zoo.get_model(
-                                self.inswapper_path, 
-                                providers=['CPUExecutionProvider'],
-                                download=False,
-                                download_zip=False
-                            )
-                            logger.info(f"成功加载InsightFace模型: {self.inswapper_path}")
-                        except Exception as e:
-                            logger.error(f"加载InsightFace模型失败: {e}")
-                            import traceback
-                            traceback.print_exc()
-                    else:
-                        logger.warning(f"InsightFace模型文件不存在: {self.inswapper_path}")
-                        if self.root is not None:
-                        self.show_model_download_guide("inswapper")
-                else:
-                    logger.warning(f"InsightFace模型文件不存在: {self.inswapper_path}")
-                    if self.root is not None:
-                    self.show_model_download_guide("inswapper")
-            except Exception as e:
-                logger.error(f"初始化InsightFace模型时出错: {e}")
-                if self.root is not None:
-                self.show_model_download_guide("inswapper")
-                import traceback
-                traceback.print_exc()
-        else:
-            logger.warning("InsightFace模块不可用，请安装: pip install insightface onnx onnxruntime")
-        
-        # 初始化高级选项
-        self.detection_confidence = 0.5  # 人脸检测置信度阈值
-        self.multi_scale_detection = True  # 启用多尺度检测
         
         # 创建UI - 只有当root不为None时才创建
         if self.root is not None:
-        self.create_ui()
-        
-        # 自动加载数据文件夹中的视频和图片
-        self.load_data_folder()
-        
-        # 检查模型文件并提示用户
-        self.check_required_models()
+            self.create_ui()
+            self.progress_reporter.add_sink(
+                TkProgressSink(self.root, self.progress_var, self.progress_label, self.status_var))
+            
+            # 自动加载数据文件夹中的视频和图片
+            self.load_data_folder()
+            
+            # 检查模型文件并提示用户
+            self.check_required_models()
     
     def set_app_appearance(self):
         """设置应用程序的全局外观"""
@@ -381,39 +242,6 @@ class FaceSwapApp:
         # 设置根窗口背景色
         self.root.configure(bg=self.secondary_color)
     
-    def init_cascade_classifier(self):
-        """初始化OpenCV级联分类器"""
-        self.face_cascade = None
-        
-        # 如果文件不存在，尝试从OpenCV安装目录查找
-        if not os.path.exists(self.cascade_path):
-            try:
-                # 尝试从OpenCV安装目录查找
-                opencv_haarcascade = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
-                if os.path.exists(opencv_haarcascade):
-                    import shutil
-                    shutil.copy(opencv_haarcascade, self.cascade_path)
-                    logger.info(f"已从OpenCV复制级联分类器文件到: {self.cascade_path}")
-            except (ImportError, AttributeError) as e:
-                logger.error(f"查找OpenCV级联分类器出错: {e}")
-                logger.warning(f"未找到级联分类器文件: {self.cascade_path}")
-                logger.info("请从https://github.com/opencv/opencv/blob/master/data/haarcascades/haarcascade_frontalface_default.xml下载")
-        
-        # 使用文件路径初始化分类器
-        try:
-            if os.path.exists(self.cascade_path):
-                self.face_cascade = cv2.CascadeClassifier(self.cascade_path)
-                if self.face_cascade.empty():
-                    logger.warning(f"无法加载级联分类器，文件可能损坏: {self.cascade_path}")
-                    self.face_cascade = None
-                else:
-                    logger.info("成功加载级联分类器")
-            else:
-                logger.warning(f"未找到级联分类器文件: {self.cascade_path}")
-        except Exception as e:
-            logger.error(f"初始化分类器时出错: {e}")
-            self.face_cascade = None
-    
     def check_required_models(self):
         """检查必要的模型文件是否存在，并提示用户下载"""
         # 检查dlib特征点预测模型
@@ -425,7 +253,7 @@ class FaceSwapApp:
             )
         
         # 检查InsightFace模型
-        if INSIGHTFACE_AVAILABLE and not os.path.exists(self.inswapper_path):
+        if insightface_available() and not os.path.exists(self.inswapper_path):
             self.show_model_download_guide("inswapper")
     
     def show_model_download_guide(self, model_type="inswapper"):
@@ -709,6 +537,9 @@ class FaceSwapApp:
             self.face_images = image_files
             self.display_face_images()
             
+            # 后台增量更新人脸特征库，之后选择人脸只需查表
+            refresh_library_async(self.data_folder, lambda: self.face_analyser, image_files)
+            
             # 自动生成输出路径
             if self.video_path:
                 video_name = os.path.splitext(os.path.basename(self.video_path))[0]
@@ -777,15 +608,15 @@ class FaceSwapApp:
             image_frame.grid(row=0, column=i, padx=10, pady=10)
             
             try:
-            # 加载并调整图片大小
-            img = Image.open(img_path)
-            img = img.resize((150, 150), Image.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
-            
-            # 保存引用以防止垃圾回收
+                # 加载并调整图片大小
+                img = Image.open(img_path)
+                img = img.resize((150, 150), Image.LANCZOS)
+                photo = ImageTk.PhotoImage(img)
+                
+                # 保存引用以防止垃圾回收
                 image_frame.photo = photo
-            
-            # 显示图片
+                
+                # 显示图片
                 img_label = ttk.Label(image_frame, image=photo)
                 img_label.pack(padx=5, pady=5)
                 
@@ -796,7 +627,7 @@ class FaceSwapApp:
                 name_label = ttk.Label(image_frame, text=filename, style="TLabel")
                 name_label.pack(pady=(0, 5))
             
-            # 添加选择按钮
+                # 添加选择按钮
                 select_btn = ttk.Button(image_frame, text=f"选择图片 {i+1}", 
                                      command=lambda idx=i: self.select_face(idx),
                                      style="TButton", width=15)
@@ -848,6 +679,11 @@ class FaceSwapApp:
             messagebox.showerror("错误", "请指定输出路径")
             return
         
+        # 任务队列服务在运行时交给服务处理，服务中的模型已经加载，本进程不需要加载模型
+        if server_available():
+            threading.Thread(target=self.process_video_via_server, daemon=True).start()
+            return
+        
         # 获取用户选择的人脸替换方法
         swapper_choice = getattr(self, 'swapper_var', tk.StringVar(value="traditional")).get()
         
@@ -869,474 +705,12 @@ class FaceSwapApp:
                 return
             
             if self.predictor is None:
-                self.predictor = dlib.shape_predictor(predictor_path)
+                messagebox.showerror("错误", "无法加载面部特征点模型，请确认已安装dlib。")
+                return
         
         # 在新线程中启动处理，以避免UI冻结
         threading.Thread(target=self.process_video, daemon=True).start()
     
-    def insightface_face_swap(self, frame, source_img):
-        """使用InsightFace进行人脸替换"""
-        try:
-            # 检查人脸分析器和交换器
-            if self.face_analyser is None or self.inswapper is None:
-                return frame  # 直接返回原始帧
-            
-            # 检查输入帧是否有效
-            if frame is None or frame.size == 0:
-                    return frame
-            
-            # 将BGR帧转换为RGB
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # 检测和分析人脸
-            input_faces = self.face_analyser.get(rgb_frame)
-            if len(input_faces) == 0:
-                return frame  # 没有检测到人脸
-                
-            # 分析源图像中的人脸
-            source_rgb = cv2.cvtColor(source_img, cv2.COLOR_BGR2RGB)
-            source_faces = self.face_analyser.get(source_rgb)
-                if len(source_faces) == 0:
-                return frame  # 源图像中没有检测到人脸
-            
-            # 获取源人脸
-            source_face = source_faces[0]
-            
-            # 替换每个检测到的人脸
-            result = frame.copy()
-            
-            # 检查是否需要颜色校正
-            use_color_correction = False
-            if hasattr(self, 'color_correction_var'):
-                if hasattr(self.color_correction_var, 'get'):
-                    # 如果是Tkinter变量
-                    use_color_correction = self.color_correction_var.get()
-                else:
-                    # 如果是普通变量（布尔值）
-                    use_color_correction = self.color_correction_var
-            
-            for face in input_faces:
-                # 应用人脸交换
-                result = self.inswapper.get(result, face, source_face, paste_back=True)
-                
-                # 应用颜色校正（如果启用）
-                if use_color_correction:
-                    # 创建面部区域蒙版
-                    mask = np.zeros_like(frame)
-                    
-                    # 获取人脸关键点
-                    kps = face.kps.astype(int)
-                    hull = cv2.convexHull(kps)
-                    
-                    # 绘制凸包形成蒙版
-                    cv2.fillConvexPoly(mask, hull, (255, 255, 255))
-                    
-                    # 应用颜色校正
-                    result = self.adjust_color_balance(result, frame, mask=mask[:,:,0], blur_amount=10)
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"InsightFace换脸过程出错: {e}")
-            import traceback
-            traceback.print_exc()
-            return frame  # 出错时返回原始帧
-    
-    def adjust_color_balance(self, target_img, source_img, mask=None, blur_amount=0):
-        """
-        调整目标图像的颜色平衡以匹配源图像
-        这是一个简化版的颜色校正，适用于InsightFace处理后的结果
-        """
-        try:
-            # 转换为LAB色彩空间
-            target_lab = cv2.cvtColor(target_img, cv2.COLOR_BGR2LAB)
-            source_lab = cv2.cvtColor(source_img, cv2.COLOR_BGR2LAB)
-            
-            # 分离通道
-            target_l, target_a, target_b = cv2.split(target_lab)
-            source_l, source_a, source_b = cv2.split(source_lab)
-            
-            # 计算源图像和目标图像的均值和标准差
-            source_l_mean, source_l_std = cv2.meanStdDev(source_l)
-            target_l_mean, target_l_std = cv2.meanStdDev(target_l)
-            
-            # 调整亮度通道
-            l_adjusted = target_l * (source_l_std[0][0] / target_l_std[0][0]) + (source_l_mean[0][0] - target_l_mean[0][0] * (source_l_std[0][0] / target_l_std[0][0]))
-            
-            # 确保值在有效范围内
-            l_adjusted = np.clip(l_adjusted, 0, 255).astype(np.uint8)
-            
-            # 合并通道
-            adjusted_lab = cv2.merge([l_adjusted, target_a, target_b])
-            
-            # 转换回BGR色彩空间
-            adjusted_img = cv2.cvtColor(adjusted_lab, cv2.COLOR_LAB2BGR)
-            
-            # 使用alpha混合平滑过渡
-            alpha = 0.7  # 混合因子
-            result = cv2.addWeighted(adjusted_img, alpha, target_img, 1-alpha, 0)
-            
-            # 应用高斯模糊（如果启用）
-            if blur_amount > 0:
-                result = cv2.GaussianBlur(result, (blur_amount, blur_amount), 0)
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"颜色平衡调整出错: {e}")
-            return target_img
-    
-    def process_video(self):
-        """处理视频的主函数，应用人脸替换效果并保存结果"""
-        try:
-            # 检查是否选择了视频
-            if not self.video_path:
-                # 使用回调或UI更新状态
-                self.update_status("请先选择一个视频文件")
-                return False
-            
-            # 检查视频文件是否存在
-            if not os.path.exists(self.video_path):
-                self.update_status(f"视频文件不存在: {self.video_path}")
-                return False
-            
-            # 检查是否选择了人脸图片
-            if not self.face_images or self.selected_face_index < 0 or self.selected_face_index >= len(self.face_images):
-                self.update_status("请先选择一张人脸图片")
-                return False
-            
-            # 检查人脸图片是否存在
-            target_face_path = self.face_images[self.selected_face_index]
-            if not os.path.exists(target_face_path):
-                self.update_status(f"人脸图片不存在: {target_face_path}")
-                return False
-            
-            # 检查是否设置了输出路径
-            if not self.output_path:
-                # 根据输入文件创建一个默认输出路径
-                video_dir = os.path.dirname(self.video_path)
-                video_name = os.path.basename(self.video_path)
-                base_name, ext = os.path.splitext(video_name)
-                self.output_path = os.path.join(video_dir, f"{base_name}_face_swap{ext}")
-            
-            # 更新状态
-            self.update_status("正在处理视频...")
-            
-            # 初始化日志文件
-            log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
-            os.makedirs(log_dir, exist_ok=True)
-            
-            # 打开视频
-            video = cv2.VideoCapture(self.video_path)
-            if not video.isOpened():
-                self.update_status(f"无法打开视频文件: {self.video_path}")
-                return False
-            
-            # 获取视频基本信息
-            width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            fps = video.get(cv2.CAP_PROP_FPS)
-            total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-            
-            # 保存视频总帧数，供其他函数使用
-            self.total_frames = total_frames
-            
-            # 创建目录
-            os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
-            
-            # 创建视频写入器
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # MP4格式
-            output_file = self.output_path
-            
-            # 检查文件是否已存在，如果存在则添加时间戳
-            if os.path.exists(output_file):
-                base_name, ext = os.path.splitext(output_file)
-                output_file = f"{base_name}_{int(time.time())}{ext}"
-                self.output_path = output_file
-            
-            out = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
-            
-            # 更新状态
-            logger.info(f"视频信息: {width}x{height}, {fps}fps, {total_frames}帧")
-            logger.info(f"输出文件: {output_file}")
-            self.update_status(f"正在处理视频: {width}x{height}, {fps}fps, {total_frames}帧")
-            
-            # 使用线程池并行处理视频帧
-            max_workers = os.cpu_count() or 4  # 如果无法获取CPU核心数，则默认使用4个线程
-            
-            # 如果使用InsightFace，由于GPU内存限制，减少工作线程数量
-            if self.swapper_var == "inswapper" and self.inswapper is not None:
-                # GPU模式下只使用1个线程，否则模型会占用大量显存
-                max_workers = min(2, max_workers)
-                logger.info(f"使用InsightFace，限制工作线程数为: {max_workers}")
-            
-            # 更新进度
-            self.update_progress(0, "准备处理")
-            
-            # 使用线程池处理视频帧
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 保存所有处理任务的future对象
-                futures = set()
-                
-                # 处理一帧视频的任务
-                def process_frame_task(frame_data):
-                    # 解构参数
-                    index, frame = frame_data
-                    
-                    # 获取用户选择的人脸替换方法和参数
-                    swapper_choice = self.swapper_var
-                    detector_choice = self.detector_var
-                    target_face_path = self.face_images[self.selected_face_index]
-                
-                    # 处理图像 - 这里需要适配你的处理流程
-                    processed_frame = None
-                    
-                    # 根据不同的处理方法调用不同的函数
-                    if swapper_choice == "inswapper" and self.inswapper is not None and self.face_analyser is not None:
-                        # 读取目标人脸
-                        target_image = cv2.imread(target_face_path)
-                        if target_image is None:
-                            raise ValueError(f"无法读取人脸图片: {target_face_path}")
-                        
-                        # 使用InsightFace替换
-                        processed_frame = self.insightface_face_swap(frame, target_image)
-                        
-                        else:
-                        # 传统方法处理
-                        use_multi_scale = self.multi_scale_var
-                        target_image_rgb = cv2.imread(target_face_path)
-                        if target_image_rgb is None:
-                            raise ValueError(f"无法读取人脸图片: {target_face_path}")
-                            
-                        # 处理目标图像的人脸特征点
-                        target_landmarks = None
-                        
-                        # 检测目标人脸
-                        target_rgb = cv2.cvtColor(target_image_rgb, cv2.COLOR_BGR2RGB)
-                        if detector_choice == "dlib":
-                            target_faces = self.detector(target_rgb, 1)
-                            if len(target_faces) > 0:
-                                target_landmarks = self.predictor(target_rgb, target_faces[0])
-                                target_landmarks = self.shape_to_np(target_landmarks)
-                        else:  # OpenCV检测器
-                            target_gray = cv2.cvtColor(target_image_rgb, cv2.COLOR_BGR2GRAY)
-                            target_faces = self.opencv_detector.detectMultiScale(
-                                target_gray, 
-                                scaleFactor=1.1, 
-                                minNeighbors=5,
-                                minSize=(30, 30)
-                            )
-                            
-                            if len(target_faces) > 0:
-                                x, y, w, h = target_faces[0]
-                                target_face_rect = dlib.rectangle(x, y, x+w, y+h)
-                                target_landmarks = self.predictor(target_rgb, target_face_rect)
-                                target_landmarks = self.shape_to_np(target_landmarks)
-                        
-                        if target_landmarks is None:
-                            # 如果没有检测到目标人脸，返回原始帧
-                            return (index, frame)
-                        
-                        # 使用传统方法处理帧
-                        processed_frame = self.process_frame_traditional(
-                            frame, 
-                            target_image_rgb, 
-                            target_landmarks, 
-                            detector_choice, 
-                            use_multi_scale
-                        )
-                    
-                    # 返回处理后的帧和索引
-                    if processed_frame is not None:
-                        return (index, processed_frame)
-                    else:
-                        # 如果处理失败，返回原始帧
-                        return (index, frame)
-                
-                # 初始化变量
-                frame_count = 0
-                frame_buffer = {}  # 存储处理好的帧
-                next_frame_to_write = 0  # 下一个要写入的帧索引
-                
-                while True:
-                    ret, frame = video.read()
-                    if not ret:
-                        break
-                    
-                    # 更新进度
-                    frame_count += 1
-                    progress = (frame_count / total_frames) * 100
-                    # 使用回调更新进度
-                    self.update_progress(progress, f"处理帧 {frame_count}/{total_frames}")
-                    
-                    # 每100帧显示一次进度
-                    if frame_count % 100 == 0 or frame_count == total_frames:
-                        self.update_status(f"正在处理视频... {frame_count}/{total_frames} 帧")
-                        logger.info(f"处理进度: {frame_count}/{total_frames} ({progress:.1f}%)")
-                    
-                    # 提交处理任务
-                    future = executor.submit(process_frame_task, (frame_count-1, frame))
-                    futures.add(future)
-                    
-                    # 检查已完成的任务
-                    done_futures = set()
-                    for future in list(futures):
-                        if future.done():
-                            try:
-                                # 获取处理结果
-                                idx, processed_frame = future.result()
-                                # 将结果添加到帧缓冲区
-                                frame_buffer[idx] = processed_frame
-                                
-                                # 从futures集合中移除已完成的任务
-                                done_futures.add(future)
-                                
-                                # 检查是否可以按顺序写入帧
-                                if idx == next_frame_to_write:
-                                    next_frame_to_write = self.write_frames_in_order(out, frame_buffer, next_frame_to_write)
-                                
-                            except Exception as e:
-                                logger.error(f"处理帧时出错: {e}")
-                                import traceback
-                                traceback.print_exc()
-                    
-                    # 从futures集合中移除已完成的任务
-                    futures -= done_futures
-                    
-                    # 控制任务队列大小，避免内存溢出
-                    max_pending_tasks = max_workers * 3  # 允许的最大待处理任务数
-                    while len(futures) > max_pending_tasks:
-                        # 等待其中一个任务完成
-                        done, futures_set = concurrent.futures.wait(
-                            futures, 
-                            return_when=concurrent.futures.FIRST_COMPLETED,
-                            timeout=1.0  # 设置超时，防止无限等待
-                        )
-                        
-                        # 处理完成的任务
-                        for future in done:
-                            try:
-                                idx, processed_frame = future.result()
-                                frame_buffer[idx] = processed_frame
-                                
-                                # 检查是否可以按顺序写入帧
-                                if idx == next_frame_to_write:
-                                    next_frame_to_write = self.write_frames_in_order(out, frame_buffer, next_frame_to_write)
-                                
-                            except Exception as e:
-                                logger.error(f"处理帧时出错: {e}")
-                                import traceback
-                                traceback.print_exc()
-                        
-                        # 更新futures集合
-                        futures = futures_set
-                
-                # 等待所有任务完成
-                for future in concurrent.futures.as_completed(futures):
-                    try:
-                        idx, processed_frame = future.result()
-                        frame_buffer[idx] = processed_frame
-                    except Exception as e:
-                        logger.error(f"处理帧时出错: {e}")
-                        import traceback
-                        traceback.print_exc()
-                
-                # 写入剩余的帧
-                while len(frame_buffer) > 0:
-                    next_frame_to_write = self.write_frames_in_order(out, frame_buffer, next_frame_to_write)
-                    # 如果没有更多帧可写，则退出循环
-                    if next_frame_to_write >= total_frames:
-                        break
-                
-                # 释放资源
-                video.release()
-                out.release()
-                
-            # 更新状态
-            self.update_status("处理完成!")
-            self.update_progress(100, "完成")
-            
-            logger.info(f"视频处理完成: {self.output_path}")
-            return self.output_path
-            
-        except Exception as e:
-            self.update_status(f"错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return False
-            
-    def update_progress(self, value, text=None):
-        """更新进度条，支持无UI模式"""
-        try:
-            # 如果有progress_var（Tkinter界面）
-            if hasattr(self, 'progress_var') and self.progress_var is not None:
-                self.progress_var.set(value)
-                # 如果有progress_label
-                if hasattr(self, 'progress_label') and self.progress_label is not None and self.root is not None:
-                    progress_text = f"{value:.1f}%"
-                    self.root.after(0, lambda t=progress_text: self.progress_label.config(text=t))
-            # 打印日志
-            logger.info(f"进度: {value:.1f}% {text if text else ''}")
-        except Exception as e:
-            logger.error(f"更新进度时出错: {e}")
-            
-    def update_status(self, text):
-        """更新状态文本，支持无UI模式"""
-        try:
-            # 如果有status_var（Tkinter界面）
-            if hasattr(self, 'status_var') and self.status_var is not None:
-                self.status_var.set(text)
-            # 打印日志
-            logger.info(f"状态: {text}")
-        except Exception as e:
-            logger.error(f"更新状态时出错: {e}")
-            
-    def write_frames_in_order(self, out, frames_buffer, next_frame_to_write):
-        """按顺序写入已处理的视频帧，返回下一个要写入的帧索引"""
-        # 复制一份帧缓冲区的键，并进行排序
-        keys = sorted(list(frames_buffer.keys()))
-        
-        # 确保有需要写入的帧
-        if not keys:
-            return next_frame_to_write
-        
-        # 找出连续的帧并写入
-        while keys and keys[0] == next_frame_to_write:
-            # 写入帧并从缓冲区中移除
-            frame = frames_buffer.pop(keys[0])
-                        
-            # 确保帧是有效的
-            if frame is not None and frame.size > 0:
-                try:
-                    out.write(frame)
-                except Exception as e:
-                    logger.error(f"写入帧 {next_frame_to_write} 时出错: {e}")
-                        else:
-                logger.error(f"帧 {next_frame_to_write} 无效，跳过")
-            
-            # 更新下一个要写入的帧索引
-            next_frame_to_write += 1
-            
-            # 从排序后的键列表中移除已处理的键
-            keys.pop(0)
-        
-        # 更新进度条
-        if hasattr(self, 'progress_var'):
-            # 安全获取total_frames属性
-            total_frames = getattr(self, 'total_frames', 0)
-            if total_frames > 0:
-                progress_value = min(100, int((next_frame_to_write / total_frames) * 100))
-                self.progress_var.set(progress_value)
-                # 更新进度标签
-                progress_text = f"{progress_value}%"
-                self.root.after(0, lambda t=progress_text: self.progress_label.config(text=t))
-                
-                # 更新状态文本
-                status_text = f"处理中... {progress_value}%"
-                self.root.after(0, lambda t=status_text: self.status_var.set(t))
-                
-        return next_frame_to_write
-
     def load_video_player(self, video_path):
         """加载视频到播放器"""
         try:
@@ -1387,7 +761,7 @@ class FaceSwapApp:
             
             # 显示成功提示
             messagebox.showinfo("处理完成", "视频处理完成，可以在播放器中查看结果")
-                except Exception as e:
+        except Exception as e:
             logger.error(f"加载视频失败: {str(e)}")
             messagebox.showerror("错误", f"加载视频失败: {str(e)}")
             self.stop_video()
@@ -1408,7 +782,7 @@ class FaceSwapApp:
             duration = getattr(self, 'duration', 0)
             if hasattr(self, 'format_time'):
                 self.time_label.config(text=f"00:00 / {self.format_time(duration)}")
-                    else:
+            else:
                 # 如果format_time方法不存在，使用简单格式
                 minutes = int(duration // 60)
                 seconds = int(duration % 60)
@@ -1566,681 +940,6 @@ class FaceSwapApp:
         seconds = int(seconds % 60)
         return f"{minutes:02d}:{seconds:02d}"
     
-    def advanced_face_swap(self, frame, rgb_frame, landmarks, target_image, target_landmarks):
-        """使用改进的方法进行人脸替换"""
-        try:
-            # 确保所有特征点都是正确的数据类型
-            landmarks = np.array(landmarks, dtype=np.int32)
-            target_landmarks = np.array(target_landmarks, dtype=np.int32)
-            
-            # 计算凸包 - 使用完整的68点凸包计算
-            hull = cv2.convexHull(landmarks)
-            target_hull = cv2.convexHull(target_landmarks)
-            
-            # 创建掩码 - 增加调试输出
-            mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-            cv2.fillConvexPoly(mask, hull, 255)
-            
-            # 调试掩码
-            mask_sum = np.sum(mask)
-            print(f"原始掩码像素和: {mask_sum}, 是否为零: {mask_sum == 0}")
-            
-            # 如果掩码全为零，尝试使用更简单的方法创建掩码
-            if mask_sum == 0:
-                print("尝试使用备选方法创建掩码")
-                mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-                x, y, w, h = cv2.boundingRect(landmarks)
-                # 使用椭圆填充而不是凸多边形
-                center = (x + w//2, y + h//2)
-                axes = (w//2, h//2)
-                cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
-                mask_sum = np.sum(mask)
-                print(f"备选掩码像素和: {mask_sum}")
-                
-                # 保存调试图像
-                debug_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "debug")
-                os.makedirs(debug_dir, exist_ok=True)
-                cv2.imwrite(os.path.join(debug_dir, "face_mask_debug.jpg"), mask)
-            
-            # 计算德劳内三角剖分
-            rect = cv2.boundingRect(hull)
-            subdiv = cv2.Subdiv2D(rect)
-            
-            # 确保点的格式正确
-            points = []
-            for point in landmarks:
-                points.append((int(point[0]), int(point[1])))
-            
-            # 插入点到三角剖分
-            for point in points:
-                try:
-                    subdiv.insert(point)
-                except Exception as e:
-                    print(f"插入点到三角剖分出错: {e}, 点: {point}")
-                    continue
-            
-            # 获取三角形列表
-            try:
-                triangles = subdiv.getTriangleList()
-                triangles = np.array(triangles, dtype=np.int32)
-            except Exception as e:
-                print(f"获取三角形列表出错: {e}")
-                # 如果三角剖分失败，尝试使用简化方法
-                return self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks)
-            
-            # 转换三角形索引
-            triangle_indexes = []
-            for t in triangles:
-                pt1 = (t[0], t[1])
-                pt2 = (t[2], t[3])
-                pt3 = (t[4], t[5])
-                
-                idx1 = self.find_point_index(points, pt1)
-                idx2 = self.find_point_index(points, pt2)
-                idx3 = self.find_point_index(points, pt3)
-                
-                if idx1 != -1 and idx2 != -1 and idx3 != -1:
-                    triangle_indexes.append([idx1, idx2, idx3])
-            
-            # 对每个三角形进行变换
-            result_img = frame.copy()
-            
-            # 输出三角形数量，帮助调试
-            print(f"检测到 {len(triangle_indexes)} 个三角形")
-            
-            # 如果三角形数量过少，可能是人脸检测不准确
-            if len(triangle_indexes) < 10:
-                print("警告：三角形数量过少，可能是人脸检测不准确")
-                # 保存一个调试图像，显示特征点
-                debug_frame = frame.copy()
-                for point in landmarks:
-                    cv2.circle(debug_frame, (point[0], point[1]), 2, (0, 255, 0), -1)
-                debug_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "debug")
-                os.makedirs(debug_dir, exist_ok=True)
-                cv2.imwrite(os.path.join(debug_dir, "frame_landmarks_debug.jpg"), debug_frame)
-                
-                # 尝试使用更简单的方法进行人脸替换
-                print("尝试使用备选方法进行人脸替换")
-                return self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks)
-            
-            # 继续处理三角形
-            for triangle in triangle_indexes:
-                try:
-                    # 获取三角形顶点
-                    tr1_pt1 = landmarks[triangle[0]]
-                    tr1_pt2 = landmarks[triangle[1]]
-                    tr1_pt3 = landmarks[triangle[2]]
-                    triangle1 = np.array([tr1_pt1, tr1_pt2, tr1_pt3], dtype=np.int32)
-                    
-                    # 计算三角形的边界矩形
-                    rect1 = cv2.boundingRect(triangle1)
-                    (x, y, w, h) = rect1
-                    
-                    # 确保边界在图像范围内
-                    if x < 0 or y < 0 or x + w > frame.shape[1] or y + h > frame.shape[0]:
-                        continue
-                    
-                    # 创建裁剪后的三角形
-                    cropped_triangle = frame[y:y+h, x:x+w].copy()
-                    cropped_mask = np.zeros((h, w), dtype=np.uint8)
-                    
-                    # 调整坐标
-                    points = np.array([[tr1_pt1[0]-x, tr1_pt1[1]-y],
-                                      [tr1_pt2[0]-x, tr1_pt2[1]-y],
-                                      [tr1_pt3[0]-x, tr1_pt3[1]-y]], dtype=np.int32)
-                    
-                    cv2.fillConvexPoly(cropped_mask, points, 255)
-                    
-                    # 获取目标图像中对应的三角形
-                    tr2_pt1 = target_landmarks[triangle[0]]
-                    tr2_pt2 = target_landmarks[triangle[1]]
-                    tr2_pt3 = target_landmarks[triangle[2]]
-                    triangle2 = np.array([tr2_pt1, tr2_pt2, tr2_pt3], dtype=np.int32)
-                    
-                    # 计算目标三角形的边界矩形
-                    rect2 = cv2.boundingRect(triangle2)
-                    (x2, y2, w2, h2) = rect2
-                    
-                    # 确保边界在目标图像范围内
-                    if x2 < 0 or y2 < 0 or x2 + w2 > target_image.shape[1] or y2 + h2 > target_image.shape[0]:
-                        continue
-                    
-                    # 创建裁剪后的目标三角形
-                    cropped_target = target_image[y2:y2+h2, x2:x2+w2].copy()
-                    cropped_target_mask = np.zeros((h2, w2), dtype=np.uint8)
-                    
-                    # 调整坐标
-                    points2 = np.array([[tr2_pt1[0]-x2, tr2_pt1[1]-y2],
-                                       [tr2_pt2[0]-x2, tr2_pt2[1]-y2],
-                                       [tr2_pt3[0]-x2, tr2_pt3[1]-y2]], dtype=np.int32)
-                    
-                    cv2.fillConvexPoly(cropped_target_mask, points2, 255)
-                    
-                    # 计算仿射变换
-                    points = np.float32(points)
-                    points2 = np.float32(points2)
-                    
-                    # 确保有足够的点进行变换
-                    if len(points) < 3 or len(points2) < 3:
-                        continue
-                    
-                    M = cv2.getAffineTransform(points2, points)
-                    
-                    # 应用仿射变换
-                    warped_triangle = cv2.warpAffine(cropped_target, M, (w, h))
-                    
-                    # 确保掩码和图像大小匹配
-                    if cropped_mask.shape[:2] != warped_triangle.shape[:2]:
-                        continue
-                    
-                    warped_triangle = cv2.bitwise_and(warped_triangle, warped_triangle, mask=cropped_mask)
-                    
-                    # 重建目标图像区域
-                    img_area = result_img[y:y+h, x:x+w].copy()
-                    
-                    # 创建反掩码
-                    inv_cropped_mask = cv2.bitwise_not(cropped_mask)
-                    
-                    # 使用反掩码清除目标区域中将被替换的部分
-                    img_area_masked = cv2.bitwise_and(img_area, img_area, mask=inv_cropped_mask)
-                    
-                    # 将变形后的三角形添加到目标区域
-                    img_area = cv2.add(img_area_masked, warped_triangle)
-                    
-                    # 更新结果图像
-                    result_img[y:y+h, x:x+w] = img_area
-                except Exception as e:
-                    print(f"处理三角形时出错: {e}")
-                    continue
-            
-            # 应用平滑度设置
-            smoothing_factor = self.smoothing_var.get() / 10.0  # 将滑块值转换为合适的平滑因子
-            
-            # 创建无缝克隆的掩码
-            center_face = (rect[0] + rect[2]//2, rect[1] + rect[3]//2)
-            
-            # 添加调试信息
-            print(f"人脸中心点: {center_face}, 图像尺寸: {frame.shape[:2]}")
-            
-            # 确保掩码和图像大小匹配
-            if mask.shape[:2] != frame.shape[:2]:
-                mask = cv2.resize(mask, (frame.shape[1], frame.shape[0]))
-            
-            # 确保中心点在图像内部
-            if 0 <= center_face[0] < frame.shape[1] and 0 <= center_face[1] < frame.shape[0]:
-                try:
-                    # 确保掩码和图像大小完全匹配
-                    if mask.shape[:2] != frame.shape[:2]:
-                        mask = cv2.resize(mask, (frame.shape[1], frame.shape[0]))
-                    
-                    # 检查掩码是否有效（至少有一些非零像素）
-                    mask_sum = np.sum(mask)
-                    print(f"最终掩码像素和: {mask_sum}")
-                    
-                    if mask_sum > 0:
-                        # 计算掩码的边界框，确保在图像内部
-                        mask_indices = np.where(mask > 0)
-                        if len(mask_indices[0]) > 0 and len(mask_indices[1]) > 0:
-                            y_min, y_max = np.min(mask_indices[0]), np.max(mask_indices[0])
-                            x_min, x_max = np.min(mask_indices[1]), np.max(mask_indices[1])
-                            
-                            # 确保边界框完全在图像内部
-                            if (0 <= x_min < x_max < frame.shape[1] and 
-                                0 <= y_min < y_max < frame.shape[0]):
-                                # 保存无缝克隆前的掩码和图像用于调试
-                                debug_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "debug")
-                                cv2.imwrite(os.path.join(debug_dir, "before_clone_mask.jpg"), mask)
-                                cv2.imwrite(os.path.join(debug_dir, "before_clone_result.jpg"), result_img)
-                                cv2.imwrite(os.path.join(debug_dir, "before_clone_frame.jpg"), frame)
-                                
-                                try:
-                                    # 确保输入图像是8位无符号整数类型
-                                    result_img_8u = result_img.astype(np.uint8)
-                                    frame_8u = frame.astype(np.uint8)
-                                    mask_8u = mask.astype(np.uint8)
-                                    
-                                    # 尝试使用无缝克隆
-                                    seamless_result = cv2.seamlessClone(
-                                        result_img_8u, frame_8u, mask_8u, center_face, cv2.NORMAL_CLONE)
-                                        
-                                    # 保存无缝克隆后的图像用于调试
-                                    cv2.imwrite(os.path.join(debug_dir, "after_clone_result.jpg"), seamless_result)
-                                except Exception as e:
-                                    print(f"无缝克隆时出错: {e}")
-                                    # 如果无缝克隆失败，使用 Poisson 混合
-                                    try:
-                                        # 使用掩码直接混合
-                                        mask_3ch = cv2.merge([mask, mask, mask])
-                                        # 归一化掩码
-                                        mask_norm = mask_3ch.astype(float) / 255.0
-                                        
-                                        # 确保数据类型一致
-                                        result_img_float = result_img.astype(np.float32)
-                                        frame_float = frame.astype(np.float32)
-                                        
-                                        # 直接混合
-                                        seamless_result = (result_img_float * mask_norm + 
-                                                          frame_float * (1 - mask_norm)).astype(np.uint8)
-                                    except Exception as e2:
-                                        print(f"Poisson混合时出错: {e2}")
-                                        seamless_result = result_img.astype(np.uint8)
-                            else:
-                                print("掩码边界框超出图像范围，跳过无缝克隆")
-                                seamless_result = result_img.astype(np.uint8)
-                        else:
-                            print("掩码中没有有效像素，跳过无缝克隆")
-                            seamless_result = result_img.astype(np.uint8)
-                    else:
-                        print("掩码全为零，跳过无缝克隆")
-                        seamless_result = result_img.astype(np.uint8)
-                except Exception as e:
-                    print(f"无缝克隆时出错: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    seamless_result = result_img.astype(np.uint8)
-            else:
-                print(f"中心点 {center_face} 超出图像范围 {frame.shape[:2]}，跳过无缝克隆")
-                seamless_result = result_img.astype(np.uint8)
-            
-            # 如果启用了颜色校正
-            if self.color_correction_var.get():
-                try:
-                    # 获取面部区域的掩码
-                    face_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-                    cv2.fillConvexPoly(face_mask, hull, 255)
-                    
-                    # 应用颜色校正
-                    seamless_result = self.color_correct(seamless_result, frame, face_mask)
-                    # 确保颜色校正后的图像是8位无符号整数类型
-                    seamless_result = seamless_result.astype(np.uint8)
-                except Exception as e:
-                    print(f"颜色校正时出错: {e}")
-                    # 如果颜色校正失败，继续使用未校正的结果
-                    seamless_result = seamless_result.astype(np.uint8)
-            
-            # 增强替换效果 - 增加对比度
-            try:
-                x, y, w, h = cv2.boundingRect(landmarks)
-                face_area = seamless_result[y:y+h, x:x+w].copy()
-                # 应用对比度增强
-                enhanced_face = cv2.addWeighted(face_area, 1.2, face_area, 0, 5)
-                seamless_result[y:y+h, x:x+w] = enhanced_face
-            except Exception as e:
-                print(f"增强对比度时出错: {e}")
-            
-            # 与原始帧进行对比，确保结果有差异
-            seamless_result = seamless_result.astype(np.uint8)
-            frame_8u = frame.astype(np.uint8)
-            diff = cv2.absdiff(seamless_result, frame_8u)
-            diff_mean = np.mean(diff)
-            
-            if diff_mean < 5:  # 如果差异很小，可能是替换失败
-                print(f"警告: 处理前后图像差异很小 ({diff_mean})，可能替换失败")
-                # 尝试使用简化方法
-                return self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks)
-            
-            # 确保返回值不是原始帧的副本
-            if np.array_equal(seamless_result, frame):
-                print("警告: 结果与原始帧相同，尝试使用简化替换方法")
-                return self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks)
-            
-            # 最终确保返回的是8位无符号整数类型
-            return seamless_result.astype(np.uint8)
-        except Exception as e:
-            print(f"人脸替换过程中出错: {e}")
-            import traceback
-            traceback.print_exc()
-            return self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks)  # 出错时使用简化方法
-    
-    def simple_face_swap(self, frame, rgb_frame, landmarks, target_image, target_landmarks):
-        """
-        简化的人脸替换方法，使用基本的图像处理技术
-        当高级三角剖分方法失败时作为备选方案
-        """
-        try:
-            # 获取源人脸和目标人脸的边界框
-            src_face_rect = cv2.boundingRect(landmarks)
-            target_face_rect = cv2.boundingRect(target_landmarks)
-            
-            x, y, w, h = src_face_rect
-            x2, y2, w2, h2 = target_face_rect
-            
-            print(f"简化替换：源人脸位置 ({x},{y},{w},{h}), 目标人脸位置 ({x2},{y2},{w2},{h2})")
-            
-            # 保存原始帧的副本
-            orig_frame = frame.copy()
-            
-            # 提取源人脸和目标人脸
-            src_face = frame[y:y+h, x:x+w]
-            target_face = target_image[y2:y2+h2, x2:x2+w2]
-            
-            # 调整目标人脸大小以匹配源人脸
-            target_face_resized = cv2.resize(target_face, (w, h))
-            
-            # 创建人脸掩码 - 使用椭圆形状
-            face_mask = np.zeros((h, w), dtype=np.uint8)
-            center = (w // 2, h // 2)
-            # 稍微缩小椭圆以避免包含背景
-            axes = (int(w * 0.45), int(h * 0.55))
-            cv2.ellipse(face_mask, center, axes, 0, 0, 360, 255, -1)
-            
-            # 应用高斯模糊使边缘平滑
-            face_mask = cv2.GaussianBlur(face_mask, (15, 15), 10)
-            
-            # 将掩码转换为3通道浮点形式
-            face_mask_3ch = cv2.merge([face_mask, face_mask, face_mask])
-            face_mask_3ch = face_mask_3ch.astype(float) / 255.0
-            
-            # 确保src_face与target_face_resized的数据类型一致
-            src_face = src_face.astype(np.float32)
-            target_face_resized = target_face_resized.astype(np.float32)
-            
-            # 基于掩码融合两个人脸
-            blended_face = (target_face_resized * face_mask_3ch + 
-                           src_face * (1 - face_mask_3ch))
-            blended_face = blended_face.astype(np.uint8)
-            
-            # 创建输出图像
-            result = frame.copy()
-            result[y:y+h, x:x+w] = blended_face
-            
-            # 应用颜色校正
-            if self.color_correction_var.get():
-                try:
-                    # 创建全局掩码
-                    global_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-                    global_mask[y:y+h, x:x+w] = face_mask
-                    
-                    # 应用颜色校正
-                    result = self.enhanced_color_correct(result, orig_frame, global_mask)
-                    # 确保颜色校正后的图像是8位无符号整数类型
-                    result = result.astype(np.uint8)
-                except Exception as e:
-                    print(f"颜色校正出错: {e}")
-                    # 确保结果是8位无符号整数类型
-                    result = result.astype(np.uint8)
-            
-            # 确保result和orig_frame类型一致后再比较
-            result = result.astype(np.uint8)
-            orig_frame = orig_frame.astype(np.uint8)
-            
-            # 使用整体图像的差异来验证替换是否有效
-            diff = cv2.absdiff(result, orig_frame)
-            mean_diff = np.mean(diff)
-            
-            print(f"简化替换方法的平均差异: {mean_diff}")
-            
-            # 如果差异太小，可能替换效果不明显，强化替换效果
-            if mean_diff < 5:
-                print("简化替换效果不明显，尝试直接复制人脸")
-                
-                # 直接复制目标人脸到源位置
-                # 但仍保持边缘平滑过渡
-                global_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-                cv2.ellipse(global_mask, (x + w//2, y + h//2), 
-                           (int(w * 0.45), int(h * 0.55)), 0, 0, 360, 255, -1)
-                
-                # 应用高斯模糊
-                global_mask = cv2.GaussianBlur(global_mask, (31, 31), 11)
-                
-                # 创建3通道掩码
-                mask_3ch = cv2.merge([global_mask, global_mask, global_mask])
-                mask_float = mask_3ch.astype(float) / 255.0
-                
-                # 创建包含目标人脸的图像
-                face_area = np.zeros_like(frame, dtype=np.float32)
-                face_area[y:y+h, x:x+w] = target_face_resized
-                
-                # 确保类型一致性
-                orig_frame_float = orig_frame.astype(np.float32)
-                
-                # 在全图范围内进行混合
-                result = (face_area * mask_float + 
-                         orig_frame_float * (1 - mask_float)).astype(np.uint8)
-                
-                # 加强效果 - 增加目标人脸的对比度
-                face_only = result[y:y+h, x:x+w].copy()
-                # 应用对比度增强
-                face_contrast = cv2.addWeighted(face_only, 1.2, face_only, 0, 0)
-                result[y:y+h, x:x+w] = face_contrast
-                
-                # 应用颜色校正
-                if self.color_correction_var.get():
-                    try:
-                        result = self.enhanced_color_correct(result, orig_frame, global_mask)
-                        # 确保颜色校正后的图像是8位无符号整数类型
-                        result = result.astype(np.uint8)
-                    except Exception as e:
-                        print(f"颜色校正出错: {e}")
-                        # 确保结果是8位无符号整数类型
-                        result = result.astype(np.uint8)
-            
-            # 保存调试图像
-            debug_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "debug")
-            os.makedirs(debug_dir, exist_ok=True)
-            cv2.imwrite(os.path.join(debug_dir, "simple_swap_result.jpg"), result)
-            cv2.imwrite(os.path.join(debug_dir, "simple_swap_orig.jpg"), orig_frame)
-            cv2.imwrite(os.path.join(debug_dir, "simple_swap_mask.jpg"), global_mask if 'global_mask' in locals() else face_mask)
-            
-            # 最终确保返回的是8位无符号整数类型
-            return result.astype(np.uint8)
-            
-        except Exception as e:
-            print(f"简化人脸替换方法失败: {e}")
-            import traceback
-            traceback.print_exc()
-            # 失败时返回原始帧，确保是8位无符号整数类型
-            return frame.astype(np.uint8)
-    
-    def enhanced_color_correct(self, target_img, source_img, mask):
-        """增强版的颜色校正函数"""
-        try:
-            # 确保掩码是正确的类型和大小
-            if mask.shape[:2] != target_img.shape[:2]:
-                print(f"掩码大小 {mask.shape} 与目标图像大小 {target_img.shape[:2]} 不匹配")
-                mask = cv2.resize(mask, (target_img.shape[1], target_img.shape[0]))
-            
-            # 使用掩码获取前景和背景区域
-            fg_mask = mask > 10  # 将掩码转换为布尔值
-            bg_mask = ~fg_mask
-            
-            # 检查掩码是否有效
-            if not np.any(fg_mask):
-                print("颜色校正: 掩码中没有前景区域")
-                return target_img.astype(np.uint8)
-                
-            # 分离RGB通道
-            target_channels = cv2.split(target_img)
-            source_channels = cv2.split(source_img)
-            
-            result_channels = []
-            
-            # 对每个通道单独进行处理
-            for i, (target_channel, source_channel) in enumerate(zip(target_channels, source_channels)):
-                # 计算前景和背景区域的均值和标准差
-                fg_mean, fg_std = cv2.meanStdDev(source_channel, mask=mask)
-                target_mean, target_std = cv2.meanStdDev(target_channel, mask=mask)
-                
-                # 防止除以零或很小的值
-                target_std = max(target_std[0][0], 1e-3)
-                fg_std = max(fg_std[0][0], 1e-3)
-                
-                # 对目标图像进行颜色校正
-                target_channel = target_channel.astype(np.float32)
-                
-                # 标准化，然后调整到源图像的分布
-                normalized = (target_channel - target_mean[0][0]) / target_std
-                corrected = normalized * fg_std + fg_mean[0][0]
-                
-                # 确保值在有效范围内
-                corrected = np.clip(corrected, 0, 255).astype(np.uint8)
-                
-                # 根据掩码融合校正后的图像和原始图像
-                blended = np.zeros_like(target_channel)
-                blended[fg_mask] = corrected[fg_mask]
-                blended[bg_mask] = target_channel[bg_mask]
-                
-                result_channels.append(blended)
-                
-            # 合并通道
-            result = cv2.merge(result_channels)
-            
-            # 确保返回类型是8位无符号整数
-            return result.astype(np.uint8)
-        except Exception as e:
-            print(f"增强颜色校正时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            return target_img.astype(np.uint8)  # 如果出错，返回原始图像
-
-    def find_point_index(self, points, point):
-        """在点列表中找到距离给定点最近的点的索引"""
-        for i, p in enumerate(points):
-            if abs(p[0] - point[0]) < 5 and abs(p[1] - point[1]) < 5:
-                return i
-        return -1
-
-    def write_frames_in_order(self, out, frames_buffer, next_frame_to_write):
-        """按顺序写入已处理的视频帧，返回下一个要写入的帧索引"""
-        # 复制一份帧缓冲区的键，并进行排序
-        keys = sorted(list(frames_buffer.keys()))
-        
-        # 确保有需要写入的帧
-        if not keys:
-            return next_frame_to_write
-        
-        # 找出连续的帧并写入
-        while keys and keys[0] == next_frame_to_write:
-            # 写入帧并从缓冲区中移除
-            frame = frames_buffer.pop(keys[0])
-            
-            # 确保帧是有效的
-            if frame is not None and frame.size > 0:
-                try:
-                    out.write(frame)
-                except Exception as e:
-                    logger.error(f"写入帧 {next_frame_to_write} 时出错: {e}")
-            else:
-                logger.error(f"帧 {next_frame_to_write} 无效，跳过")
-            
-            # 更新下一个要写入的帧索引
-            next_frame_to_write += 1
-            
-            # 从排序后的键列表中移除已处理的键
-            keys.pop(0)
-        
-        # 更新进度条
-        if hasattr(self, 'progress_var'):
-            # 安全获取total_frames属性
-            total_frames = getattr(self, 'total_frames', 0)
-            if total_frames > 0:
-                progress_value = min(100, int((next_frame_to_write / total_frames) * 100))
-                self.progress_var.set(progress_value)
-                # 更新进度标签
-                progress_text = f"{progress_value}%"
-                self.root.after(0, lambda t=progress_text: self.progress_label.config(text=t))
-                
-                # 更新状态文本
-                status_text = f"处理中... {progress_value}%"
-                self.root.after(0, lambda t=status_text: self.status_var.set(t))
-                
-        return next_frame_to_write
-
-    def shape_to_np(self, shape):
-        """将dlib的shape转换为numpy数组"""
-        coords = np.zeros((68, 2), dtype=np.int32)
-        for i in range(0, 68):
-            coords[i] = (shape.part(i).x, shape.part(i).y)
-        return coords
-
-    def color_correct(self, target_img, source_img, mask):
-        """对目标图像进行颜色校正，使其与源图像的颜色匹配"""
-        try:
-            # 确保掩码是正确的类型和大小
-            if mask.shape[:2] != target_img.shape[:2]:
-                print(f"掩码大小 {mask.shape} 与目标图像大小 {target_img.shape[:2]} 不匹配")
-                # 调整掩码大小以匹配目标图像
-                mask = cv2.resize(mask, (target_img.shape[1], target_img.shape[0]))
-            
-            # 确保掩码是 CV_8U 类型
-            mask = mask.astype(np.uint8)
-            
-            # 转换为LAB颜色空间
-            target_lab = cv2.cvtColor(target_img, cv2.COLOR_BGR2LAB)
-            source_lab = cv2.cvtColor(source_img, cv2.COLOR_BGR2LAB)
-            
-            # 分离通道
-            target_l, target_a, target_b = cv2.split(target_lab)
-            source_l, source_a, source_b = cv2.split(source_lab)
-            
-            # 计算源图像的统计数据
-            source_l_mean, source_l_std = cv2.meanStdDev(source_l, mask=mask)
-            source_a_mean, source_a_std = cv2.meanStdDev(source_a, mask=mask)
-            source_b_mean, source_b_std = cv2.meanStdDev(source_b, mask=mask)
-            
-            # 计算目标图像的统计数据
-            target_l_mean, target_l_std = cv2.meanStdDev(target_l, mask=mask)
-            target_a_mean, target_a_std = cv2.meanStdDev(target_a, mask=mask)
-            target_b_mean, target_b_std = cv2.meanStdDev(target_b, mask=mask)
-            
-            # 防止除以零
-            target_l_std = np.maximum(target_l_std, 1e-5)
-            target_a_std = np.maximum(target_a_std, 1e-5)
-            target_b_std = np.maximum(target_b_std, 1e-5)
-            
-            # 调整目标图像的亮度和颜色 - 确保使用 float32 而不是 float64
-            target_l = target_l.astype(np.float32)
-            target_a = target_a.astype(np.float32)
-            target_b = target_b.astype(np.float32)
-            
-            # 计算调整后的值
-            l_adjusted = ((target_l - target_l_mean[0][0]) * (source_l_std[0][0] / target_l_std[0][0])) + source_l_mean[0][0]
-            a_adjusted = ((target_a - target_a_mean[0][0]) * (source_a_std[0][0] / target_a_std[0][0])) + source_a_mean[0][0]
-            b_adjusted = ((target_b - target_b_mean[0][0]) * (source_b_std[0][0] / target_b_std[0][0])) + source_b_mean[0][0]
-            
-            # 确保值在有效范围内
-            l_adjusted = np.clip(l_adjusted, 0, 255).astype(np.uint8)
-            a_adjusted = np.clip(a_adjusted, 0, 255).astype(np.uint8)
-            b_adjusted = np.clip(b_adjusted, 0, 255).astype(np.uint8)
-            
-            # 合并通道
-            target_lab = cv2.merge([l_adjusted, a_adjusted, b_adjusted])
-            
-            # 转换回BGR颜色空间
-            target_corrected = cv2.cvtColor(target_lab, cv2.COLOR_LAB2BGR)
-            
-            # 使用掩码应用颜色校正
-            # 创建三通道掩码
-            mask_3channel = np.stack([mask, mask, mask], axis=2)
-            
-            # 确保掩码和图像大小匹配
-            if mask_3channel.shape != target_corrected.shape:
-                print(f"三通道掩码大小 {mask_3channel.shape} 与目标图像大小 {target_corrected.shape} 不匹配")
-                return target_img.astype(np.uint8)
-            
-            # 使用掩码应用颜色校正
-            result = np.zeros_like(target_img)
-            cv2.bitwise_and(target_corrected, mask_3channel, result)
-            
-            # 创建反向掩码
-            inverse_mask = cv2.bitwise_not(mask)
-            inverse_mask_3channel = np.stack([inverse_mask, inverse_mask, inverse_mask], axis=2)
-            
-            # 应用反向掩码到原始图像
-            background = np.zeros_like(target_img)
-            cv2.bitwise_and(target_img, inverse_mask_3channel, background)
-            
-            # 合并结果
-            final_result = cv2.add(result, background)
-            
-            # 确保返回类型是8位无符号整数
-            return final_result.astype(np.uint8)
-        except Exception as e:
-            print(f"颜色校正时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            return target_img.astype(np.uint8)  # 如果出错，返回原始图像
-
     def preview_frame(self):
         """预览当前帧的人脸替换效果"""
         if not self.video_path or not self.face_images:
@@ -2256,22 +955,22 @@ class FaceSwapApp:
         progress_label = ttk.Label(preview_window, text="正在处理...", style="TLabel")
         progress_label.pack(pady=10)
         
-                # 在后台线程中处理图像
+        # 在后台线程中处理图像
         def process_preview():
             try:
                 # 获取视频的中间帧
                 cap = cv2.VideoCapture(self.video_path)
                 total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            middle_frame = total_frames // 2
+                middle_frame = total_frames // 2
                 cap.set(cv2.CAP_PROP_POS_FRAMES, middle_frame)
                 ret, frame = cap.read()
                 cap.release()
-            
-            if not ret:
-                messagebox.showerror("错误", "无法读取视频帧")
+                
+                if not ret:
+                    messagebox.showerror("错误", "无法读取视频帧")
                     preview_window.destroy()
-                return
-            
+                    return
+                
                 # 显示原始图像
                 original_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 original_img = Image.fromarray(original_frame)
@@ -2284,7 +983,7 @@ class FaceSwapApp:
                 original_label.pack(side=tk.LEFT, padx=10, pady=10)
                 
                 # 处理图像
-                processed_frame = self.process_frame(frame)
+                processed_frame = self.process_single_frame(frame)
                 
                 if processed_frame is not None:
                     # 显示处理后的图像
@@ -2313,9 +1012,9 @@ class FaceSwapApp:
                     save_btn.pack(pady=10)
                     
                     progress_label.config(text="处理完成")
-                    else:
+                else:
                     progress_label.config(text="处理失败 - 未能检测到人脸或应用替换")
-        except Exception as e:
+            except Exception as e:
                 logger.error(f"预览处理错误: {str(e)}")
                 progress_label.config(text=f"处理错误: {str(e)}")
     
@@ -2331,90 +1030,6 @@ class FaceSwapApp:
         new_height = int(height * scale)
         return image.resize((new_width, new_height), Image.LANCZOS)
 
-    def process_frame_traditional(self, frame, target_image_rgb, target_landmarks, detector_choice, use_multi_scale):
-        """使用传统方法处理单个视频帧"""
-        try:
-            # 转换帧到RGB格式以供处理
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # 检测人脸
-            landmarks = None
-            
-            if detector_choice == "dlib":
-                # 使用dlib人脸检测器
-                upsample = 1 if use_multi_scale else 0
-                faces = self.detector(rgb_frame, upsample)
-                
-                if len(faces) == 0:
-                    # 如果未检测到人脸，返回原始帧
-                    return frame
-                
-                # 从第一个检测到的人脸获取特征点
-                try:
-                    shape = self.predictor(rgb_frame, faces[0])
-                    landmarks = self.shape_to_np(shape)
-                except Exception as lm_e:
-                    logger.error(f"dlib提取特征点失败: {lm_e}")
-                    return frame
-            else:
-                # 使用OpenCV人脸检测器
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-                
-                if len(faces) == 0:
-                    # 如果未检测到人脸，返回原始帧
-                    return frame
-                
-                # 从第一个检测到的人脸获取特征点
-                try:
-                    (x, y, w, h) = faces[0]
-                    face_gray = gray[y:y+h, x:x+w]
-                    face_roi = rgb_frame[y:y+h, x:x+w]
-                    
-                    # 首先尝试使用dlib特征点检测
-                    rect = dlib.rectangle(x, y, x+w, y+h)
-                    shape = self.predictor(rgb_frame, rect)
-                    landmarks = self.shape_to_np(shape)
-                except Exception as cv_lm_e:
-                    logger.error(f"OpenCV+dlib提取特征点失败: {cv_lm_e}")
-                    return frame
-            
-            # 如果未找到有效的特征点，返回原始帧
-            if landmarks is None or len(landmarks) == 0:
-                logger.warning("未能提取有效的面部特征点")
-                return frame
-            
-            # 选择换脸方法 - 高级或简单
-            try:
-                if self.swap_method_var.get() == "advanced":
-                    result = self.advanced_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks)
-                else:
-                    result = self.simple_face_swap(frame, rgb_frame, landmarks, target_image, target_landmarks)
-                
-                # 应用颜色校正
-                if self.color_correction_var.get():
-                    # 创建基于特征点的掩码
-                    mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-                    hull = cv2.convexHull(landmarks)
-                    cv2.fillConvexPoly(mask, hull, 255)
-                    
-                    # 确保掩码有效
-                    if np.sum(mask) > 0:
-                        result = self.color_correct(result, frame, mask)
-                
-                return result
-            except Exception as swap_e:
-                logger.error(f"执行人脸替换时出错: {swap_e}")
-                import traceback
-                traceback.print_exc()
-                return frame
-                
-        except Exception as e:
-            logger.error(f"传统方法处理帧时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            return frame
-
 def main():
     try:
         # 确保环境变量已设置
@@ -2496,7 +1111,8 @@ if __name__ == "__main__":
     # 检查环境
     try:
         # 首先导入所需的库，检查它们是否可用
-        import_modules = ["dlib", "cv2", "PIL", "moviepy"]
+        # dlib和InsightFace由引擎在使用时加载，缺少时只影响对应的换脸方法
+        import_modules = ["cv2", "PIL"]
         missing_modules = []
         
         for module in import_modules:
@@ -1,13 +1,11 @@
 import os
 import sys
 import time
-import cv2
-import numpy as np
-import dlib
-import concurrent.futures
-from moviepy.editor import VideoFileClip
-import insightface
 import logging
+import argparse
+
+from progress_reporter import CliProgressBar, JsonLinesSink
+from face_analysers import parse_det_size
 
 # 设置环境变量，解决OpenMP冲突问题
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
@@ -24,6 +22,7 @@ output_folder = os.path.join(base_dir, "output_videos")
 # 确保文件夹存在
 os.makedirs(models_folder, exist_ok=True)
 os.makedirs(output_folder, exist_ok=True)
+os.makedirs(os.path.join(base_dir, "logs"), exist_ok=True)
 
 # 配置日志
 logging.basicConfig(
@@ -36,318 +35,184 @@ logging.basicConfig(
 )
 logger = logging.getLogger("face_swap_cli")
 
-def initialize_models():
-    """初始化所有模型"""
-    models = {}
-    
-    # 初始化路径
-    cascade_path = os.path.join(models_folder, "haarcascade_frontalface_default.xml")
-    predictor_path = os.path.join(models_folder, "shape_predictor_68_face_landmarks.dat")
-    inswapper_path = os.path.join(models_folder, "inswapper_128.onnx")
-    
-    # 初始化OpenCV级联分类器
-    if os.path.exists(cascade_path):
-        models['face_cascade'] = cv2.CascadeClassifier(cascade_path)
-        logger.info("成功加载级联分类器")
-    else:
-        logger.warning(f"未找到级联分类器文件: {cascade_path}")
-        models['face_cascade'] = None
-    
-    # 初始化dlib检测器
-    models['detector'] = dlib.get_frontal_face_detector()
-    
-    # 初始化dlib特征点预测器
-    if os.path.exists(predictor_path):
-        try:
-            models['predictor'] = dlib.shape_predictor(predictor_path)
-            logger.info("成功加载特征点预测模型")
-        except Exception as e:
-            logger.error(f"加载特征点预测模型失败: {e}")
-            models['predictor'] = None
-    else:
-        logger.warning(f"特征点预测模型文件不存在: {predictor_path}")
-        models['predictor'] = None
-    
-    # 初始化InsightFace模型
-    if os.path.exists(inswapper_path):
-        try:
-            # 设置模型目录
-            buffalo_dir = os.path.join(models_folder, 'buffalo_l')
-            if not os.path.exists(buffalo_dir):
-                os.makedirs(buffalo_dir, exist_ok=True)
-                logger.info(f"已创建buffalo_l目录: {buffalo_dir}")
-                
-            # 初始化face_analyser
-            # 强制禁用下载
-            os.environ['INSIGHTFACE_ALLOW_LOCAL_MODEL'] = '1'
-            
-            # 直接使用已安装的模型，不进行下载
-            try:
-                models['face_analyser'] = insightface.app.FaceAnalysis(
-                    name="buffalo_l", 
-                    root=models_folder,
-                    providers=['CPUExecutionProvider'],
-                    allowed_modules=['detection', 'recognition'],
-                    download=False
-                )
-                models['face_analyser'].prepare(ctx_id=0, det_size=(640, 640))
-            except Exception as e:
-                logger.warning(f"使用download=False初始化失败: {e}")
-                
-                # 尝试直接加载buffalo_l/onnx目录下的模型文件
-                if os.path.exists(os.path.join(buffalo_dir, 'onnx')):
-                    logger.info("尝试直接使用已下载的模型文件")
-                    models['face_analyser'] = insightface.app.FaceAnalysis(
-                        name="buffalo_l", 
-                        root=models_folder,
-                        providers=['CPUExecutionProvider'],
-                        allowed_modules=['detection']
-                    )
-                    models['face_analyser'].prepare(ctx_id=0, det_size=(640, 640))
-                else:
-                    logger.warning("无法找到buffalo_l/onnx目录，人脸分析器初始化失败")
-                    models['face_analyser'] = None
-            
-            # 初始化inswapper
-            models['inswapper'] = insightface.model_zoo.get_model(
-                inswapper_path, 
-                providers=['CPUExecutionProvider']
-            )
-            logger.info(f"成功加载InsightFace ONNX模型: {inswapper_path}")
-        except Exception as e:
-            logger.error(f"初始化InsightFace模型时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            models['face_analyser'] = None
-            models['inswapper'] = None
-    else:
-        logger.warning(f"InsightFace模型文件不存在: {inswapper_path}")
-        models['face_analyser'] = None
-        models['inswapper'] = None
-    
-    return models
+def create_app(args):
+    """
+    创建无界面的FaceSwapEngine，命令行与图形界面使用同一个处理引擎
 
-def shape_to_np(shape):
-    """将dlib的shape转换为numpy数组"""
-    coords = np.zeros((shape.num_parts, 2), dtype="int")
-    for i in range(0, shape.num_parts):
-        coords[i] = (shape.part(i).x, shape.part(i).y)
-    return coords
+    视频帧从 cv2.VideoCapture 读出后始终是BGR uint8，直接交给换脸流水线，
+    再以bgr24原始数据写入ffmpeg，整个过程没有浮点转换和RGB/BGR往返。
+    """
+    from engine import FaceSwapEngine
 
-def insightface_face_swap(frame, source_img, models):
-    """使用InsightFace进行人脸替换"""
-    if models['face_analyser'] is None or models['inswapper'] is None:
-        logger.error("InsightFace模型未初始化")
-        # 返回原始帧，不进行处理
-        return frame
-    
-    try:
-        # 检测原始帧中的人脸
-        frame_faces = models['face_analyser'].get(frame)
-        if len(frame_faces) == 0:
-            logger.warning("未在视频帧中检测到人脸")
-            return frame
-        
-        # 检测源图片中的人脸
-        source_faces = models['face_analyser'].get(source_img)
-        if len(source_faces) == 0:
-            logger.warning("未在源图片中检测到人脸")
-            return frame
-        
-        # 获取源图片中最大的人脸
-        source_face = sorted(source_faces, key=lambda x: x.bbox[2] - x.bbox[0], reverse=True)[0]
-        
-        # 对每个目标人脸进行替换
-        result = frame.copy()
-        for target_face in frame_faces:
-            # 使用InsightFace的模型进行人脸交换
-            result = models['inswapper'].get(result, target_face, source_face, paste_back=True)
-        
-        return result
-    except Exception as e:
-        logger.error(f"InsightFace人脸替换失败: {e}")
-        return frame
+    app = FaceSwapEngine()
+    apply_options(app, args)
+    return app
 
-def dlib_face_swap(frame, source_img, models):
-    """使用dlib进行基本人脸检测"""
-    if not models['detector'] or not models['predictor']:
-        logger.error("Dlib模型未初始化")
-        return frame
-    
-    try:
-        # 使用dlib检测人脸
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = models['detector'](gray_frame)
-        
-        if len(faces) == 0:
-            logger.warning("未在视频帧中检测到人脸")
-            return frame
-        
-        # 检测源图片中的人脸
-        gray_source = cv2.cvtColor(source_img, cv2.COLOR_BGR2GRAY)
-        source_faces = models['detector'](gray_source)
-        
-        if len(source_faces) == 0:
-            logger.warning("未在源图片中检测到人脸")
-            return frame
-        
-        # 在这里，我们只是在检测到的人脸上绘制一个矩形框
-        result = frame.copy()
-        for face in faces:
-            x1, y1 = face.left(), face.top()
-            x2, y2 = face.right(), face.bottom()
-            cv2.rectangle(result, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            # 获取面部特征点
-            landmarks = models['predictor'](gray_frame, face)
-            points = shape_to_np(landmarks)
-            
-            # 绘制特征点
-            for (x, y) in points:
-                cv2.circle(result, (x, y), 2, (0, 0, 255), -1)
-        
-        return result
-    except Exception as e:
-        logger.error(f"Dlib人脸检测失败: {e}")
-        return frame
+def apply_options(app, args):
+    """把命令行选项设置到应用上，批处理时每个任务用各自的选项调用一次"""
+    # 处理选项，与Qt界面一样直接设置为普通值
+    use_inswapper = args.swapper == "inswapper"
+    if use_inswapper and (app.inswapper is None or app.face_analyser is None):
+        logger.warning("InsightFace模型不可用，改用传统方法")
+        use_inswapper = False
+    app.swapper_var = "inswapper" if use_inswapper else "traditional"
+    app.swap_method_var = args.swap_method
+    app.detector_var = args.detector
+    app.color_correction_var = not args.no_color_correction
+    app.multi_scale_var = True
+    app.smoothing_var = args.smoothing
+    app.face_tracking_var = args.tracking
+    app.keyframe_interval = args.keyframe_interval
+    app.frame_gate_var = args.reuse_static
+    app.static_frame_threshold = args.static_threshold
+    app.scene_cut_threshold = args.scene_threshold
+    app.process_pool_var = args.process_pool
+    app.swap_batch_size = args.batch_size
+    app.detection_max_side = args.detection_size
+    app.det_size = args.det_size
+    app.debug_capture_mode = args.debug_capture
+    app.debug_capture_interval = args.debug_interval
 
-def process_video(video_path, face_img_path, output_path, models):
-    """处理视频的主函数"""
+    # 编码选项
+    app.video_encoder = args.encoder
+    app.encoder_codec = args.codec
+    app.encoder_crf = args.crf
+    app.encoder_preset = args.preset
+    app.encoder_threads = args.encoder_threads
+    app.keep_audio = not args.no_audio
+    app.segment_seconds = args.segment_seconds
+    app.keep_segments = args.keep_segments
+    app.segment_workers = args.segment_workers
+
+def process_video(app, video_path, face_img_path, output_path, sinks=()):
+    """处理视频，sinks为额外的进度输出端；成功时返回实际输出路径，失败返回False"""
     if not os.path.exists(video_path):
         logger.error(f"视频文件不存在: {video_path}")
         return False
-    
+
     if not os.path.exists(face_img_path):
         logger.error(f"人脸图片不存在: {face_img_path}")
         return False
-    
+
+    app.video_path = video_path
+    app.face_images = [face_img_path]
+    app.selected_face_index = 0
+    app.output_path = output_path
+
+    reporter = app.progress_reporter
+    added = [reporter.add_sink(sink) for sink in sinks]
     try:
-        # 读取源人脸图片
-        source_img = cv2.imread(face_img_path)
-        if source_img is None:
-            logger.error(f"无法读取源人脸图片: {face_img_path}")
-            return False
-        
-        # 调整源图片大小
-        max_height = 720
-        h, w = source_img.shape[:2]
-        if h > max_height:
-            scale = max_height / h
-            source_img = cv2.resize(source_img, (int(w * scale), max_height))
-        
-        # 打开视频
-        clip = VideoFileClip(video_path)
-        
-        # 设置进度回调函数
-        total_frames = int(clip.fps * clip.duration)
-        processed_frames = 0
-        
-        def process_frame(frame):
-            nonlocal processed_frames
-            processed_frames += 1
-            if processed_frames % 10 == 0:
-                progress = processed_frames / total_frames * 100
-                print(f"处理进度: {progress:.2f}% ({processed_frames}/{total_frames})", end="\r")
-            
-            # 转换为OpenCV格式
-            frame_cv = (frame * 255).astype(np.uint8)
-            frame_cv = cv2.cvtColor(frame_cv, cv2.COLOR_RGB2BGR)
-            
-            # 尝试使用InsightFace进行人脸替换
-            if models['face_analyser'] is not None and models['inswapper'] is not None:
-                result_cv = insightface_face_swap(frame_cv, source_img, models)
-            else:
-                # 如果InsightFace不可用，则使用dlib进行基本人脸检测
-                result_cv = dlib_face_swap(frame_cv, source_img, models)
-            
-            # 转换回MoviePy格式
-            result = cv2.cvtColor(result_cv, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
-            
-            return result
-        
-        # 处理视频
-        logger.info(f"开始处理视频: {video_path}")
-        new_clip = clip.fl_image(process_frame)
-        
-        # 保存结果
-        logger.info(f"正在保存结果视频到: {output_path}")
-        
-        # 使用临时文件先保存
-        temp_output = os.path.splitext(output_path)[0] + "_temp.mp4"
-        try:
-            new_clip.write_videofile(temp_output, codec='libx264', audio_codec='aac')
-            
-            # 检查临时文件的有效性
-            if not os.path.exists(temp_output):
-                logger.error(f"临时视频文件未能创建: {temp_output}")
-                return False
-                
-            temp_file_size = os.path.getsize(temp_output)
-            if temp_file_size < 1000:  # 小于1KB的视频文件很可能是无效的
-                logger.error(f"临时视频文件大小异常: {temp_file_size} 字节")
-                return False
-                
-            # 检查通过，重命名为最终文件名
-            if os.path.exists(output_path):
-                os.remove(output_path)
-            os.rename(temp_output, output_path)
-        except Exception as e:
-            logger.error(f"保存视频时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            
-            # 清理临时文件
-            if os.path.exists(temp_output):
-                os.remove(temp_output)
-            return False
-        
-        # 清理资源
-        clip.close()
-        new_clip.close()
-        
-        logger.info(f"视频处理完成: {output_path}")
-        return True
-    
-    except Exception as e:
-        logger.error(f"处理视频时出错: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+        return app.process_video()
+    finally:
+        for sink in added:
+            reporter.remove_sink(sink)
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="命令行视频换脸")
+    parser.add_argument("video_path", help="视频文件路径")
+    parser.add_argument("face_img_path", help="人脸图片路径")
+    parser.add_argument("output_path", nargs="?", default=None, help="输出视频路径(可选)")
+    add_option_arguments(parser)
+
+    group = parser.add_argument_group("进度输出")
+    group.add_argument("--progress-json", metavar="PATH",
+                       help="以JSON Lines格式把进度写入文件，'-' 表示标准输出")
+    group.add_argument("--no-progress-bar", action="store_true", help="不在终端显示进度条")
+    return parser.parse_args(argv)
+
+def det_size_argument(value):
+    """--det-size 的参数类型，无效的尺寸在解析命令行或校验任务选项时就报错"""
+    try:
+        return parse_det_size(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def add_option_arguments(parser):
+    """添加换脸和编码选项，单个视频和批处理共用"""
+    group = parser.add_argument_group("换脸选项")
+    group.add_argument("--swapper", choices=["inswapper", "traditional"], default="inswapper",
+                       help="换脸方法，InsightFace不可用时自动使用传统方法")
+    group.add_argument("--swap-method", choices=["advanced", "simple"], default="advanced", help="传统方法的替换方式")
+    group.add_argument("--detector", choices=["dlib", "opencv"], default="dlib", help="传统方法的人脸检测器")
+    group.add_argument("--detection-size", type=int, default=960,
+                       help="传统方法检测人脸时把帧的长边缩小到该像素数，0表示使用原始分辨率")
+    group.add_argument("--smoothing", type=int, choices=range(0, 101), default=50, metavar="0-100",
+                       help="传统方法人脸边缘的羽化程度，每10对应1像素的羽化半径，0表示不羽化")
+    group.add_argument("--no-color-correction", action="store_true", help="关闭颜色校正")
+    group.add_argument("--tracking", action="store_true", help="关键帧检测+光流跟踪代替逐帧检测")
+    group.add_argument("--keyframe-interval", type=int, default=5, help="跟踪模式下完整检测的间隔帧数")
+    group.add_argument("--det-size", type=det_size_argument, default="auto", metavar="auto|N|WxH",
+                       help="inswapper目标帧检测尺寸(32的倍数的正方形)，auto表示按视频前几帧的分辨率和人脸大小选择")
+    group.add_argument("--reuse-static", action="store_true", help="画面几乎不变的帧复用参考帧的人脸检测结果")
+    group.add_argument("--static-threshold", type=float, default=1.5, help="相似帧的缩略图平均灰度差阈值")
+    group.add_argument("--scene-threshold", type=float, default=30.0, help="镜头切换的缩略图平均灰度差阈值")
+    group.add_argument("--batch-size", type=int, default=8, help="inswapper批量推理的帧数")
+    group.add_argument("--process-pool", action="store_true", help="传统方法使用多进程处理帧")
+    group.add_argument("--debug-capture", choices=["off", "failures", "sample"], default="off",
+                       help="保存换脸中间结果到debug目录: 只保存失败帧或按间隔采样")
+    group.add_argument("--debug-interval", type=int, default=100, help="sample模式下保存中间结果的帧间隔")
+
+    group = parser.add_argument_group("编码选项")
+    group.add_argument("--encoder", choices=["auto", "ffmpeg", "opencv"], default="auto", help="视频写入方式")
+    group.add_argument("--codec", default="libx264", help="ffmpeg视频编码器")
+    group.add_argument("--crf", type=int, default=20, help="ffmpeg编码质量，越小质量越高")
+    group.add_argument("--preset", default="medium", help="ffmpeg编码速度预设")
+    group.add_argument("--encoder-threads", type=int, default=0, help="ffmpeg编码线程数，0表示自动")
+    group.add_argument("--no-audio", action="store_true", help="不复制原视频音轨")
+    group.add_argument("--segment-seconds", type=float, default=0,
+                       help="按该秒数分段处理，中断后重新运行同一命令会跳过已完成的片段，0表示不分段")
+    group.add_argument("--segment-workers", type=int, default=1,
+                       help="并行处理片段的工作进程数，未设置 --segment-seconds 时把视频均分为同样多的片段")
+    group.add_argument("--keep-segments", action="store_true", help="分段处理完成后保留片段文件和清单")
 
 def main():
     """命令行版本的主函数"""
-    # 初始化模型
-    logger.info("正在初始化模型...")
-    models = initialize_models()
-    
     # 获取命令行参数
-    if len(sys.argv) < 3:
-        print("使用方法: python face_swap_cli.py [视频文件路径] [人脸图片路径] [输出视频路径(可选)]")
-        return
-    
-    video_path = sys.argv[1]
-    face_img_path = sys.argv[2]
-    
+    args = parse_args()
+
+    video_path = args.video_path
+    face_img_path = args.face_img_path
+
     # 如果没有提供输出路径，则创建一个默认路径
-    if len(sys.argv) >= 4:
-        output_path = sys.argv[3]
+    if args.output_path:
+        output_path = args.output_path
     else:
         # 创建默认输出路径
         filename = os.path.basename(video_path)
         name_without_ext = os.path.splitext(filename)[0]
         output_path = os.path.join(output_folder, f"{name_without_ext}_swapped.mp4")
-    
-    print(f"视频文件: {video_path}")
-    print(f"人脸图片: {face_img_path}")
-    print(f"输出文件: {output_path}")
-    
+
+    # 提示信息都走日志(输出到stderr)，--progress-json - 时标准输出只有JSON Lines
+    logger.info(f"视频文件: {video_path}")
+    logger.info(f"人脸图片: {face_img_path}")
+    logger.info(f"输出文件: {output_path}")
+
+    # 初始化模型
+    logger.info("正在初始化模型...")
+    app = create_app(args)
+
+    # 进度输出端
+    sinks = []
+    if not args.no_progress_bar:
+        sinks.append(CliProgressBar())
+    json_sink = None
+    if args.progress_json:
+        json_sink = JsonLinesSink(sys.stdout if args.progress_json == "-" else args.progress_json)
+        sinks.append(json_sink)
+
     # 处理视频
-    success = process_video(video_path, face_img_path, output_path, models)
-    
-    if success:
-        print(f"\n处理完成! 结果已保存到: {output_path}")
+    try:
+        result = process_video(app, video_path, face_img_path, output_path, sinks)
+    finally:
+        if json_sink is not None:
+            json_sink.close()
+
+    if result:
+        logger.info(f"处理完成! 结果已保存到: {result}")
     else:
-        print("\n处理失败，请查看日志获取详细信息。")
+        logger.error("处理失败，请查看日志获取详细信息。")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -165,6 +165,10 @@ except ImportError as e:
     print(f"导入模块时出错: {e}")
     sys.exit(1)
 
+from source_face_cache import SourceFaceCache
+from face_analysers import create_target_analyser
+from reorder_buffer import ReorderBuffer
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -242,6 +246,9 @@ class FaceSwapApp:
         self.face_analyser = None
         self.inswapper = None
         
+        # 源人脸缓存，避免每帧重复解码和分析同一张源图片
+        self.source_face_cache = SourceFaceCache()
+        
         if INSIGHTFACE_AVAILABLE:
             try:
                 if os.path.exists(self.inswapper_path):
@@ -307,6 +314,9 @@ class FaceSwapApp:
         else:
             logger.warning("InsightFace模块不可用，请安装: pip install insightface onnx onnxruntime")
         
+        # 目标帧只需要检测框和关键点，使用共享检测模型的纯检测分析器
+        self.target_analyser = create_target_analyser(self.face_analyser)
+        
         # 初始化高级选项
         self.detection_confidence = 0.5  # 人脸检测置信度阈值
         self.multi_scale_detection = True  # 启用多尺度检测
@@ -859,13 +869,19 @@ class FaceSwapApp:
         # 在新线程中启动处理，以避免UI冻结
         threading.Thread(target=self.process_video, daemon=True).start()
     
-    def insightface_face_swap(self, frame, source_img):
-        """使用InsightFace进行人脸替换"""
+    def insightface_face_swap(self, frame, source_img=None, source_face=None):
+        """使用InsightFace进行人脸替换
+        
+        source_face为缓存的源人脸Face对象；未提供时才从source_img中分析
+        """
         try:
             if self.face_analyser is None or self.inswapper is None:
                 # 如果模型未加载，返回原始帧
                 return frame
             
+            if source_face is not None:
+                return self._swap_target_faces(frame, source_face)
+            
             # 将PIL图像转换为OpenCV格式
             try:
                 # 添加异常处理
@@ -917,12 +933,24 @@ class FaceSwapApp:
                 logger.error(f"分析源图像时出错: {e}")
                 return frame
             
-            # 选择第一张脸作为源脸
-            source_face = source_faces[0]
+            # 选择面积最大的脸作为源脸
+            source_face = SourceFaceCache.select_face(source_faces)
+            
+            return self._swap_target_faces(frame, source_face)
             
+        except Exception as e:
+            logger.error(f"InsightFace换脸过程出错: {e}")
+            import traceback
+            traceback.print_exc()
+            # 发生错误时返回原始帧
+            return frame
+    
+    def _swap_target_faces(self, frame, source_face):
+        """检测目标帧中的人脸并替换为源人脸"""
+        try:
             # 分析目标帧，检测人脸
             try:
-                target_faces = self.face_analyser.get(frame)
+                target_faces = self.target_analyser.get(frame)
                 if len(target_faces) == 0:
                     logger.warning("目标帧中未检测到人脸")
                     return frame
@@ -1034,21 +1062,14 @@ class FaceSwapApp:
             # 获取选中的人脸图片
             target_face_path = self.face_images[self.selected_face_index]
             
-            # 使用cv2直接读取人脸图片，避免PIL可能出现的问题
-            target_image = cv2.imread(target_face_path)
-            if target_image is None:
+            # 从源人脸缓存读取图片，同一张图片在多个任务间只解码一次
+            source_entry = self.source_face_cache.get(target_face_path)
+            if source_entry is None:
                 messagebox.showerror("错误", f"无法读取人脸图片: {target_face_path}")
                 return
-                
-            target_image_rgb = cv2.cvtColor(target_image, cv2.COLOR_BGR2RGB)
             
-            # 仅在需要使用PIL时才创建PIL对象
-            try:
-                source_image = Image.open(target_face_path)
-            except Exception as e:
-                logger.error(f"无法用PIL打开图像: {e}")
-                # 使用CV2图像作为后备
-                source_image = target_image
+            target_image = source_entry.image
+            target_image_rgb = cv2.cvtColor(target_image, cv2.COLOR_BGR2RGB)
 
             # 获取用户选择的人脸替换方法
             swapper_choice = self.swapper_var.get()
@@ -1065,6 +1086,13 @@ class FaceSwapApp:
                 swapper_choice = "traditional"
                 messagebox.showwarning("警告", "InsightFace模型未加载，将使用传统方法继续")
             
+            # 源人脸只在任务开始时分析一次，逐帧只分析目标帧
+            if can_use_insightface:
+                source_entry = self.source_face_cache.get(target_face_path, self.face_analyser)
+                if source_entry is None or source_entry.face is None:
+                    messagebox.showerror("错误", "在源图片中未检测到人脸")
+                    return
+            
             # 如果使用传统方法，需要提取特征点
             if swapper_choice == "traditional":
                 if self.predictor is None:
@@ -1161,20 +1189,20 @@ class FaceSwapApp:
                         # 根据选择的方法处理帧
                         if can_use_insightface:
                             # 使用InsightFace进行人脸替换
-                            return frame_idx, self.insightface_face_swap(frame, source_image)
+                            return frame_idx, self.insightface_face_swap(frame, source_face=source_entry.face)
                         else:
                             # 使用传统方法
                             return frame_idx, self.process_frame_traditional(
-                                frame, target_image_rgb, target_landmarks, detector_choice, use_multi_scale
+                                frame, target_image, target_landmarks, detector_choice, use_multi_scale
                             )
                     except Exception as e:
                         logger.error(f"处理帧 {frame_idx} 时出错: {e}")
                         return frame_idx, frame  # 返回原始帧
                 
                 # 提交初始批次的任务
-                futures = set()  # 使用集合而不是列表
-                frames_buffer = {}  # 用于存储处理好的帧
-                next_frame_to_write = 0  # 下一个要写入的帧索引
+                futures = {}  # future -> (帧索引, 原始帧)，处理失败时写出原始帧
+                # 按帧索引重排的环形缓冲区，窗口满时不再读入新帧
+                reorder = ReorderBuffer(max_workers * 4)
                 
                 # 跟踪成功处理的帧数
                 successful_frames = 0
@@ -1199,43 +1227,26 @@ class FaceSwapApp:
                     
                     # 提交处理任务
                     future = executor.submit(process_frame_task, (frame_count-1, frame))
-                    futures.add(future)  # 使用add而不是append
+                    futures[future] = (frame_count-1, frame)
                     
-                    # 如果积累了太多任务，等待一些完成
-                    if len(futures) > max_workers * 2:
-                        # 等待部分任务完成
-                        done, futures = concurrent.futures.wait(
-                            futures, 
+                    # 任务过多或重排窗口已满时，等待一些任务完成
+                    while futures and (len(futures) > max_workers * 2 or not reorder.can_accept(frame_count)):
+                        done, _ = concurrent.futures.wait(
+                            list(futures),
                             return_when=concurrent.futures.FIRST_COMPLETED
                         )
-                        
-                        # 处理完成的任务
                         for future in done:
-                            try:
-                                idx, processed = future.result()
-                                frames_buffer[idx] = processed
-                                successful_frames += 1
-                            except Exception as e:
-                                logger.error(f"处理帧结果时出错: {e}")
-                                # 如果无法获取结果，使用原始帧
-                                if 'idx' in locals():
-                                    frames_buffer[idx] = frame
+                            successful_frames += self.collect_frame_result(future, futures.pop(future), reorder)
                         
                         # 按顺序写入处理好的帧
-                        next_frame_to_write = self.write_frames_in_order(out, frames_buffer, next_frame_to_write)
+                        self.write_ready_frames(out, reorder)
                 
                 # 等待所有剩余任务完成
-                for future in concurrent.futures.as_completed(futures):
-                    try:
-                        idx, processed = future.result()
-                        frames_buffer[idx] = processed
-                        successful_frames += 1
-                    except Exception as e:
-                        logger.error(f"处理最终帧结果时出错: {e}")
-                        # 无法处理的情况下跳过
+                for future in concurrent.futures.as_completed(list(futures)):
+                    successful_frames += self.collect_frame_result(future, futures.pop(future), reorder)
                 
                 # 写入所有剩余的帧
-                self.write_frames_in_order(out, frames_buffer, next_frame_to_write)
+                self.write_ready_frames(out, reorder)
                 
                 # 释放资源
                 video.release()
@@ -2113,51 +2124,24 @@ class FaceSwapApp:
                 return i
         return -1
 
-    def write_frames_in_order(self, out, frames_buffer, next_frame_to_write):
-        """按顺序写入已处理的视频帧，返回下一个要写入的帧索引"""
-        # 复制一份帧缓冲区的键，并进行排序
-        keys = sorted(list(frames_buffer.keys()))
-        
-        # 确保有需要写入的帧
-        if not keys:
-            return next_frame_to_write
-        
-        # 找出连续的帧并写入
-        while keys and keys[0] == next_frame_to_write:
-            # 写入帧并从缓冲区中移除
-            frame = frames_buffer.pop(keys[0])
-            
-            # 确保帧是有效的
-            if frame is not None and frame.size > 0:
-                try:
-                    out.write(frame)
-                except Exception as e:
-                    logger.error(f"写入帧 {next_frame_to_write} 时出错: {e}")
-            else:
-                logger.error(f"帧 {next_frame_to_write} 无效，跳过")
-            
-            # 更新下一个要写入的帧索引
-            next_frame_to_write += 1
-            
-            # 从排序后的键列表中移除已处理的键
-            keys.pop(0)
-        
-        # 更新进度条
-        if hasattr(self, 'progress_var'):
-            # 安全获取total_frames属性
-            total_frames = getattr(self, 'total_frames', 0)
-            if total_frames > 0:
-                progress_value = min(100, int((next_frame_to_write / total_frames) * 100))
-                self.progress_var.set(progress_value)
-                # 更新进度标签
-                progress_text = f"{progress_value}%"
-                self.root.after(0, lambda t=progress_text: self.progress_label.config(text=t))
-                
-                # 更新状态文本
-                status_text = f"处理中... {progress_value}%"
-                self.root.after(0, lambda t=status_text: self.status_var.set(t))
-                
-        return next_frame_to_write
+    def collect_frame_result(self, future, frame_info, reorder):
+        """把一个帧任务的结果放入重排缓冲区，成功返回1，失败时放入原始帧并返回0"""
+        idx, original = frame_info
+        try:
+            _, processed = future.result()
+        except Exception as e:
+            logger.error(f"处理帧 {idx} 结果时出错: {e}")
+            processed = None
+        reorder.put(idx, processed, original=original)
+        return 1 if processed is not None else 0
+
+    def write_ready_frames(self, out, reorder):
+        """按顺序写入重排缓冲区中所有已就绪的帧"""
+        for idx, frame in reorder.pop_ready():
+            try:
+                out.write(frame)
+            except Exception as e:
+                logger.error(f"写入帧 {idx} 时出错: {e}")
 
     def shape_to_np(self, shape):
         """将dlib的shape转换为numpy数组"""
@@ -2344,8 +2328,8 @@ class FaceSwapApp:
         new_height = int(height * scale)
         return image.resize((new_width, new_height), Image.LANCZOS)
 
-    def process_frame_traditional(self, frame, target_image_rgb, target_landmarks, detector_choice, use_multi_scale):
-        """使用传统方法处理单个视频帧"""
+    def process_frame_traditional(self, frame, target_image, target_landmarks, detector_choice, use_multi_scale):
+        """使用传统方法处理单个视频帧，target_image 为缓存中的BGR源图像"""
         try:
             # 转换帧到RGB格式以供处理
             rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
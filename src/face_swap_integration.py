@@ -13,12 +13,14 @@ import traceback
 import threading
 from PyQt5.QtCore import QObject, pyqtSignal
 
+from progress_reporter import SignalSink
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("face_swap_integration")
 
 class FaceSwapProcessor(QObject):
-    """连接到face_swap_fixed中的处理逻辑"""
+    """连接到engine中的无界面换脸引擎"""
     
     # 定义信号
     progress_updated = pyqtSignal(int)
@@ -32,43 +34,19 @@ class FaceSwapProcessor(QObject):
         self.is_processing = False
         
     def initialize(self):
-        """初始化人脸替换功能"""
+        """初始化人脸替换功能，模型在处理第一个视频时按所选方法加载"""
         try:
-            # 导入face_swap_fixed模块
-            import face_swap_fixed
-            from face_swap_fixed import FaceSwapApp
-            
-            # 创建一个虚拟的Tkinter根窗口
-            class DummyTk:
-                def __init__(self):
-                    self.title = lambda x: None
-                    self.geometry = lambda x: None
-                    self.mainloop = lambda: None
-                    self.destroy = lambda: None
-                    self.quit = lambda: None
-                    self.withdraw = lambda: None
-                
-            # 初始化FaceSwapApp，但不运行主循环
-            dummy_root = DummyTk()
-            self.face_swap_app = FaceSwapApp(dummy_root)
-            
-            # 屏蔽UI相关的方法
-            self.face_swap_app.update_ui = lambda *args, **kwargs: None
-            self.face_swap_app.update_status = lambda *args, **kwargs: None
-            self.face_swap_app.update_progress = self._update_progress
-            
+            from engine import FaceSwapEngine
+
+            self.face_swap_app = FaceSwapEngine()
+            self.face_swap_app.progress_reporter.add_sink(SignalSink(self.progress_updated, self.status_updated))
+
             logger.info("成功初始化人脸替换功能")
             return True
         except Exception as e:
             logger.error(f"初始化人脸替换功能失败: {e}")
             logger.error(traceback.format_exc())
             return False
-            
-    def _update_progress(self, value, message=""):
-        """进度更新回调"""
-        self.progress_updated.emit(value)
-        if message:
-            self.status_updated.emit(message)
     
     def process_video(self, video_path, face_image_path, output_path, options=None):
         """处理视频"""
@@ -121,27 +99,23 @@ class FaceSwapProcessor(QObject):
             self.face_swap_app.output_path = output_path
             
             # 设置选项
-            if options["model"] == "InsightFace":
-                self.face_swap_app.use_insightface = True
-            else:
-                self.face_swap_app.use_insightface = False
+            self.face_swap_app.swapper_var = "inswapper" if options["model"] == "InsightFace" else "traditional"
                 
-            # 设置质量
+            # 设置质量，对应ffmpeg的编码质量和速度预设
             if options["quality"] == "高质量":
-                self.face_swap_app.quality_mode = "high"
+                self.face_swap_app.encoder_crf, self.face_swap_app.encoder_preset = 18, "slow"
             elif options["quality"] == "快速处理":
-                self.face_swap_app.quality_mode = "fast"
+                self.face_swap_app.encoder_crf, self.face_swap_app.encoder_preset = 23, "veryfast"
             else:
-                self.face_swap_app.quality_mode = "medium"
+                self.face_swap_app.encoder_crf, self.face_swap_app.encoder_preset = 20, "medium"
                 
-            # 其他选项
-            self.face_swap_app.smooth_faces = options["smooth_faces"]
-            self.face_swap_app.use_color_correction = options["color_correction"]
-            self.face_swap_app.enhance_output = options["enhance_quality"]
+            # 其他选项：面部平滑加大传统方法人脸边缘的羽化半径
+            self.face_swap_app.smoothing_var = 80 if options["smooth_faces"] else 50
+            self.face_swap_app.color_correction_var = options["color_correction"]
             
-            # 开始处理
+            # 开始处理，只加载所选方法需要的模型
             self.status_updated.emit("正在加载必要模型...")
-            if not self.face_swap_app.check_required_models():
+            if not self._load_models():
                 self.process_error.emit("无法加载必要的模型文件")
                 self.is_processing = False
                 return
@@ -168,6 +142,17 @@ class FaceSwapProcessor(QObject):
         finally:
             self.is_processing = False
             
+    def _load_models(self):
+        """加载所选换脸方法需要的模型，InsightFace不可用时改用传统方法"""
+        app = self.face_swap_app
+        if app.swapper_var == "inswapper":
+            if app.face_analyser is not None and app.inswapper is not None:
+                return True
+            logger.warning("InsightFace模型不可用，改用传统方法")
+            self.status_updated.emit("InsightFace模型不可用，改用传统方法")
+            app.swapper_var = "traditional"
+        return app.predictor is not None
+
 # 全局处理器实例
 processor = None
 
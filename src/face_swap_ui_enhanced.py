@@ -21,9 +21,12 @@ except ImportError:
     QMessageBox.critical(None, "错误", "未找到PyQt5 Multimedia插件，请确保安装了PyQt5.QtMultimedia")
     sys.exit(1)
 
-# 导入原始的人脸替换功能
+# 导入无界面的换脸引擎
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from face_swap import FaceSwapApp as OriginalFaceSwapApp
+from engine import FaceSwapEngine
+from face_library_store import refresh_library_async
+from progress_reporter import SignalSink
+from job_client import server_available
 
 class VideoProcessingThread(QThread):
     """视频处理线程，防止UI卡顿"""
@@ -32,9 +35,10 @@ class VideoProcessingThread(QThread):
     finished_signal = pyqtSignal(str)
     error_signal = pyqtSignal(str)
     
-    def __init__(self, face_swap_app, video_path, face_image_path, output_path):
+    def __init__(self, face_swap_app, video_path, face_image_path, output_path, use_server=False):
         super().__init__()
         self.face_swap_app = face_swap_app
+        self.use_server = use_server  # 交给任务队列服务处理，本进程不加载模型
         self.video_path = video_path
         self.face_image_path = face_image_path
         self.output_path = output_path
@@ -47,27 +51,18 @@ class VideoProcessingThread(QThread):
             self.face_swap_app.selected_face_index = 0
             self.face_swap_app.output_path = self.output_path
             
-            # 保存原始更新方法
-            original_update_progress = self.face_swap_app.update_progress
-            original_update_status = self.face_swap_app.update_status
+            # 通过限流后的进度报告器把进度和状态信号传递给UI
+            reporter = self.face_swap_app.progress_reporter
+            sink = reporter.add_sink(SignalSink(self.progress_signal, self.status_signal))
             
-            # 创建新的更新方法，将进度和状态信号传递给UI
-            def new_update_progress(value, text=None):
-                self.progress_signal.emit(int(value))
-                # 调用原始方法记录日志等操作
-                original_update_progress(value, text)
-                
-            def new_update_status(text):
-                self.status_signal.emit(text)
-                # 调用原始方法记录日志等操作
-                original_update_status(text)
-            
-            # 覆盖FaceSwapApp的方法
-            self.face_swap_app.update_progress = new_update_progress
-            self.face_swap_app.update_status = new_update_status
-            
-            # 调用原始处理方法
-            result = self.face_swap_app.process_video()
+            # 任务队列服务在运行时提交给服务，否则在本进程中处理
+            try:
+                if self.use_server:
+                    result = self.face_swap_app.process_video_via_server()
+                else:
+                    result = self.face_swap_app.process_video()
+            finally:
+                reporter.remove_sink(sink)
             
             # 处理完成后发送信号
             if result and isinstance(result, str) and os.path.exists(result):
@@ -149,10 +144,8 @@ class EnhancedFaceSwapUI(QMainWindow):
     def __init__(self):
         super().__init__()
         
-        # 初始化原始FaceSwapApp的实例
-        self.original_app = OriginalFaceSwapApp(None)
-        # 由于原始应用需要root参数，在这里手动设置一些关键属性
-        self.original_app.root = None  # 明确设置为None
+        # 换脸引擎，不依赖Tkinter，模型在第一次使用时加载
+        self.original_app = FaceSwapEngine()
         # 初始化必要的变量
         self.original_app.swap_method_var = "advanced"  # 默认使用高级替换方法
         self.original_app.color_correction_var = True   # 默认启用颜色校正
@@ -471,6 +464,14 @@ class EnhancedFaceSwapUI(QMainWindow):
         self.multi_scale_check = QCheckBox("启用多尺度人脸检测 (更精确但更慢)")
         self.multi_scale_check.setChecked(True)
         
+        # 人脸跟踪选项
+        self.face_tracking_check = QCheckBox("启用人脸跟踪 (关键帧检测，更快)")
+        self.face_tracking_check.setChecked(False)
+        
+        # 多进程选项
+        self.process_pool_check = QCheckBox("传统方法使用多进程处理 (多核更快)")
+        self.process_pool_check.setChecked(False)
+        
         # 人脸检测器选择
         detector_label = QLabel("人脸检测器:")
         self.detector_group = QButtonGroup(self)
@@ -514,6 +515,8 @@ class EnhancedFaceSwapUI(QMainWindow):
         advanced_layout.addLayout(detector_layout, 3, 1)
         advanced_layout.addWidget(swapper_label, 4, 0)
         advanced_layout.addLayout(swapper_layout, 4, 1)
+        advanced_layout.addWidget(self.face_tracking_check, 5, 0, 1, 2)
+        advanced_layout.addWidget(self.process_pool_check, 6, 0, 1, 2)
         
         right_layout.addWidget(advanced_group)
         
@@ -925,6 +928,9 @@ class EnhancedFaceSwapUI(QMainWindow):
                         item.setText(os.path.basename(file_path))
                         item.setSizeHint(QSize(150, 160))
                         self.face_list.addItem(item)
+            
+            # 后台增量更新人脸特征库，之后选择人脸只需查表
+            refresh_library_async(face_dir, lambda: self.original_app.face_analyser)
         except Exception as e:
             print(f"加载人脸图片失败: {e}")
             QMessageBox.warning(self, "警告", f"加载人脸图片失败: {e}")
@@ -1025,6 +1031,8 @@ class EnhancedFaceSwapUI(QMainWindow):
         self.original_app.detector_var = "dlib" if self.dlib_radio.isChecked() else "opencv"
         self.original_app.swapper_var = "inswapper" if self.inswapper_radio.isChecked() else "traditional"
         self.original_app.smoothing_var = self.smooth_slider.value()
+        self.original_app.face_tracking_var = self.face_tracking_check.isChecked()
+        self.original_app.process_pool_var = self.process_pool_check.isChecked()
         
         # 禁用处理按钮
         self.process_button.setEnabled(False)
@@ -1036,7 +1044,8 @@ class EnhancedFaceSwapUI(QMainWindow):
             self.original_app,
             self.selected_video_path,
             self.selected_face_path,
-            output_path
+            output_path,
+            use_server=server_available()
         )
         
         # 连接信号
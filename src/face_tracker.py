@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+关键帧人脸跟踪 - 每隔N帧或镜头切换时做完整检测，中间帧用光流跟踪5点关键点
+
+跟踪得到的Face对象保留原检测结果的所有字段，只更新bbox和kps，
+可以直接传给 inswapper.get。跟踪置信度下降时会自动触发重新检测。
+"""
+
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("face_tracker")
+
+
+class KeyframeFaceTracker:
+    """基于关键帧检测和金字塔LK光流的人脸跟踪器，必须按帧顺序调用"""
+
+    def __init__(self, keyframe_interval=5, scene_change_threshold=30.0,
+                 max_fb_error=2.0, min_track_ratio=0.8, track_scale=0.5):
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.scene_change_threshold = scene_change_threshold  # 缩略图平均灰度差超过该值视为镜头切换
+        self.max_fb_error = max_fb_error                      # 前后向光流误差上限(像素)
+        self.min_track_ratio = min_track_ratio                # 至少这么多关键点跟踪成功才认为可信
+        self.track_scale = track_scale                        # 在缩小的灰度图上计算光流
+
+        self._lk_params = dict(winSize=(21, 21), maxLevel=3,
+                               criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+        self.reset()
+
+    def reset(self):
+        """清空跟踪状态，下一帧将执行完整检测"""
+        self._faces = []
+        self._prev_gray = None
+        self._prev_thumb = None
+        self._frames_since_keyframe = 0
+        self.keyframes = 0
+        self.tracked_frames = 0
+
+    def _thumbnail(self, gray):
+        return cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA)
+
+    def _is_scene_change(self, thumb):
+        if self._prev_thumb is None:
+            return True
+        return float(np.mean(cv2.absdiff(thumb, self._prev_thumb))) > self.scene_change_threshold
+
+    def update(self, frame, detect_fn):
+        """
+        返回当前帧的人脸列表
+
+        detect_fn(frame) 执行完整检测并返回Face列表，只在关键帧、镜头切换
+        或跟踪失败时调用。
+        """
+        gray_full = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray_full, None, fx=self.track_scale, fy=self.track_scale,
+                          interpolation=cv2.INTER_AREA) if self.track_scale != 1.0 else gray_full
+        thumb = self._thumbnail(gray)
+
+        need_detect = (
+            not self._faces
+            or self._prev_gray is None
+            or self._frames_since_keyframe >= self.keyframe_interval
+            or self._is_scene_change(thumb)
+        )
+
+        faces = None
+        if not need_detect:
+            faces = self._track(gray)
+            if faces is None:
+                logger.debug("跟踪置信度不足，重新检测")
+
+        if faces is None:
+            faces = list(detect_fn(frame))
+            self._frames_since_keyframe = 0
+            self.keyframes += 1
+        else:
+            self._frames_since_keyframe += 1
+            self.tracked_frames += 1
+
+        self._faces = faces
+        self._prev_gray = gray
+        self._prev_thumb = thumb
+        return faces
+
+    def _track(self, gray):
+        """用光流把上一帧所有人脸的关键点传播到当前帧，任一人脸失败则返回None"""
+        tracked = []
+        for face in self._faces:
+            prev_pts = (np.asarray(face.kps, dtype=np.float32) * self.track_scale).reshape(-1, 1, 2)
+            next_pts, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, prev_pts, None, **self._lk_params)
+            if next_pts is None:
+                return None
+            back_pts, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, next_pts, None, **self._lk_params)
+            if back_pts is None:
+                return None
+
+            fb_error = np.linalg.norm((prev_pts - back_pts).reshape(-1, 2), axis=1) / self.track_scale
+            good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < self.max_fb_error)
+            if good.mean() < self.min_track_ratio or good.sum() < 2:
+                return None
+
+            # 用成功跟踪的点估计相似变换，同时更新全部关键点和检测框
+            src = prev_pts.reshape(-1, 2)[good] / self.track_scale
+            dst = next_pts.reshape(-1, 2)[good] / self.track_scale
+            matrix, _ = cv2.estimateAffinePartial2D(src, dst)
+            if matrix is None:
+                return None
+
+            kps = np.asarray(face.kps, dtype=np.float32)
+            new_kps = kps @ matrix[:, :2].T + matrix[:, 2]
+            x1, y1, x2, y2 = np.asarray(face.bbox, dtype=np.float32)[:4]
+            corners = np.array([[x1, y1], [x2, y1], [x1, y2], [x2, y2]], dtype=np.float32)
+            corners = corners @ matrix[:, :2].T + matrix[:, 2]
+
+            new_face = type(face)(face)
+            new_face.kps = new_kps.astype(np.float32)
+            new_face.bbox = np.array([corners[:, 0].min(), corners[:, 1].min(),
+                                      corners[:, 0].max(), corners[:, 1].max()], dtype=np.float32)
+            tracked.append(new_face)
+        return tracked
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+相似帧门控 - 画面几乎不变的帧复用参考帧的人脸检测结果
+
+口播类视频中大量相邻帧几乎相同，逐帧检测人脸是浪费。FrameSimilarityGate
+在解码线程中按顺序为每一帧计算缩小的灰度缩略图，与最近一个参考帧比较：
+    * 平均灰度差不超过 static_threshold 的帧标记为相似帧，复用参考帧的检测结果
+    * 平均灰度差超过 scene_threshold 视为镜头切换，强制重新检测
+    * 其余帧正常检测并成为新的参考帧
+    * 连续复用 max_reuse 帧后强制检测一次，避免缓慢移动累积误差
+
+相似帧总是与参考帧比较而不是与上一帧比较，缓慢的变化最终会超过阈值。
+检测阶段可以有多个线程：参考帧一定先于它的相似帧出队，相似帧通过
+shared_detection 等待参考帧检测完成后取用其结果。
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+REUSE = 'reuse'
+DETECT = 'detect'
+SCENE = 'scene'
+
+
+class FrameSimilarityGate:
+    """按帧顺序判断每一帧是否需要重新检测，必须在单个线程中按顺序调用"""
+
+    def __init__(self, static_threshold=1.5, scene_threshold=30.0, max_reuse=15, thumb_size=(64, 36)):
+        """
+        static_threshold: 缩略图平均灰度差不超过该值时复用参考帧的检测结果
+        scene_threshold: 缩略图平均灰度差超过该值视为镜头切换
+        max_reuse: 同一参考帧最多被连续复用的帧数
+        """
+        self.static_threshold = static_threshold
+        self.scene_threshold = scene_threshold
+        self.max_reuse = max(0, int(max_reuse))
+        self.thumb_size = thumb_size
+        self.reset()
+
+    def reset(self):
+        self._reference_thumb = None
+        self._reuse_count = 0
+        self.reused = 0
+        self.detected = 0
+        self.scene_cuts = 0
+
+    def _thumbnail(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, self.thumb_size, interpolation=cv2.INTER_AREA)
+
+    def classify(self, frame):
+        """返回 REUSE / DETECT / SCENE"""
+        thumb = self._thumbnail(frame)
+        if self._reference_thumb is None:
+            decision = DETECT
+        else:
+            diff = float(np.mean(cv2.absdiff(thumb, self._reference_thumb)))
+            if diff > self.scene_threshold:
+                decision = SCENE
+            elif diff <= self.static_threshold and self._reuse_count < self.max_reuse:
+                decision = REUSE
+            else:
+                decision = DETECT
+
+        if decision == REUSE:
+            self._reuse_count += 1
+            self.reused += 1
+        else:
+            self._reference_thumb = thumb
+            self._reuse_count = 0
+            self.detected += 1
+            if decision == SCENE:
+                self.scene_cuts += 1
+        return decision
+
+    def stats(self):
+        total = self.reused + self.detected
+        return {
+            'frames': total,
+            'detected': self.detected,
+            'reused': self.reused,
+            'scene_cuts': self.scene_cuts,
+            'reuse_ratio': round(self.reused / total, 3) if total else 0.0,
+        }
+
+
+def assign_reference(gate, items, on_scene_cut=None):
+    """
+    在解码端为每个FrameItem设置参考帧
+
+    需要检测的帧以自身为参考帧并带有一个完成事件，相似帧指向最近的参考帧；
+    镜头切换时在该帧交给处理阶段之前调用 on_scene_cut(帧索引)
+    """
+    reference = None
+    for item in items:
+        decision = gate.classify(item.frame)
+        if decision == SCENE and on_scene_cut is not None:
+            on_scene_cut(item.index)
+        if reference is None or decision != REUSE:
+            item.detected = threading.Event()
+            reference = item
+        item.reference = reference
+        yield item
+
+
+def shared_detection(item, detect, timeout=30.0):
+    """
+    参考帧调用 detect() 并保存结果，相似帧等待参考帧完成后复用其结果
+
+    没有设置参考帧(门控关闭)或等待超时(参考帧被丢弃)时直接调用 detect()
+    """
+    reference = item.reference
+    if reference is None:
+        return detect()
+    if reference is not item:
+        if reference.detected.wait(timeout):
+            return reference.faces
+        return detect()
+    try:
+        item.faces = detect()
+    finally:
+        item.detected.set()
+    return item.faces
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+多进程帧处理引擎 - 让传统换脸方法绕过GIL并行运行
+
+传统方法(advanced_face_swap / simple_face_swap)中大量Python级循环和
+逐三角形的小OpenCV调用，线程池很难超过两个核心。本模块使用进程池：
+    * 每个工作进程在初始化函数中加载一次dlib检测器、特征点预测器和级联分类器
+    * 视频帧通过 multiprocessing.shared_memory 中的固定槽位传递，不经过pickle
+    * submit 返回普通的 concurrent.futures.Future，结果为 (帧索引, 处理后的帧)，
+      写入端可以沿用按帧索引排序写出的逻辑
+"""
+
+import os
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger("frame_process_pool")
+
+# 工作进程内的全局状态，由 _init_worker 设置
+_worker_process_fn = None
+_worker_shm = None
+_worker_slots = None
+
+
+def _attach_shared_memory(name):
+    """在工作进程中附加共享内存，由主进程负责释放"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13之前没有track参数；工作进程与主进程共用同一个resource_tracker，
+        # 重复登记同名共享内存不会造成提前释放
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(shm_name, num_slots, frame_shape, worker_factory, factory_args):
+    """工作进程初始化：附加共享内存并加载一次模型"""
+    global _worker_process_fn, _worker_shm, _worker_slots
+    _worker_shm = _attach_shared_memory(shm_name)
+    _worker_slots = np.ndarray((num_slots,) + tuple(frame_shape), dtype=np.uint8, buffer=_worker_shm.buf)
+    _worker_process_fn = worker_factory(*factory_args)
+
+
+def _process_slot(slot, index):
+    """在工作进程中处理一个槽位中的帧，结果原地写回同一槽位"""
+    frame = _worker_slots[slot]
+    result = _worker_process_fn(frame.copy(), index)
+    if result is None or result.shape != frame.shape:
+        return False
+    frame[...] = result
+    return True
+
+
+class FrameProcessPool:
+    """基于共享内存槽位的进程池帧处理器"""
+
+    def __init__(self, frame_shape, worker_factory, factory_args=(), max_workers=None, num_slots=None):
+        """
+        frame_shape: 视频帧形状 (高, 宽, 3)，所有帧必须一致
+        worker_factory: 可pickle的顶层函数，在每个工作进程中以 factory_args 调用一次，
+                        返回 process(frame, index) -> frame 的处理函数
+        """
+        self.frame_shape = tuple(frame_shape)
+        self.max_workers = max_workers or os.cpu_count() or 4
+        self.num_slots = num_slots or self.max_workers * 3 + 2
+
+        frame_bytes = int(np.prod(self.frame_shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=frame_bytes * self.num_slots)
+        self._slots = np.ndarray((self.num_slots,) + self.frame_shape, dtype=np.uint8, buffer=self._shm.buf)
+
+        self._free_slots = list(range(self.num_slots))
+        self._slot_cond = threading.Condition()
+
+        # 进程池在流水线线程运行期间创建，fork会把其他线程持有的锁(日志、ONNX Runtime、OpenCV)
+        # 复制到子进程中导致死锁，因此与分段工作进程一样使用spawn
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._shm.name, self.num_slots, self.frame_shape, worker_factory, tuple(factory_args)),
+        )
+        logger.info(f"创建进程池: {self.max_workers}个工作进程, {self.num_slots}个共享内存槽位")
+
+    def _acquire_slot(self):
+        with self._slot_cond:
+            while not self._free_slots:
+                self._slot_cond.wait()
+            return self._free_slots.pop()
+
+    def _release_slot(self, slot):
+        with self._slot_cond:
+            self._free_slots.append(slot)
+            self._slot_cond.notify()
+
+    def submit(self, index, frame):
+        """
+        提交一帧，返回结果为 (index, 处理后的帧) 的Future
+
+        没有空闲槽位时阻塞，直到有工作进程处理完成，从而限制内存占用。
+        处理失败时结果为原始帧。
+        """
+        slot = self._acquire_slot()
+        self._slots[slot][...] = frame
+        outer = concurrent.futures.Future()
+
+        def _on_done(inner):
+            try:
+                ok = inner.result()
+                processed = self._slots[slot].copy() if ok else frame
+                outer.set_result((index, processed))
+            except Exception as e:
+                logger.error(f"进程池处理帧 {index} 时出错: {e}")
+                outer.set_result((index, frame))
+            finally:
+                self._release_slot(slot)
+
+        try:
+            self._executor.submit(_process_slot, slot, index).add_done_callback(_on_done)
+        except Exception:
+            self._release_slot(slot)
+            raise
+        return outer
+
+    def close(self):
+        """关闭进程池并释放共享内存"""
+        self._executor.shutdown(wait=True)
+        self._slots = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
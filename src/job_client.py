@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务队列服务的客户端 - 界面和脚本通过它把视频交给常驻的 job_server 处理
+
+只依赖标准库，导入时不加载模型也不配置日志，图形界面可以在启动时检查服务是否可用：
+    * server_available 用很短的超时探测服务，服务未运行时界面退回本进程处理
+    * submit_job 提交任务，poll 轮询任务直到结束
+    * job_options 把引擎上的选项转换为与命令行同名的任务选项
+
+服务地址默认为 http://127.0.0.1:8765，可以用环境变量 FACE_SWAP_JOB_SERVER 修改。
+"""
+
+import os
+import json
+import time
+import logging
+import urllib.error
+import urllib.request
+
+logger = logging.getLogger("job_client")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_URL = os.environ.get("FACE_SWAP_JOB_SERVER", f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# 命令行选项名 -> (引擎属性, 是否取反)，与 face_swap_cli.apply_options 相对应
+JOB_OPTION_ATTRIBUTES = {
+    'swapper': ('swapper_var', False),
+    'swap_method': ('swap_method_var', False),
+    'detector': ('detector_var', False),
+    'no_color_correction': ('color_correction_var', True),
+    'smoothing': ('smoothing_var', False),
+    'tracking': ('face_tracking_var', False),
+    'keyframe_interval': ('keyframe_interval', False),
+    'reuse_static': ('frame_gate_var', False),
+    'static_threshold': ('static_frame_threshold', False),
+    'scene_threshold': ('scene_cut_threshold', False),
+    'process_pool': ('process_pool_var', False),
+    'batch_size': ('swap_batch_size', False),
+    'detection_size': ('detection_max_side', False),
+    'det_size': ('det_size', False),
+    'debug_capture': ('debug_capture_mode', False),
+    'debug_interval': ('debug_capture_interval', False),
+    'encoder': ('video_encoder', False),
+    'codec': ('encoder_codec', False),
+    'crf': ('encoder_crf', False),
+    'preset': ('encoder_preset', False),
+    'encoder_threads': ('encoder_threads', False),
+    'no_audio': ('keep_audio', True),
+    'segment_seconds': ('segment_seconds', False),
+    'keep_segments': ('keep_segments', False),
+    'segment_workers': ('segment_workers', False),
+}
+
+
+def request(method, path, payload=None, url=None, timeout=30):
+    """向任务队列服务发送请求，返回 (HTTP状态码, JSON响应)"""
+    url = (url or DEFAULT_URL).rstrip("/") + path
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode("utf-8") or "{}")
+
+
+def server_available(url=None, timeout=0.5):
+    """任务队列服务是否在运行"""
+    try:
+        status, _ = request("GET", "/status", url=url, timeout=timeout)
+    except (OSError, ValueError):
+        return False
+    return status == 200
+
+
+def job_options(app):
+    """读取引擎(或界面)上的处理选项，返回可以随任务提交的选项字典"""
+    options = {}
+    for name, (attribute, inverted) in JOB_OPTION_ATTRIBUTES.items():
+        if not hasattr(app, attribute):
+            continue
+        value = app.get_option(attribute)
+        if value is None:
+            continue
+        options[name] = (not value) if inverted else value
+    return options
+
+
+def submit_job(video, face, output=None, options=None, priority=0, url=None):
+    """提交任务，返回任务记录；界面和脚本用它代替各自加载模型"""
+    payload = {'video': os.path.abspath(video), 'face': os.path.abspath(face),
+               'output': os.path.abspath(output) if output else None,
+               'options': options or {}, 'priority': priority}
+    status, job = request("POST", "/jobs", payload, url)
+    if status != 201:
+        raise RuntimeError(job.get('error', f"提交任务失败: HTTP {status}"))
+    return job
+
+
+def get_job(job_id, url=None):
+    """查询任务记录"""
+    status, job = request("GET", f"/jobs/{job_id}", url=url)
+    if status != 200:
+        raise RuntimeError(job.get('error', f"查询任务失败: HTTP {status}"))
+    return job
+
+
+def cancel_job(job_id, url=None):
+    """取消任务，返回 (HTTP状态码, 响应)；任务已结束时状态码为409"""
+    return request("POST", f"/jobs/{job_id}/cancel", url=url)
+
+
+def poll(job_id, on_update=None, interval=1.0, url=None, cancel_event=None):
+    """
+    轮询任务直到结束，返回最终的任务记录
+
+    on_update(job) 在每次查询后调用；cancel_event 被设置时向服务请求取消任务，
+    然后继续等待服务确认
+    """
+    cancel_sent = False
+    while True:
+        job = get_job(job_id, url)
+        if on_update is not None:
+            on_update(job)
+        if job['status'] in FINISHED_STATES:
+            return job
+        if cancel_event is not None and cancel_event.is_set() and not cancel_sent:
+            cancel_job(job_id, url)
+            cancel_sent = True
+        time.sleep(interval)
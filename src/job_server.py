@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地换脸任务队列服务 - 常驻进程保存已加载的模型，通过localhost HTTP接收任务
+
+FaceSwapProcessor 同一时间只能处理一个视频，每个界面和脚本还要各自加载一套模型。
+这里用一个长期运行的服务代替：
+    * 任务保存在JSON文件中，服务重启后排队中的任务继续处理，中断的任务重新排队
+    * 按优先级(数值大的先处理)和提交顺序调度，可以取消排队中或正在处理的任务
+    * 模型只在服务启动时加载一次，每个任务使用 clone_for_job 得到的副本，
+      可以配置同时处理的任务数
+    * 任务选项与命令行同名(如 swapper、crf、tracking)，提交时校验
+
+HTTP接口(JSON):
+    GET  /status              服务状态和各状态的任务数
+    GET  /jobs[?status=...]   任务列表
+    POST /jobs                提交任务 {video, face, output?, priority?, options?}
+    GET  /jobs/<id>           任务详情，包含进度
+    POST /jobs/<id>/cancel    取消任务
+
+客户端函数在 job_client 中，图形界面在服务运行时通过它提交任务。
+
+用法:
+    python job_server.py serve --workers 2
+    python job_server.py submit video.mp4 face.jpg --priority 5 --option crf=18
+    python job_server.py status
+    python job_server.py cancel <id>
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from face_swap_cli import add_option_arguments, apply_options, create_app, process_video, output_folder, base_dir
+from batch_jobs import job_arguments, default_output_path, StatusRecorder
+from progress_reporter import ProgressReporter, LoggingSink
+from job_client import (DEFAULT_HOST, DEFAULT_PORT, DEFAULT_URL, QUEUED, RUNNING, DONE, FAILED, CANCELLED,
+                        FINISHED_STATES, request, submit_job)
+
+logger = logging.getLogger("job_server")
+
+DEFAULT_STATE_PATH = os.path.join(base_dir, "job_queue", "jobs.json")
+
+
+class JobStore:
+    """线程安全的持久化任务队列，状态变化时原子写回JSON文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._jobs = {}
+        self._seq = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取任务队列失败，使用空队列: {e}")
+            return
+        for job in data.get('jobs', []):
+            if job['status'] == RUNNING:
+                # 上次服务退出时正在处理的任务重新排队
+                job.update(status=QUEUED, progress=0.0, note="服务重启后重新排队")
+            self._jobs[job['id']] = job
+            self._seq = max(self._seq, job.get('seq', 0))
+        queued = sum(1 for job in self._jobs.values() if job['status'] == QUEUED)
+        logger.info(f"恢复任务队列: {len(self._jobs)} 个任务, 排队中 {queued} 个")
+
+    def _save_locked(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".jobs_", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({'version': 1, 'jobs': list(self._jobs.values())}, f,
+                          ensure_ascii=False, indent=2, default=str)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def submit(self, video, face, output, options=None, priority=0):
+        with self._cond:
+            self._seq += 1
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'seq': self._seq,
+                'video': video,
+                'face': face,
+                'output': output,
+                'options': dict(options or {}),
+                'priority': int(priority),
+                'status': QUEUED,
+                'progress': 0.0,
+                'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            self._jobs[job['id']] = job
+            self._save_locked()
+            self._cond.notify()
+            return dict(job)
+
+    def next_job(self):
+        """取出优先级最高的排队任务并标记为处理中，没有任务时阻塞；队列关闭时返回None"""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                queued = [job for job in self._jobs.values() if job['status'] == QUEUED]
+                if queued:
+                    job = min(queued, key=lambda j: (-j['priority'], j['seq']))
+                    job.update(status=RUNNING, started=time.strftime('%Y-%m-%d %H:%M:%S'))
+                    self._save_locked()
+                    return dict(job)
+                self._cond.wait()
+
+    def update(self, job_id, save=True, **fields):
+        """更新任务字段；进度这类频繁变化的字段传入 save=False 只更新内存"""
+        with self._cond:
+            job = self._jobs[job_id]
+            job.update(fields)
+            if save:
+                self._save_locked()
+
+    def cancel(self, job_id):
+        """
+        取消任务，返回取消前的状态，任务不存在时返回None
+
+        排队中的任务直接标记为已取消；处理中的任务只记录取消请求，由工作线程中止
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = job['status']
+            if status == QUEUED:
+                job.update(status=CANCELLED, finished=time.strftime('%Y-%m-%d %H:%M:%S'))
+                self._save_locked()
+            elif status == RUNNING:
+                job['cancel_requested'] = True
+                self._save_locked()
+            return status
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list(self, status=None):
+        with self._cond:
+            jobs = [dict(job) for job in self._jobs.values() if status is None or job['status'] == status]
+        return sorted(jobs, key=lambda j: j['seq'])
+
+    def counts(self):
+        with self._cond:
+            counts = {state: 0 for state in (QUEUED, RUNNING) + FINISHED_STATES}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class JobProgressSink:
+    """把进度事件写入任务记录(只更新内存，状态变化时才写盘)"""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+
+    def __call__(self, event):
+        if event['kind'] == 'progress':
+            self.store.update(self.job_id, save=False, progress=round(event['percent'], 1),
+                              fps=round(event['fps'], 2), eta=event['eta'])
+
+
+class JobServer:
+    """常驻模型的任务调度器，workers 个线程从队列中取任务处理"""
+
+    def __init__(self, base_app, defaults, store, workers=1):
+        self.base_app = base_app
+        self.defaults = defaults
+        self.store = store
+        self.workers = max(1, int(workers))
+        self.parser = argparse.ArgumentParser(add_help=False)
+        add_option_arguments(self.parser)
+        self.started = time.strftime('%Y-%m-%d %H:%M:%S')
+        self._running = {}      # 任务id -> 正在处理该任务的应用副本
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def validate_options(self, options):
+        """按命令行参数的定义校验任务选项，无效时抛出ValueError"""
+        return job_arguments(self.parser, self.defaults, options or {})
+
+    def submit(self, video, face, output=None, options=None, priority=0):
+        self.validate_options(options)
+        if not output:
+            output = default_output_path({'video': video, 'face': face}, output_folder)
+        job = self.store.submit(video, face, output, options, priority)
+        logger.info(f"任务 {job['id']} 已排队: {video} + {face}, 优先级 {job['priority']}")
+        return job
+
+    def cancel(self, job_id):
+        status = self.store.cancel(job_id)
+        if status == RUNNING:
+            with self._lock:
+                app = self._running.get(job_id)
+            if app is not None:
+                app.cancel_event.set()
+        return status
+
+    def status(self):
+        with self._lock:
+            running = list(self._running)
+        return {
+            'started': self.started,
+            'workers': self.workers,
+            'running': running,
+            'counts': self.store.counts(),
+            'insightface': self.base_app.inswapper is not None and self.base_app.face_analyser is not None,
+        }
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """停止接收任务并取消正在处理的任务，被中断的任务下次启动时重新排队"""
+        self.store.close()
+        with self._lock:
+            apps = list(self._running.values())
+        for app in apps:
+            app.cancel_event.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _worker_loop(self):
+        while True:
+            job = self.store.next_job()
+            if job is None:
+                return
+            self._run_job(job)
+
+    def _run_job(self, job):
+        job_id = job['id']
+        job_logger = logging.getLogger(f"job_server.{job_id}")
+        try:
+            job_args = self.validate_options(job['options'])
+        except (ValueError, TypeError) as e:
+            self.store.update(job_id, status=FAILED, error=str(e), finished=time.strftime('%Y-%m-%d %H:%M:%S'))
+            return
+        if self.workers > 1 and job_args.segment_workers <= 1:
+            # 多个任务同时处理时按并发数分摊CPU核心
+            job_args.pipeline_threads = max(1, (os.cpu_count() or 4) // self.workers)
+
+        app = self.base_app.clone_for_job()
+        app.progress_reporter = ProgressReporter(sinks=[LoggingSink(job_logger), JobProgressSink(self.store, job_id)])
+        apply_options(app, job_args)
+        with self._lock:
+            self._running[job_id] = app
+        if self.store.get(job_id).get('cancel_requested'):
+            app.cancel_event.set()
+
+        job_logger.info(f"开始处理: {job['video']} + {job['face']} -> {job['output']}")
+        recorder = StatusRecorder()
+        start = time.perf_counter()
+        try:
+            result = process_video(app, job['video'], job['face'], job['output'], sinks=[recorder])
+            error = None if result else (recorder.text or "处理失败，请查看日志")
+        except Exception as e:
+            result, error = False, str(e)
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+
+        fields = {'elapsed': round(time.perf_counter() - start, 3), 'metrics': app.job_metrics,
+                  'finished': time.strftime('%Y-%m-%d %H:%M:%S')}
+        if result:
+            self.store.update(job_id, status=DONE, result=result, progress=100.0, **fields)
+            job_logger.info(f"完成: {result}")
+        elif app.cancel_event.is_set():
+            if self.store.get(job_id).get('cancel_requested'):
+                self.store.update(job_id, status=CANCELLED, **fields)
+                job_logger.info("任务已取消")
+            else:
+                # 服务停止时中断的任务保持处理中状态，下次启动时重新排队
+                job_logger.info("服务停止，任务将在下次启动时重新处理")
+        else:
+            self.store.update(job_id, status=FAILED, error=error, **fields)
+            job_logger.error(f"失败: {error}")
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """任务队列的HTTP接口，请求和响应都是JSON"""
+
+    server_version = "FaceSwapJobServer/1.0"
+
+    @property
+    def jobs(self):
+        return self.server.job_server
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode("utf-8"))
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["status"]:
+            return self._send(200, self.jobs.status())
+        if parts == ["jobs"]:
+            status = urllib.parse.parse_qs(url.query).get('status', [None])[0]
+            return self._send(200, {'jobs': self.jobs.store.list(status)})
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self.jobs.store.get(parts[1])
+            if job is None:
+                return self._send(404, {'error': f"任务不存在: {parts[1]}"})
+            return self._send(200, job)
+        self._send(404, {'error': f"未知路径: {url.path}"})
+
+    def do_POST(self):
+        parts = [p for p in urllib.parse.urlparse(self.path).path.split("/") if p]
+        if parts == ["jobs"]:
+            try:
+                data = self._read_json()
+                if not data.get('video') or not data.get('face'):
+                    raise ValueError("缺少字段: video, face")
+                job = self.jobs.submit(data['video'], data['face'], data.get('output'),
+                                       data.get('options'), data.get('priority', 0))
+            except (ValueError, TypeError) as e:
+                return self._send(400, {'error': str(e)})
+            return self._send(201, job)
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            status = self.jobs.cancel(parts[1])
+            if status is None:
+                return self._send(404, {'error': f"任务不存在: {parts[1]}"})
+            if status in FINISHED_STATES:
+                return self._send(409, {'error': f"任务已结束: {status}"})
+            return self._send(200, self.jobs.store.get(parts[1]))
+        self._send(404, {'error': f"未知路径: {self.path}"})
+
+
+def serve(args):
+    store = JobStore(args.state)
+    logger.info("正在初始化模型...")
+    base_app = create_app(args)
+    job_server = JobServer(base_app, args, store, workers=args.workers)
+    job_server.start()
+
+    httpd = ThreadingHTTPServer((args.host, args.port), JobRequestHandler)
+    httpd.job_server = job_server
+    logger.info(f"任务队列服务已启动: http://{args.host}:{args.port}, {job_server.workers} 个工作线程")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("正在停止任务队列服务...")
+    finally:
+        httpd.server_close()
+        job_server.stop()
+
+
+def parse_options(items):
+    """把 name=value 形式的 --option 参数转换为选项字典"""
+    options = {}
+    for item in items or []:
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"选项格式应为 name=value: {item}")
+        options[name.strip()] = value.strip()
+    return options
+
+
+def main():
+    """任务队列服务和客户端命令的主函数"""
+    parser = argparse.ArgumentParser(description="本地换脸任务队列服务")
+    parser.add_argument("--url", default=DEFAULT_URL, help="客户端命令连接的服务地址")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="启动服务")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST, help="监听地址，默认只接受本机连接")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    serve_parser.add_argument("--workers", type=int, default=1, help="同时处理的任务数")
+    serve_parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="任务队列文件")
+    add_option_arguments(serve_parser)
+
+    submit_parser = commands.add_parser("submit", help="提交任务")
+    submit_parser.add_argument("video_path", help="视频文件路径")
+    submit_parser.add_argument("face_img_path", help="人脸图片路径")
+    submit_parser.add_argument("output_path", nargs="?", default=None, help="输出视频路径(可选)")
+    submit_parser.add_argument("--priority", type=int, default=0, help="优先级，数值大的先处理")
+    submit_parser.add_argument("--option", action="append", metavar="NAME=VALUE",
+                               help="与命令行同名的处理选项，如 crf=18，可以重复")
+
+    commands.add_parser("status", help="查看服务状态和任务列表")
+    cancel_parser = commands.add_parser("cancel", help="取消任务")
+    cancel_parser.add_argument("job_id", help="任务id")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+        return
+
+    try:
+        if args.command == "submit":
+            job = submit_job(args.video_path, args.face_img_path, args.output_path,
+                             parse_options(args.option), args.priority, url=args.url)
+            print(f"任务已提交: {job['id']} -> {job['output']}")
+        elif args.command == "status":
+            _, status = request("GET", "/status", url=args.url)
+            _, listing = request("GET", "/jobs", url=args.url)
+            print(json.dumps(status, ensure_ascii=False, indent=2))
+            for job in listing['jobs']:
+                print(f"{job['id']}  {job['status']:<9} {job.get('progress', 0):5.1f}%  "
+                      f"P{job['priority']}  {os.path.basename(job['video'])} -> {job['output']}")
+        elif args.command == "cancel":
+            code, job = request("POST", f"/jobs/{args.job_id}/cancel", url=args.url)
+            if code != 200:
+                print(f"取消失败: {job.get('error')}")
+                sys.exit(1)
+            print(f"已取消: {args.job_id} ({job['status']})")
+    except (urllib.error.URLError, RuntimeError) as e:
+        print(f"请求任务队列服务失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+限流的结构化进度报告 - 按时间和百分比限制更新频率，附带帧率和剩余时间
+
+ProgressReporter 把进度事件分发给可插拔的输出端(sink)，每个sink是接收
+事件字典的可调用对象。事件字段：
+    kind     'progress' 或 'status'
+    done     已完成帧数
+    total    总帧数，未知时为0
+    percent  完成百分比(0-100)
+    fps      平滑后的处理速度(帧/秒)
+    eta      预计剩余秒数，未知时为None
+    elapsed  已用秒数
+    text     附加文字
+内置输出端：日志、Tkinter变量、Qt信号、命令行进度条和JSON Lines。
+"""
+
+import sys
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger("progress_reporter")
+
+
+def format_duration(seconds):
+    """把秒数格式化为 时:分:秒 或 分:秒"""
+    if seconds is None:
+        return "--:--"
+    seconds = int(max(0, seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def format_progress(event):
+    """把进度事件格式化为一行文字"""
+    text = f"{event['percent']:.1f}%"
+    if event['total']:
+        text += f" ({event['done']}/{event['total']})"
+    if event['fps']:
+        text += f" {event['fps']:.1f}帧/秒 剩余 {format_duration(event['eta'])}"
+    return text
+
+
+class ProgressReporter:
+    """线程安全的进度报告器，进度更新按时间和百分比限流，状态消息直接转发"""
+
+    def __init__(self, total=0, sinks=None, min_interval=0.25, min_percent=0.5, max_interval=5.0):
+        """
+        min_interval: 两次进度事件之间的最短秒数
+        min_percent: 两次进度事件之间的最小百分比变化
+        max_interval: 进度变化很慢时至少每隔这么多秒发一次事件
+        """
+        self.sinks = list(sinks or [])
+        self.min_interval = min_interval
+        self.min_percent = min_percent
+        self.max_interval = max_interval
+        self._lock = threading.Lock()
+        self.start(total)
+
+    def add_sink(self, sink):
+        with self._lock:
+            self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        with self._lock:
+            if sink in self.sinks:
+                self.sinks.remove(sink)
+
+    def start(self, total=0):
+        """开始新任务，重置计时和速度统计"""
+        with self._lock:
+            self.total = max(0, int(total or 0))
+            self.done = 0
+            self.fps = 0.0
+            self._start_time = time.perf_counter()
+            self._last_emit_time = None
+            self._last_emit_percent = None
+            self._rate_time = self._start_time
+            self._rate_done = 0
+
+    def _percent(self, done):
+        if self.total <= 0:
+            return 0.0
+        return min(100.0, done * 100.0 / self.total)
+
+    def _make_event(self, kind, text, now):
+        elapsed = now - self._start_time
+        eta = None
+        if self.total > 0 and self.fps > 0:
+            eta = max(0, self.total - self.done) / self.fps
+        return {
+            'kind': kind,
+            'done': self.done,
+            'total': self.total,
+            'percent': self._percent(self.done),
+            'fps': self.fps,
+            'eta': eta,
+            'elapsed': elapsed,
+            'text': text,
+        }
+
+    def _dispatch(self, event, sinks):
+        for sink in sinks:
+            try:
+                sink(event)
+            except Exception as e:
+                logger.error(f"进度输出端出错: {e}")
+
+    def update(self, done, text=None, force=False):
+        """报告已完成帧数，只有满足限流条件时才真正发出事件"""
+        now = time.perf_counter()
+        with self._lock:
+            self.done = done
+            # 用指数平滑的瞬时速度估计帧率，至少间隔0.5秒采样一次
+            if now - self._rate_time >= 0.5:
+                rate = (done - self._rate_done) / (now - self._rate_time)
+                self.fps = rate if self.fps <= 0 else 0.3 * rate + 0.7 * self.fps
+                self._rate_time = now
+                self._rate_done = done
+            elif self.fps <= 0 and done > 0 and now > self._start_time:
+                self.fps = done / (now - self._start_time)
+
+            percent = self._percent(done)
+            finished = self.total > 0 and done >= self.total
+            if not (force or finished or self._should_emit(now, percent)):
+                return
+            self._last_emit_time = now
+            self._last_emit_percent = percent
+            event = self._make_event('progress', text, now)
+            sinks = list(self.sinks)
+        self._dispatch(event, sinks)
+
+    def _should_emit(self, now, percent):
+        if self._last_emit_time is None:
+            return True
+        since_last = now - self._last_emit_time
+        if since_last >= self.max_interval:
+            return True
+        return since_last >= self.min_interval and percent - self._last_emit_percent >= self.min_percent
+
+    def set_percent(self, percent, text=None, force=False):
+        """以百分比报告进度，供只知道百分比的旧接口使用"""
+        with self._lock:
+            if self.total <= 0:
+                # 没有帧数信息时按0-100计数
+                self.total = 100
+            total = self.total
+        self.update(int(round(percent * total / 100.0)), text, force=force)
+
+    def status(self, text):
+        """发送状态消息，不限流"""
+        with self._lock:
+            event = self._make_event('status', text, time.perf_counter())
+            sinks = list(self.sinks)
+        self._dispatch(event, sinks)
+
+    def finish(self, text="完成"):
+        """任务结束，强制发出100%的进度事件"""
+        with self._lock:
+            if self.total <= 0:
+                # 总帧数未知时以实际完成的帧数为准
+                self.total = max(1, self.done)
+            done = max(self.done, self.total)
+        self.update(done, text, force=True)
+
+
+class LoggingSink:
+    """把进度和状态写入日志"""
+
+    def __init__(self, log=None):
+        self.log = log or logger
+
+    def __call__(self, event):
+        if event['kind'] == 'status':
+            self.log.info(f"状态: {event['text']}")
+        else:
+            suffix = f" {event['text']}" if event['text'] else ""
+            self.log.info(f"进度: {format_progress(event)}{suffix}")
+
+
+class TkProgressSink:
+    """更新Tkinter进度条、进度标签和状态变量，所有操作通过 root.after 切回主线程"""
+
+    def __init__(self, root, progress_var, progress_label=None, status_var=None):
+        self.root = root
+        self.progress_var = progress_var
+        self.progress_label = progress_label
+        self.status_var = status_var
+
+    def _apply(self, event):
+        if event['kind'] == 'status':
+            if self.status_var is not None:
+                self.status_var.set(event['text'])
+            return
+        self.progress_var.set(event['percent'])
+        if self.progress_label is not None:
+            self.progress_label.config(text=format_progress(event))
+
+    def __call__(self, event):
+        self.root.after(0, lambda e=event: self._apply(e))
+
+
+class SignalSink:
+    """通过信号转发进度(整数百分比)和状态文字，适用于Qt的pyqtSignal"""
+
+    def __init__(self, progress_signal=None, status_signal=None):
+        self.progress_signal = progress_signal
+        self.status_signal = status_signal
+
+    def __call__(self, event):
+        if event['kind'] == 'status':
+            if self.status_signal is not None:
+                self.status_signal.emit(event['text'])
+        elif self.progress_signal is not None:
+            self.progress_signal.emit(int(event['percent']))
+
+
+class CliProgressBar:
+    """在终端同一行绘制进度条"""
+
+    def __init__(self, stream=None, width=30):
+        self.stream = stream or sys.stderr
+        self.width = width
+        self._bar_active = False
+
+    def __call__(self, event):
+        if event['kind'] == 'status':
+            if self._bar_active:
+                self.stream.write("\n")
+                self._bar_active = False
+            self.stream.write(f"{event['text']}\n")
+        else:
+            filled = int(self.width * event['percent'] / 100.0)
+            bar = "#" * filled + "-" * (self.width - filled)
+            self.stream.write(f"\r[{bar}] {format_progress(event)}")
+            self._bar_active = True
+            if event['total'] and event['done'] >= event['total']:
+                self.stream.write("\n")
+                self._bar_active = False
+        self.stream.flush()
+
+
+class JsonLinesSink:
+    """每个事件写一行JSON，便于其他程序解析进度"""
+
+    def __init__(self, target):
+        """target: 文件路径或可写的文本流"""
+        if isinstance(target, str):
+            self.stream = open(target, "a", encoding="utf-8")
+            self._owns_stream = True
+        else:
+            self.stream = target
+            self._owns_stream = False
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(dict(event, time=time.time()), ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def close(self):
+        if self._owns_stream:
+            self.stream.close()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按帧索引排序的环形重排缓冲区 - 并行处理完成的帧乱序到达，按顺序写出
+
+    * 槽位按 帧索引 % 容量 定位，放入和取出都是O(1)
+    * 生产端在读入新帧前调用 acquire，只有帧索引落在
+      [下一个要写出的帧, 下一个要写出的帧 + 容量) 窗口内才放行，
+      某一帧处理很慢时缓冲区不会无限增长，内存占用有硬上限
+    * 处理失败的帧用原始帧代替写出
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger("reorder_buffer")
+
+# 标记既没有处理结果也没有原始帧的槽位
+_SKIPPED = object()
+
+
+class ReorderBuffer:
+    """线程安全的环形重排缓冲区"""
+
+    def __init__(self, capacity, start_index=0):
+        """start_index: 第一帧的帧索引，分段处理时为片段的起始帧"""
+        self.capacity = max(1, int(capacity))
+        self._slots = [None] * self.capacity
+        self._next_index = int(start_index)     # 下一个要取出的帧索引
+        self._count = 0             # 缓冲区中已放入但未取出的帧数
+        self._end_index = None      # close后为最后一帧之后的帧索引
+        self._aborted = False
+        self._cond = threading.Condition()
+
+    @property
+    def next_index(self):
+        return self._next_index
+
+    def __len__(self):
+        with self._cond:
+            return self._count
+
+    def can_accept(self, index):
+        """帧索引是否在缓冲窗口内，供单线程的生产/写出循环使用"""
+        with self._cond:
+            return index < self._next_index + self.capacity
+
+    def acquire(self, index):
+        """
+        等待帧索引进入缓冲窗口，在读入/提交该帧之前调用
+
+        返回False表示缓冲区已中止
+        """
+        with self._cond:
+            while not self._aborted and index >= self._next_index + self.capacity:
+                self._cond.wait()
+            return not self._aborted
+
+    def put(self, index, frame, original=None):
+        """
+        放入一帧处理结果，不会阻塞
+
+        frame无效(None或空)时使用original；两者都无效时该帧在写出时跳过
+        """
+        if frame is None or getattr(frame, 'size', 0) == 0:
+            if original is not None:
+                logger.warning(f"帧 {index} 处理失败，使用原始帧")
+            frame = original
+        if frame is None or getattr(frame, 'size', 0) == 0:
+            frame = _SKIPPED
+
+        with self._cond:
+            if index < self._next_index or index >= self._next_index + self.capacity:
+                logger.error(f"帧 {index} 不在缓冲窗口内(下一帧 {self._next_index})，已丢弃")
+                return
+            slot = index % self.capacity
+            if self._slots[slot] is not None:
+                logger.error(f"帧 {index} 重复放入，已丢弃")
+                return
+            self._slots[slot] = frame
+            self._count += 1
+            if index == self._next_index:
+                self._cond.notify_all()
+
+    def get(self):
+        """
+        按顺序取出下一帧，返回 (帧索引, 帧)
+
+        下一帧尚未完成时阻塞；所有帧都已取出或缓冲区中止时返回None
+        """
+        with self._cond:
+            while True:
+                if self._aborted:
+                    return None
+                if self._end_index is not None and self._next_index >= self._end_index:
+                    return None
+
+                slot = self._next_index % self.capacity
+                frame = self._slots[slot]
+                if frame is None:
+                    self._cond.wait()
+                    continue
+
+                index = self._next_index
+                self._slots[slot] = None
+                self._count -= 1
+                self._next_index += 1
+                # 窗口前移，唤醒等待的生产端
+                self._cond.notify_all()
+                if frame is _SKIPPED:
+                    logger.error(f"帧 {index} 无效，跳过")
+                    continue
+                return index, frame
+
+    def pop_ready(self):
+        """不阻塞地按顺序取出所有已就绪的连续帧，返回 [(帧索引, 帧), ...]"""
+        ready = []
+        with self._cond:
+            start_index = self._next_index
+            while True:
+                slot = self._next_index % self.capacity
+                frame = self._slots[slot]
+                if frame is None:
+                    break
+                index = self._next_index
+                self._slots[slot] = None
+                self._count -= 1
+                self._next_index += 1
+                if frame is _SKIPPED:
+                    logger.error(f"帧 {index} 无效，跳过")
+                    continue
+                ready.append((index, frame))
+            if self._next_index != start_index:
+                self._cond.notify_all()
+        return ready
+
+    def close(self, end_index):
+        """声明最后一帧之后的帧索引，取完此前的帧后 get 返回None"""
+        with self._cond:
+            self._end_index = end_index
+            self._cond.notify_all()
+
+    def abort(self):
+        """中止缓冲区，唤醒所有等待的线程"""
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
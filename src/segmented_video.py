@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分段可续传的视频处理 - 按固定时长把视频切成片段，每段单独编码并记录到清单
+
+长视频处理到一半失败(内存不足、换脸出错、界面被关闭)时不必从头再来：
+    * plan_segments 按 segment_seconds 切分帧范围，能用ffprobe读到关键帧时
+      把分段边界对齐到关键帧，定位到片段起点不需要从上一个关键帧解码
+    * 每个片段编码为工作目录中的独立文件，写完后才改成正式文件名，
+      并在 manifest.json 中标记为完成；清单通过临时文件+替换原子写入
+    * 重新运行时清单与输入文件、处理选项一致，就跳过已完成的片段
+    * 全部片段完成后用ffmpeg concat以流复制方式拼接并复制原视频音轨，
+      没有ffmpeg时用OpenCV逐帧重新写入
+片段之间互不依赖，可以并行处理。
+"""
+
+import os
+import json
+import bisect
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+
+import cv2
+
+from video_encoder import find_ffmpeg
+
+logger = logging.getLogger("segmented_video")
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def probe_keyframes(video_path, fps):
+    """用ffprobe读取视频流的关键帧位置(帧索引)，没有ffprobe或读取失败时返回None"""
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None or not fps:
+        return None
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+           "-show_entries", "frame=pts_time,best_effort_timestamp_time", "-of", "csv=p=0", video_path]
+    try:
+        output = subprocess.run(cmd, capture_output=True, text=True, timeout=120, check=True).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"读取关键帧失败: {e}")
+        return None
+
+    keyframes = set()
+    for line in output.splitlines():
+        for value in line.split(","):
+            try:
+                keyframes.add(int(round(float(value) * fps)))
+                break
+            except ValueError:
+                continue
+    return sorted(keyframes)
+
+
+def plan_segments(total_frames, fps, segment_seconds, keyframes=None):
+    """
+    按时长切分帧范围，返回 [(起始帧, 结束帧), ...]，结束帧不包含在片段内
+
+    给出关键帧时，每个分段边界取不早于名义边界的第一个关键帧；
+    最后一段的结束帧为None，表示读到视频结尾
+    """
+    segment_frames = max(1, int(round(segment_seconds * (fps or 25))))
+    if total_frames <= 0:
+        return [(0, None)]
+
+    boundaries = []
+    nominal = segment_frames
+    keyframes = sorted(k for k in (keyframes or []) if 0 < k < total_frames)
+    while nominal < total_frames:
+        boundary = nominal
+        if keyframes:
+            position = bisect.bisect_left(keyframes, nominal)
+            if position == len(keyframes):
+                break
+            boundary = keyframes[position]
+        if not boundaries or boundary > boundaries[-1]:
+            boundaries.append(boundary)
+        nominal = boundary + segment_frames
+
+    starts = [0] + boundaries
+    ends = boundaries + [None]
+    return list(zip(starts, ends))
+
+
+def file_identity(path):
+    """文件的路径、大小和修改时间，用于判断输入是否变化"""
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+class SegmentManifest:
+    """分段处理的JSON清单，线程安全，每次更新都原子写回磁盘"""
+
+    def __init__(self, work_dir, data):
+        self.work_dir = work_dir
+        self.path = os.path.join(work_dir, MANIFEST_NAME)
+        self.data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, work_dir, signature, segments):
+        """
+        打开或创建清单
+
+        已有清单的签名(输入文件和处理选项)与本次一致时沿用其中的完成记录，
+        否则丢弃旧的片段文件重新开始
+        """
+        os.makedirs(work_dir, exist_ok=True)
+        path = os.path.join(work_dir, MANIFEST_NAME)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION and data.get('signature') == signature:
+                    manifest = cls(work_dir, data)
+                    done = len(manifest.segments) - len(manifest.pending())
+                    logger.info(f"继续未完成的任务: {done}/{len(manifest.segments)} 个片段已完成")
+                    return manifest
+                logger.info("输入文件或处理选项已变化，重新开始分段处理")
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取清单失败，重新开始: {e}")
+
+        data = {
+            'version': MANIFEST_VERSION,
+            'signature': signature,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'segments': [
+                {'index': i, 'start': start, 'end': end, 'file': f"segment_{i:05d}.mp4",
+                 'status': 'pending', 'frames': 0}
+                for i, (start, end) in enumerate(segments)
+            ],
+        }
+        manifest = cls(work_dir, data)
+        for segment in manifest.segments:
+            path = manifest.segment_path(segment)
+            if os.path.exists(path):
+                os.remove(path)
+        manifest.save()
+        return manifest
+
+    @property
+    def segments(self):
+        return self.data['segments']
+
+    def segment_path(self, segment):
+        return os.path.join(self.work_dir, segment['file'])
+
+    def temp_path(self, segment):
+        """片段编码中使用的临时文件名，完成后再替换为正式文件名"""
+        base, ext = os.path.splitext(segment['file'])
+        return os.path.join(self.work_dir, f"{base}.partial{ext}")
+
+    def pending(self):
+        """尚未完成(或文件已丢失)的片段"""
+        with self._lock:
+            return [s for s in self.segments
+                    if s['status'] != 'done' or not os.path.exists(self.segment_path(s))]
+
+    def mark_done(self, index, frames, elapsed):
+        with self._lock:
+            segment = self.segments[index]
+            segment.update(status='done', frames=int(frames), elapsed=round(elapsed, 3),
+                           finished=time.strftime('%Y-%m-%d %H:%M:%S'))
+            self._save_locked()
+
+    def mark_failed(self, index, error):
+        with self._lock:
+            self.segments[index].update(status='failed', error=str(error))
+            self._save_locked()
+
+    def done_frames(self):
+        with self._lock:
+            return sum(s['frames'] for s in self.segments if s['status'] == 'done')
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        fd, tmp_path = tempfile.mkstemp(prefix=".manifest_", suffix=".json", dir=self.work_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def concat_segments(segment_files, output_path, audio_source=None, ffmpeg_path=None):
+    """
+    把片段文件按顺序拼接为输出视频
+
+    有ffmpeg时以流复制方式拼接(不重新编码)，并从 audio_source 复制音轨；
+    否则用OpenCV逐帧读出后重新写入(mp4v，无音频)
+    """
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    if ffmpeg_path is not None:
+        fd, list_path = tempfile.mkstemp(prefix="concat_", suffix=".txt",
+                                         dir=os.path.dirname(os.path.abspath(segment_files[0])))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for path in segment_files:
+                    escaped = os.path.abspath(path).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            cmd = [ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error",
+                   "-f", "concat", "-safe", "0", "-i", list_path]
+            if audio_source:
+                cmd += ["-i", audio_source, "-map", "0:v:0", "-map", "1:a?", "-shortest"]
+            cmd += ["-c", "copy"]
+            if output_path.lower().endswith((".mp4", ".mov")):
+                cmd += ["-movflags", "+faststart"]
+            cmd.append(output_path)
+            logger.info(f"拼接片段: {' '.join(cmd)}")
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg拼接失败(返回码 {result.returncode}): {result.stderr.strip()}")
+        finally:
+            os.remove(list_path)
+        return output_path
+
+    logger.warning("找不到ffmpeg，使用OpenCV重新写入拼接后的视频(mp4v编码，不含音频)")
+    writer = None
+    try:
+        for path in segment_files:
+            cap = cv2.VideoCapture(path)
+            try:
+                if writer is None:
+                    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                    fps = cap.get(cv2.CAP_PROP_FPS)
+                    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+                    if not writer.isOpened():
+                        raise RuntimeError(f"无法创建视频文件: {output_path}")
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    writer.write(frame)
+            finally:
+                cap.release()
+    finally:
+        if writer is not None:
+            writer.release()
+    return output_path
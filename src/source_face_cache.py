@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+源人脸身份缓存 - 每个任务只解码和分析一次源人脸图片
+
+缓存以 (图片绝对路径, 文件修改时间) 为键，保存解码后的BGR图像、
+选中的InsightFace Face对象及其归一化特征向量，使逐帧处理只需分析目标帧。
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from face_library_store import find_library_store
+
+logger = logging.getLogger("source_face_cache")
+
+
+class SourceFaceEntry:
+    """单张源人脸图片的缓存条目"""
+
+    def __init__(self, image_path, mtime, image):
+        self.image_path = image_path
+        self.mtime = mtime
+        self.image = image          # 解码后的BGR图像
+        self.face = None            # 选中的InsightFace Face对象
+        self.embedding = None       # 选中人脸的归一化特征向量(normed_embedding)
+        self.landmarks = {}         # 传统方法的68点特征点，按检测器类型缓存
+
+
+class SourceFaceCache:
+    """线程安全的LRU源人脸缓存，供Tk、Qt和集成模块共享同一个FaceSwapApp实例时复用"""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_key(image_path):
+        """根据路径和修改时间生成缓存键，文件变化后自动失效"""
+        abs_path = os.path.abspath(image_path)
+        return abs_path, os.path.getmtime(abs_path)
+
+    @staticmethod
+    def select_face(faces):
+        """在源图像的多张人脸中选择面积最大的一张"""
+        if not faces:
+            return None
+        return max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+
+    def get(self, image_path, face_analyser=None):
+        """
+        获取源人脸缓存条目
+
+        首次访问时读取图片；传入face_analyser时还会检测人脸并缓存Face对象和特征向量。
+        图片无法读取时返回None。
+        """
+        try:
+            key = self._make_key(image_path)
+        except OSError as e:
+            logger.error(f"无法访问人脸图片: {image_path} ({e})")
+            return None
+
+        # 整个加载过程持有锁，避免多个工作线程在第一帧同时重复分析同一张图片
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            else:
+                image = cv2.imread(key[0])
+                if image is None:
+                    logger.error(f"无法读取人脸图片: {image_path}")
+                    return None
+                entry = SourceFaceEntry(key[0], key[1], image)
+                self._entries[key] = entry
+                self._evict()
+
+            if entry.face is None and face_analyser is not None:
+                self._analyse(entry, face_analyser)
+
+            return entry
+
+    def _analyse(self, entry, face_analyser):
+        """检测源图像中的人脸并缓存Face对象和特征向量，人脸库中已有的图片直接读取持久化结果"""
+        store = find_library_store(entry.image_path)
+        face = store.get_face(entry.image_path) if store is not None else None
+        if face is None:
+            try:
+                faces = face_analyser.get(entry.image)
+            except Exception as e:
+                logger.error(f"分析源人脸图片时出错: {e}")
+                return
+            face = self.select_face(faces)
+            if face is None:
+                logger.warning(f"源图像中未检测到人脸: {entry.image_path}")
+                return
+            if store is not None:
+                try:
+                    store.update(entry.image_path, face)
+                except Exception as e:
+                    logger.warning(f"写入人脸特征库失败: {e}")
+        entry.face = face
+        if getattr(face, 'embedding', None) is not None:
+            entry.embedding = face.normed_embedding
+        logger.info(f"已缓存源人脸: {os.path.basename(entry.image_path)}")
+
+    def _evict(self):
+        """超过容量时淘汰最久未使用的条目"""
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            logger.debug(f"淘汰源人脸缓存: {key[0]}")
+
+    def invalidate(self, image_path=None):
+        """清除指定图片的缓存，未指定时清空全部缓存"""
+        with self._lock:
+            if image_path is None:
+                self._entries.clear()
+                return
+            abs_path = os.path.abspath(image_path)
+            for key in [k for k in self._entries if k[0] == abs_path]:
+                del self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
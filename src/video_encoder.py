@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ffmpeg管道编码器 - 把BGR原始帧通过stdin直接送给ffmpeg子进程编码
+
+与 cv2.VideoWriter 的 mp4v(MPEG-4 Part 2) 相比，H.264/H.265 编码的文件更小，
+编码在独立进程中进行，可以利用空闲的CPU核心；原视频的音轨不重新编码直接复制。
+FFmpegVideoWriter 提供与 cv2.VideoWriter 相同的 write/release/isOpened 接口，
+找不到ffmpeg时 open_video_writer 自动退回到 cv2.VideoWriter。
+"""
+
+import shutil
+import logging
+import subprocess
+import tempfile
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("video_encoder")
+
+
+def find_ffmpeg():
+    """查找ffmpeg可执行文件：优先使用PATH中的ffmpeg，其次使用imageio_ffmpeg自带的版本"""
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+class FFmpegVideoWriter:
+    """通过stdin管道把BGR帧写入ffmpeg进程"""
+
+    def __init__(self, output_path, width, height, fps, codec="libx264", crf=20, preset="medium",
+                 threads=0, audio_source=None, audio_codec="copy", pix_fmt="yuv420p", ffmpeg_path=None):
+        """
+        codec/crf/preset: 视频编码器、质量(越小越好)和速度预设
+        threads: 编码线程数，0表示由ffmpeg自动决定
+        audio_source: 提供音轨的文件(通常是原视频)，为None时输出无音频
+        audio_codec: 音频编码方式，默认直接复制不重新编码
+        """
+        self.output_path = output_path
+        self.frame_size = (int(height), int(width), 3)
+        self.frames_written = 0
+        self._proc = None
+
+        ffmpeg_path = ffmpeg_path or find_ffmpeg()
+        if ffmpeg_path is None:
+            raise RuntimeError("找不到ffmpeg，请安装ffmpeg或imageio-ffmpeg")
+
+        cmd = [
+            ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{int(width)}x{int(height)}", "-r", f"{fps}",
+            "-i", "-",
+        ]
+        if audio_source:
+            cmd += ["-i", audio_source, "-map", "0:v:0", "-map", "1:a?", "-c:a", audio_codec, "-shortest"]
+        if int(width) % 2 or int(height) % 2:
+            # yuv420p要求宽高为偶数，奇数尺寸补一行/列黑边
+            cmd += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        cmd += ["-c:v", codec, "-pix_fmt", pix_fmt, "-threads", str(int(threads))]
+        if crf is not None:
+            cmd += ["-crf", str(crf)]
+        if preset:
+            cmd += ["-preset", preset]
+        if output_path.lower().endswith((".mp4", ".mov")):
+            # 把索引放到文件头，便于边下载边播放
+            cmd += ["-movflags", "+faststart"]
+        cmd.append(output_path)
+
+        # stderr写入临时文件，避免管道缓冲区写满后阻塞ffmpeg
+        self._stderr = tempfile.TemporaryFile()
+        logger.info(f"启动ffmpeg编码器: {' '.join(cmd)}")
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr)
+
+    def _error_output(self):
+        try:
+            self._stderr.seek(0)
+            return self._stderr.read().decode("utf-8", errors="replace").strip()
+        except Exception:
+            return ""
+
+    def isOpened(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def write(self, frame):
+        """写入一帧BGR图像，尺寸必须与创建时一致"""
+        if frame.shape != self.frame_size:
+            raise ValueError(f"帧尺寸 {frame.shape} 与编码器尺寸 {self.frame_size} 不一致")
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+        except (BrokenPipeError, OSError) as e:
+            raise RuntimeError(f"ffmpeg编码进程已退出: {self._error_output() or e}")
+        self.frames_written += 1
+
+    def release(self):
+        """结束输入并等待ffmpeg写完文件；编码失败时抛出RuntimeError"""
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = proc.wait()
+        error = self._error_output()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg编码失败(返回码 {returncode}): {error}")
+        logger.info(f"ffmpeg编码完成: {self.frames_written}帧 -> {self.output_path}")
+
+
+def open_video_writer(output_path, width, height, fps, backend="auto", **options):
+    """
+    创建视频写入器
+
+    backend: "ffmpeg" 使用ffmpeg管道；"opencv" 使用 cv2.VideoWriter(mp4v，无音频)；
+             "auto" 有ffmpeg时使用ffmpeg，否则退回OpenCV
+    options: 传给 FFmpegVideoWriter 的编码参数
+    """
+    if backend in ("auto", "ffmpeg"):
+        ffmpeg_path = find_ffmpeg()
+        if ffmpeg_path is not None:
+            return FFmpegVideoWriter(output_path, width, height, fps, ffmpeg_path=ffmpeg_path, **options)
+        if backend == "ffmpeg":
+            raise RuntimeError("找不到ffmpeg，请安装ffmpeg或imageio-ffmpeg")
+        logger.warning("找不到ffmpeg，使用OpenCV写入视频(mp4v编码，不含音频)")
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # MP4格式
+    writer = cv2.VideoWriter(output_path, fourcc, fps, (int(width), int(height)))
+    if not writer.isOpened():
+        raise RuntimeError(f"无法创建视频文件: {output_path}")
+    return writer
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分阶段视频处理流水线 - 解码 → 检测 → 换脸 → 融合 → 编码
+
+每个阶段在自己的工作线程中运行，阶段之间用有界队列连接：
+    * 下游处理慢时上游的 put 会阻塞，内存占用有上限(背压)
+    * 每个阶段可以单独设置并行线程数和批大小
+    * 解码和编码与推理重叠进行，不会互相等待
+    * stats() 返回每个阶段的队列深度、吞吐量和忙碌比例，便于调参
+
+最后一个阶段把结果放入 ReorderBuffer，编码线程按帧索引顺序取出；
+解码线程在读入新帧前向缓冲区申请窗口，某一帧很慢时整条流水线的帧数有硬上限。
+阶段函数处理出错时记录日志并把帧原样传给下一阶段，最终写出原始帧。
+"""
+
+import time
+import queue
+import logging
+import threading
+
+from reorder_buffer import ReorderBuffer
+
+logger = logging.getLogger("video_pipeline")
+
+# 阶段结束标记
+_END = object()
+
+
+class ProcessingCancelled(Exception):
+    """帧来源在处理被取消时抛出，流水线停止并在 run() 中重新抛出"""
+
+
+class FrameItem:
+    """在流水线中流动的一帧"""
+
+    __slots__ = ('index', 'frame', 'result', 'faces', 'reference', 'detected')
+
+    def __init__(self, index, frame):
+        self.index = index
+        self.frame = frame      # 解码得到的原始帧
+        self.result = None      # 处理后的帧，None表示尚未处理或处理失败
+        self.faces = None       # 检测/跟踪得到的目标人脸
+        self.reference = None   # 相似帧门控开启时提供检测结果的参考帧(可以是自身)
+        self.detected = None    # 参考帧检测完成的事件
+
+
+class PipelineStage:
+    """
+    流水线中的一个阶段
+
+    fn: batch_size为1时签名为 fn(item)，否则为 fn(items)；原地修改FrameItem即可
+    workers: 并行线程数，需要按帧顺序处理的阶段(如人脸跟踪)必须为1
+    batch_size: 每次最多取多少帧一起处理
+    """
+
+    def __init__(self, name, fn, workers=1, batch_size=1, queue_size=8, batch_wait=0.02):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_wait = batch_wait
+        # 输入队列至少能放下所有线程各一个批次
+        self.queue = queue.Queue(maxsize=max(int(queue_size), self.batch_size * self.workers))
+
+        self.processed = 0
+        self.busy_time = 0.0
+        self._stats_lock = threading.Lock()
+
+    def record(self, count, elapsed):
+        with self._stats_lock:
+            self.processed += count
+            self.busy_time += elapsed
+
+
+class VideoPipeline:
+    """由解码源、若干处理阶段和编码端组成的有界队列流水线"""
+
+    def __init__(self, source, stages, sink, reorder_capacity=64, start_index=0):
+        """
+        source: 可迭代对象，按顺序产生索引从start_index连续递增的FrameItem，在解码线程中迭代
+        stages: PipelineStage 列表，按顺序执行
+        sink: sink(index, frame) 在单独的编码线程中按帧索引顺序调用
+        reorder_capacity: 已解码但尚未写出的最大帧数
+        start_index: 第一帧的帧索引，分段处理时为片段的起始帧
+        """
+        self.source = source
+        self.stages = list(stages)
+        self.sink = sink
+        # 窗口至少要容纳所有线程各一个批次，否则批次永远凑不满
+        min_capacity = sum(stage.workers * stage.batch_size for stage in self.stages) + 1
+        self.start_index = int(start_index)
+        self.reorder = ReorderBuffer(max(int(reorder_capacity), min_capacity), start_index=self.start_index)
+        self.decoded = 0
+        self.decode_time = 0.0
+        self.encoded = 0
+        self.encode_time = 0.0
+
+        self._stop = threading.Event()
+        self._error = None
+        self._start_time = None
+        self._threads = []
+        self._finished_workers = {}
+        self._finish_lock = threading.Lock()
+
+    def _put(self, q, item):
+        """带停止检查的阻塞put，流水线中止时返回False"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q, timeout=None):
+        """带停止检查的阻塞get，流水线中止时返回_END；timeout到期时抛出queue.Empty"""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not self._stop.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.perf_counter())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, stage_name, error):
+        """记录致命错误并中止整条流水线"""
+        if self._error is None:
+            self._error = error
+            if isinstance(error, ProcessingCancelled):
+                logger.info(f"流水线已取消: {error}")
+            else:
+                logger.error(f"流水线阶段 {stage_name} 出错，停止处理: {error}")
+        self.stop()
+
+    def _emit(self, item):
+        """把处理完的帧放入重排缓冲区，处理失败时写出原始帧"""
+        self.reorder.put(item.index, item.result, original=item.frame)
+
+    def _signal_end(self, position):
+        """通知第position个阶段的所有线程输入已结束"""
+        stage = self.stages[position]
+        for _ in range(stage.workers):
+            if not self._put(stage.queue, _END):
+                return
+
+    def _decode_loop(self):
+        try:
+            iterator = iter(self.source)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                item = next(iterator, None)
+                self.decode_time += time.perf_counter() - start
+                if item is None:
+                    break
+                # 重排窗口已满时在这里等待，不再读入新帧
+                if not self.reorder.acquire(item.index):
+                    return
+                self.decoded += 1
+                if not self.stages:
+                    self._emit(item)
+                elif not self._put(self.stages[0].queue, item):
+                    return
+        except Exception as e:
+            self._fail("decode", e)
+            return
+        self.reorder.close(self.start_index + self.decoded)
+        if self.stages:
+            self._signal_end(0)
+
+    def _encode_loop(self):
+        while True:
+            entry = self.reorder.get()
+            if entry is None:
+                return
+            start = time.perf_counter()
+            try:
+                self.sink(*entry)
+            except Exception as e:
+                self._fail("encode", e)
+                return
+            self.encode_time += time.perf_counter() - start
+            self.encoded += 1
+
+    def _next_batch(self, stage):
+        """取一个批次；第一帧阻塞等待，之后在batch_wait内尽量凑满批次"""
+        first = self._get(stage.queue)
+        if first is _END:
+            return [], True
+        batch = [first]
+        while len(batch) < stage.batch_size:
+            try:
+                item = self._get(stage.queue, timeout=stage.batch_wait)
+            except queue.Empty:
+                break
+            if item is _END:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _stage_loop(self, position):
+        stage = self.stages[position]
+        is_last = position == len(self.stages) - 1
+        ended = False
+        while not ended and not self._stop.is_set():
+            batch, ended = self._next_batch(stage)
+            if not batch:
+                break
+
+            start = time.perf_counter()
+            try:
+                if stage.batch_size > 1:
+                    stage.fn(batch)
+                else:
+                    stage.fn(batch[0])
+            except Exception as e:
+                # 单帧出错不影响整个视频，原样传给下游
+                logger.error(f"阶段 {stage.name} 处理帧 {batch[0].index} 时出错: {e}")
+            stage.record(len(batch), time.perf_counter() - start)
+
+            for item in batch:
+                if is_last:
+                    self._emit(item)
+                elif not self._put(self.stages[position + 1].queue, item):
+                    return
+
+        if is_last:
+            return
+        # 最后一个结束的线程负责通知下一阶段
+        with self._finish_lock:
+            self._finished_workers[position] = self._finished_workers.get(position, 0) + 1
+            last = self._finished_workers[position] == stage.workers
+        if last:
+            self._signal_end(position + 1)
+
+    def run(self):
+        """运行流水线直到所有帧写出；任一致命错误会在这里重新抛出"""
+        self._start_time = time.perf_counter()
+        self._threads = [
+            threading.Thread(target=self._decode_loop, name="pipeline-decode", daemon=True),
+            threading.Thread(target=self._encode_loop, name="pipeline-encode", daemon=True),
+        ]
+        for position, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                self._threads.append(threading.Thread(
+                    target=self._stage_loop, args=(position,),
+                    name=f"pipeline-{stage.name}-{i}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        for thread in self._threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+        logger.info(f"流水线完成: {self.format_stats()}")
+        return self.encoded
+
+    def stop(self):
+        """请求中止流水线，run() 会在各线程退出后返回"""
+        self._stop.set()
+        self.reorder.abort()
+
+    def stats(self):
+        """返回每个阶段的统计信息列表"""
+        elapsed = max(time.perf_counter() - (self._start_time or time.perf_counter()), 1e-6)
+        result = [{
+            'name': 'decode',
+            'workers': 1,
+            'queue_depth': 0,
+            'processed': self.decoded,
+            'fps': self.decoded / elapsed,
+            'busy': min(1.0, self.decode_time / elapsed),
+        }]
+        for stage in self.stages:
+            result.append({
+                'name': stage.name,
+                'workers': stage.workers,
+                'queue_depth': stage.queue.qsize(),
+                'processed': stage.processed,
+                'fps': stage.processed / elapsed,
+                'busy': min(1.0, stage.busy_time / (elapsed * stage.workers)),
+            })
+        result.append({
+            'name': 'encode',
+            'workers': 1,
+            'queue_depth': len(self.reorder),
+            'processed': self.encoded,
+            'fps': self.encoded / elapsed,
+            'busy': min(1.0, self.encode_time / elapsed),
+        })
+        return result
+
+    def format_stats(self):
+        """把统计信息格式化为一行日志"""
+        return ", ".join(
+            f"{s['name']}[x{s['workers']}] 队列{s['queue_depth']} {s['fps']:.1f}帧/秒 忙碌{s['busy'] * 100:.0f}%"
+            for s in self.stats()
+        )
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""测试公共设置：源码模块都在 src 目录下，以顶层模块名导入"""
+
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def run_with_timeout(fn, timeout=30):
+    """在后台线程中运行fn并返回结果，超时说明处理卡住，直接判为失败"""
+    result = {}
+
+    def target():
+        try:
+            result['value'] = fn()
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        pytest.fail(f"{timeout}秒内没有完成，处理可能卡住")
+    if 'error' in result:
+        raise result['error']
+    return result.get('value')
+
+
+def write_test_video(path, frames=30, size=(64, 48), fps=10):
+    """写一个每帧亮度不同的mp4v小视频，便于按帧核对输出顺序"""
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for i in range(frames):
+        writer.write(np.full((height, width, 3), (i * 8) % 256, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def read_frame_count(path):
+    video = cv2.VideoCapture(path)
+    count = 0
+    while video.read()[0]:
+        count += 1
+    video.release()
+    return count
+
+
+@pytest.fixture
+def sample_video(tmp_path):
+    return write_test_video(str(tmp_path / "input.mp4"))
+
+
+@pytest.fixture
+def blank_face(tmp_path):
+    """没有人脸的源图片，换脸流水线没有处理阶段，帧原样写出"""
+    path = str(tmp_path / "face.png")
+    cv2.imwrite(path, np.full((64, 64, 3), 128, dtype=np.uint8))
+    return path
+
+
+@pytest.fixture
+def headless_engine(tmp_path):
+    """只用OpenCV的引擎，不需要dlib、InsightFace和ffmpeg"""
+    from engine import FaceSwapEngine
+
+    app = FaceSwapEngine(base_dir=str(tmp_path / "base"))
+    app.swapper_var = "traditional"
+    app.detector_var = "opencv"
+    app.video_encoder = "opencv"
+    app.keep_audio = False
+    return app
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from conftest import run_with_timeout
+from batch_jobs import parse_args, run_batch
+
+
+def test_job_setup_failure_is_recorded_and_batch_continues(headless_engine, sample_video, blank_face, tmp_path,
+                                                           monkeypatch):
+    parser, defaults = parse_args(["manifest.json", "--swapper", "traditional", "--detector", "opencv",
+                                   "--encoder", "opencv", "--no-audio"])
+    clone = headless_engine.clone_for_job
+    calls = []
+
+    def failing_clone():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("模型加载失败")
+        return clone()
+
+    monkeypatch.setattr(headless_engine, "clone_for_job", failing_clone)
+    jobs = [{'video': sample_video, 'face': blank_face, 'output': str(tmp_path / f"out{i}.mp4")} for i in range(2)]
+    report_path = str(tmp_path / "report.json")
+
+    data = run_with_timeout(lambda: run_batch(headless_engine, parser, defaults, jobs, report_path), timeout=60)
+    assert [job['status'] for job in data['jobs']] == ['failed', 'done']
+    assert data['jobs'][0]['error'] == "模型加载失败"
+    with open(report_path, encoding="utf-8") as f:
+        assert json.load(f)['summary'] == {'done': 1, 'failed': 1, 'skipped': 0}
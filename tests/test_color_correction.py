@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from color_correction import ReferenceStatsCache
+
+
+ROI = (10, 10, 40, 40)
+
+
+def counting():
+    calls = []
+
+    def compute():
+        calls.append(len(calls))
+        return len(calls)
+    return calls, compute
+
+
+def test_callers_do_not_share_stats():
+    cache = ReferenceStatsCache()
+    calls, compute = counting()
+    assert cache.get(('color_correct', 'lab'), ROI, compute, 0) == 1
+    assert cache.get(('balance_face_roi', 'lab'), ROI, compute, 0) == 2
+    assert cache.get(('color_correct', 'lab'), ROI, compute, 1) == 1
+    assert len(calls) == 2
+
+
+def test_reuse_limited_by_frame_gap_and_count():
+    cache = ReferenceStatsCache(max_reuse=2, max_gap=3)
+    calls, compute = counting()
+    assert [cache.get('lab', ROI, compute, i) for i in (0, 1, 2)] == [1, 1, 1]
+    # 复用次数用完后重新计算
+    assert cache.get('lab', ROI, compute, 3) == 2
+    # 相距超过 max_gap 的帧不复用
+    assert cache.get('lab', ROI, compute, 10) == 3
+
+
+def test_no_reuse_across_scene_cut():
+    cache = ReferenceStatsCache(max_gap=100)
+    calls, compute = counting()
+    cache.scene_cut(5)
+    # 切换点前的帧晚于切换处理，它的统计量也不能给切换后的帧用
+    assert cache.get('lab', ROI, compute, 4) == 1
+    assert cache.get('lab', ROI, compute, 5) == 2
+    assert cache.get('lab', ROI, compute, 6) == 2
+    assert cache.get('lab', ROI, compute, 3) == 3
+
+
+def test_scene_cut_drops_entries():
+    cache = ReferenceStatsCache()
+    calls, compute = counting()
+    cache.get('lab', ROI, compute)
+    assert cache.get('lab', ROI, compute) == 1
+    cache.scene_cut(0)
+    assert cache.get('lab', ROI, compute) == 2
+    cache.clear()
+    assert cache.get('lab', ROI, compute, 1) == 3
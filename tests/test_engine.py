@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+
+import numpy as np
+
+from conftest import SRC_DIR
+
+
+def test_import_loads_no_gui_or_model_backends():
+    code = ("import sys, engine; engine.FaceSwapEngine; "
+            "print(','.join(m for m in ('tkinter', 'PyQt5', 'moviepy', 'dlib', 'insightface', 'onnxruntime') "
+            "if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == ""
+
+
+def test_process_single_frame_without_source_face(headless_engine, blank_face):
+    headless_engine.face_images = [blank_face]
+    headless_engine.selected_face_index = 0
+    frame = np.full((48, 64, 3), 90, dtype=np.uint8)
+    result = headless_engine.process_single_frame(frame)
+    assert result is frame
+
+
+def test_traditional_worker_uses_job_base_dir(tmp_path):
+    from engine import create_traditional_worker
+
+    base_dir = tmp_path / "job"
+    options = {'base_dir': str(base_dir), 'detector_var': "opencv", 'multi_scale_var': False,
+               'debug_capture_mode': "failures"}
+    process = create_traditional_worker(options, str(tmp_path / "models" / "predictor.dat"),
+                                        str(tmp_path / "models" / "cascade.xml"),
+                                        np.zeros((8, 8, 3), dtype=np.uint8), np.zeros((68, 2), dtype=np.int32))
+    assert callable(process)
+    assert sorted(p.name for p in base_dir.iterdir()) == ["logs", "models", "output_videos"]
+
+
+def test_debug_capture_under_base_dir(headless_engine, tmp_path):
+    assert headless_engine.create_debug_capture().directory == str(tmp_path / "base" / "debug")
+
+
+def test_smoothing_feathers_face_edge(headless_engine):
+    frame = np.zeros((40, 40, 3), dtype=np.uint8)
+    result = frame.copy()
+    result[10:30, 10:30] = 200
+    mask = np.zeros((40, 40), dtype=np.uint8)
+    mask[10:30, 10:30] = 255
+
+    headless_engine.smoothing_var = 0
+    assert headless_engine.smooth_face_edge(result, frame, mask) is result
+
+    headless_engine.smoothing_var = 50
+    smoothed = headless_engine.smooth_face_edge(result, frame, mask)
+    # 掩码边缘向内逐渐过渡到换脸结果，中心和掩码外不变
+    assert 0 < smoothed[20, 10, 0] < smoothed[20, 12, 0] < 200
+    assert smoothed[20, 20, 0] == 200
+    assert smoothed[20, 5, 0] == 0
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+from face_landmarks import LandmarkExtractor, shape_to_array
+
+
+class FakeShape:
+    """与 dlib.full_object_detection 接口相同的特征点结果"""
+
+    def __init__(self, points):
+        self._points = [SimpleNamespace(x=int(x), y=int(y)) for x, y in points]
+        self.num_parts = len(self._points)
+
+    def parts(self):
+        return self._points
+
+
+def fake_predictor(image, rect):
+    return FakeShape([(rect + i, rect + 2 * i) for i in range(68)])
+
+
+def test_shape_to_array():
+    points = [(i, 100 - i) for i in range(68)]
+    array = shape_to_array(FakeShape(points))
+    assert array.dtype == np.int32 and array.shape == (68, 2)
+    assert array.tolist() == [list(p) for p in points]
+
+
+def test_predict_reuses_thread_buffer():
+    extractor = LandmarkExtractor()
+    first = extractor.predict(fake_predictor, None, 0)
+    kept = extractor.predict(fake_predictor, None, 0, copy=True)
+    second = extractor.predict(fake_predictor, None, 5)
+    assert second is first
+    assert first[0].tolist() == [5, 5]
+    assert kept[0].tolist() == [0, 0]
+
+
+def test_threads_use_separate_buffers():
+    extractor = LandmarkExtractor()
+    main = extractor.predict(fake_predictor, None, 1)
+    other = []
+    thread = threading.Thread(target=lambda: other.append(extractor.predict(fake_predictor, None, 7)))
+    thread.start()
+    thread.join()
+    assert other[0] is not main
+    assert main[0].tolist() == [1, 1]
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from face_library_store import FaceLibraryStore, refresh_library_async
+
+
+class FakeAnalyser:
+    """按图片亮度生成固定特征向量的分析器，记录分析次数"""
+
+    def __init__(self, on_get=None):
+        self.calls = 0
+        self.on_get = on_get
+
+    def get(self, image):
+        self.calls += 1
+        if self.on_get is not None:
+            self.on_get()
+        return [make_face(float(image.mean()))]
+
+
+def make_face(value):
+    embedding = np.full(512, value, dtype=np.float32)
+    return SimpleNamespace(bbox=np.array([0, 0, 10, 10], dtype=np.float32),
+                           kps=np.zeros((5, 2), dtype=np.float32), det_score=0.9, embedding=embedding)
+
+
+def write_image(directory, name, value):
+    path = os.path.join(directory, name)
+    cv2.imwrite(path, np.full((8, 8, 3), value, dtype=np.uint8))
+    return path
+
+
+def test_partial_refresh_keeps_other_images(tmp_path):
+    library = str(tmp_path)
+    a = write_image(library, "a.png", 10)
+    b = write_image(library, "b.png", 20)
+    store = FaceLibraryStore(library)
+    assert store.refresh(FakeAnalyser()) == 2
+
+    write_image(library, "b.png", 30)
+    assert store.refresh(FakeAnalyser(), image_paths=[b]) == 1
+
+    names, matrix = store.embedding_matrix()
+    assert sorted(names) == ["a.png", "b.png"]
+    assert store.lookup(a)[1][0] == 10
+    assert store.lookup(b)[1][0] == 30
+    assert matrix.shape == (2, 512)
+
+
+def test_update_reuses_rows(tmp_path):
+    library = str(tmp_path)
+    a = write_image(library, "a.png", 10)
+    write_image(library, "b.png", 20)
+    store = FaceLibraryStore(library)
+    store.refresh(FakeAnalyser())
+
+    for value in (40, 50, 60):
+        store.update(a, make_face(value))
+    assert store.embedding_matrix()[1].shape == (2, 512)
+    assert store.lookup(a)[1][0] == 60
+
+    reopened = FaceLibraryStore(library)
+    assert np.load(reopened.embeddings_path).shape == (2, 512)
+    assert reopened.lookup(a)[1][0] == 60
+
+
+def test_refresh_analyses_without_holding_lock(tmp_path):
+    library = str(tmp_path)
+    write_image(library, "a.png", 10)
+    store = FaceLibraryStore(library)
+    lock_free = []
+
+    def try_lock():
+        if store._lock.acquire(timeout=1):
+            store._lock.release()
+            lock_free.append(True)
+
+    def probe():
+        # 分析期间其他线程必须能拿到锁，否则任务启动会被刷新阻塞
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+
+    store.refresh(FakeAnalyser(on_get=probe))
+    assert lock_free == [True]
+
+
+def test_refresh_removes_deleted_images(tmp_path):
+    library = str(tmp_path)
+    write_image(library, "a.png", 10)
+    b = write_image(library, "b.png", 20)
+    store = FaceLibraryStore(library)
+    store.refresh(FakeAnalyser())
+
+    os.remove(b)
+    analyser = FakeAnalyser()
+    store.refresh(analyser)
+    assert analyser.calls == 0
+    assert store.embedding_matrix()[0] == ["a.png"]
+
+
+def test_async_refresh_resolves_analyser_in_background(tmp_path):
+    library = str(tmp_path)
+    a = write_image(library, "a.png", 10)
+    callers = []
+
+    def get_face_analyser():
+        # 引擎的模型在第一次读取分析器时加载，这一步不能发生在界面线程
+        callers.append(threading.current_thread())
+        return FakeAnalyser()
+
+    store = refresh_library_async(library, get_face_analyser)
+    deadline = time.time() + 5
+    while store.lookup(a) is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert store.lookup(a) is not None
+    assert len(callers) == 1 and callers[0] is not threading.main_thread()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import cv2
+import numpy as np
+
+from face_mesh import SourceFaceMesh, delaunay_triangles, triangle_rects
+
+
+def grid_landmarks(offset=(20, 20), step=10, count=5):
+    xs, ys = np.meshgrid(np.arange(count) * step, np.arange(count) * step)
+    return np.stack([xs.ravel() + offset[0], ys.ravel() + offset[1]], axis=1).astype(np.int32)
+
+
+def gradient_image(size=100):
+    ys, xs = np.mgrid[0:size, 0:size]
+    return np.dstack([xs, ys, (xs + ys) // 2]).astype(np.uint8)
+
+
+def test_delaunay_covers_grid():
+    points = grid_landmarks()
+    triangles = delaunay_triangles(points)
+    # 5x5网格有 4*4*2 个三角形，覆盖面积等于网格面积
+    assert triangles.shape == (32, 3)
+    area = sum(abs(cv2.contourArea(points[t].astype(np.float32))) for t in triangles)
+    assert area == 40 * 40
+
+
+def test_triangle_rects_match_opencv():
+    points = grid_landmarks()
+    tri_points = points[delaunay_triangles(points)]
+    expected = [cv2.boundingRect(t) for t in tri_points]
+    assert [tuple(r) for r in triangle_rects(tri_points)] == expected
+
+
+def test_identity_field_maps_pixels_to_themselves():
+    landmarks = grid_landmarks()
+    mesh = SourceFaceMesh(gradient_image(), landmarks)
+    field = mesh.warp_field(landmarks, (100, 100))
+    x0, y0, w, h = field.roi
+    assert (x0, y0) == (20, 20)
+    ys, xs = np.nonzero(field.mask)
+    assert field.mask.mean() > 0.9
+    assert np.allclose(field.map_x[ys, xs], xs + x0, atol=1e-3)
+    assert np.allclose(field.map_y[ys, xs], ys + y0, atol=1e-3)
+
+
+def test_translated_face_samples_shifted_source():
+    source = gradient_image()
+    mesh = SourceFaceMesh(source, grid_landmarks())
+    frame = np.zeros_like(source)
+    field = mesh.warp_field(grid_landmarks(offset=(30, 25)), frame.shape)
+    result = field.apply(source, frame)
+
+    x0, y0, w, h = field.roi
+    ys, xs = np.nonzero(field.mask)
+    # 帧中 (x, y) 的像素来自源图像 (x - 10, y - 5)
+    assert np.array_equal(result[ys + y0, xs + x0], source[ys + y0 - 5, xs + x0 - 10])
+    outside = np.ones(frame.shape[:2], dtype=bool)
+    outside[y0:y0 + h, x0:x0 + w] = ~field.mask
+    assert not result[outside].any()
+
+
+def test_field_cache_reuses_within_tolerance():
+    landmarks = grid_landmarks()
+    mesh = SourceFaceMesh(gradient_image(), landmarks)
+    first = mesh.warp_field(landmarks, (100, 100))
+    assert mesh.warp_field(landmarks + 0.5, (100, 100), tolerance=1.0) is first
+    assert mesh.warp_field(landmarks + 3, (100, 100), tolerance=1.0) is not first
+    assert (mesh.cache_hits, mesh.cache_misses) == (1, 2)
+
+
+def test_face_outside_frame_has_no_field():
+    mesh = SourceFaceMesh(gradient_image(), grid_landmarks())
+    assert mesh.warp_field(grid_landmarks(offset=(200, 200)), (100, 100)) is None
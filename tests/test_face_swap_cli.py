@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+import json
+import subprocess
+
+import pytest
+
+from conftest import SRC_DIR
+from face_swap_cli import add_option_arguments, parse_args
+
+
+def test_smoothing_range():
+    assert parse_args(["video.mp4", "face.png", "--smoothing", "80"]).smoothing == 80
+    assert parse_args(["video.mp4", "face.png"]).smoothing == 50
+    with pytest.raises(SystemExit):
+        parse_args(["video.mp4", "face.png", "--smoothing", "101"])
+
+
+def test_progress_json_keeps_stdout_clean(sample_video, blank_face, tmp_path):
+    output = str(tmp_path / "out.mp4")
+    completed = subprocess.run(
+        [sys.executable, os.path.join(SRC_DIR, "face_swap_cli.py"), sample_video, blank_face, output,
+         "--swapper", "traditional", "--detector", "opencv", "--encoder", "opencv", "--no-audio",
+         "--no-progress-bar", "--progress-json", "-"],
+        capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    events = [json.loads(line) for line in completed.stdout.splitlines()]
+    assert events and all(isinstance(event, dict) for event in events)
+    assert "处理完成" in completed.stderr
+
+
+@pytest.mark.parametrize("value, expected", [("auto", "auto"), ("AUTO", "auto"), ("320", 320), ("480x480", 480)])
+def test_det_size_accepts_auto_pixels_and_square(value, expected):
+    assert parse_args(["video.mp4", "face.png", "--det-size", value]).det_size == expected
+
+
+@pytest.mark.parametrize("value", ["big", "640x480", "100", "0", "-32", "32x32x32"])
+def test_det_size_rejected_on_command_line(value):
+    with pytest.raises(SystemExit):
+        parse_args(["video.mp4", "face.png", "--det-size", value])
+
+
+def test_det_size_rejected_in_job_options():
+    from batch_jobs import coerce_option
+
+    parser = argparse.ArgumentParser()
+    add_option_arguments(parser)
+    assert coerce_option(parser, "det_size", 640) == 640
+    assert coerce_option(parser, "det_size", "640x640") == 640
+    for value in ("640x480", 100, True):
+        with pytest.raises(ValueError):
+            coerce_option(parser, "det_size", value)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import numpy as np
+
+from frame_gate import FrameSimilarityGate, assign_reference, shared_detection, REUSE, DETECT, SCENE
+from video_pipeline import FrameItem
+
+
+def gray(value, shape=(72, 128, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_classifies_static_changed_and_scene_cut_frames():
+    gate = FrameSimilarityGate(static_threshold=1.5, scene_threshold=30.0)
+    decisions = [gate.classify(gray(v)) for v in (100, 101, 100, 110, 111, 200)]
+    assert decisions == [DETECT, REUSE, REUSE, DETECT, REUSE, SCENE]
+    assert gate.stats() == {'frames': 6, 'detected': 3, 'reused': 3, 'scene_cuts': 1, 'reuse_ratio': 0.5}
+
+
+def test_compares_with_reference_not_previous_frame():
+    # 每帧只比上一帧亮1，但累积的变化超过阈值后重新检测
+    gate = FrameSimilarityGate(static_threshold=1.5, scene_threshold=30.0)
+    decisions = [gate.classify(gray(100 + i)) for i in range(4)]
+    assert decisions == [DETECT, REUSE, DETECT, REUSE]
+
+
+def test_max_reuse_forces_detection():
+    gate = FrameSimilarityGate(max_reuse=2)
+    assert [gate.classify(gray(50)) for _ in range(5)] == [DETECT, REUSE, REUSE, DETECT, REUSE]
+
+
+def test_reset_clears_reference():
+    gate = FrameSimilarityGate()
+    gate.classify(gray(50))
+    gate.reset()
+    assert gate.classify(gray(50)) == DETECT
+    assert gate.stats()['frames'] == 1
+
+
+def test_similar_frames_share_reference_detection():
+    gate = FrameSimilarityGate()
+    items = list(assign_reference(gate, [FrameItem(i, gray(v)) for i, v in enumerate((100, 100, 180, 180))]))
+    assert [item.reference.index for item in items] == [0, 0, 2, 2]
+
+    calls = []
+
+    def detect_for(item):
+        def detect():
+            calls.append(item.index)
+            return [f"face{item.index}"]
+        return detect
+
+    # 相似帧先出队时等待参考帧完成检测
+    results = {}
+    waiter = threading.Thread(target=lambda: results.update({1: shared_detection(items[1], detect_for(items[1]))}))
+    waiter.start()
+    results[0] = shared_detection(items[0], detect_for(items[0]))
+    waiter.join(2)
+    results[2] = shared_detection(items[2], detect_for(items[2]))
+    results[3] = shared_detection(items[3], detect_for(items[3]))
+
+    assert results == {0: ["face0"], 1: ["face0"], 2: ["face2"], 3: ["face2"]}
+    assert sorted(calls) == [0, 2]
+
+
+def test_without_reference_detects_directly():
+    item = FrameItem(0, gray(0))
+    assert shared_detection(item, lambda: "faces") == "faces"
+
+
+def test_scene_cut_reported_before_frame_is_yielded():
+    gate = FrameSimilarityGate()
+    cuts = []
+    yielded = []
+    for item in assign_reference(gate, [FrameItem(i, gray(v)) for i, v in enumerate((100, 100, 200, 200))],
+                                 on_scene_cut=cuts.append):
+        yielded.append((item.index, list(cuts)))
+    assert cuts == [2]
+    assert yielded[2] == (2, [2])
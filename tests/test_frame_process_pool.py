@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from conftest import run_with_timeout
+from frame_process_pool import FrameProcessPool
+
+
+def invert_worker(offset):
+    """工作进程中的处理函数工厂，spawn模式下必须是可导入的顶层函数"""
+    def process(frame, index=None):
+        return 255 - frame + offset
+    return process
+
+
+def test_pool_processes_frames_in_spawned_workers():
+    def run():
+        with FrameProcessPool((4, 4, 3), invert_worker, (0,), max_workers=2) as pool:
+            assert pool._executor._mp_context.get_start_method() == "spawn"
+            futures = [pool.submit(i, np.full((4, 4, 3), i, dtype=np.uint8)) for i in range(6)]
+            return [future.result(timeout=30) for future in futures]
+
+    results = run_with_timeout(run, timeout=60)
+    assert [index for index, _ in results] == list(range(6))
+    for index, frame in results:
+        assert (frame == 255 - index).all()
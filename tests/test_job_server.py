@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import job_client
+from conftest import read_frame_count, run_with_timeout
+
+
+@pytest.fixture
+def job_server_url(headless_engine, tmp_path):
+    from face_swap_cli import add_option_arguments
+    from job_server import JobServer, JobStore, JobRequestHandler
+
+    parser = argparse.ArgumentParser()
+    add_option_arguments(parser)
+    server = JobServer(headless_engine, parser.parse_args([]), JobStore(str(tmp_path / "jobs.json")))
+    server.start()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), JobRequestHandler)
+    httpd.job_server = server
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+    server.stop()
+
+
+def test_server_available_without_server():
+    assert not job_client.server_available("http://127.0.0.1:9")
+
+
+def test_job_options_follow_engine_settings(headless_engine):
+    headless_engine.encoder_crf = 18
+    headless_engine.color_correction_var = True
+    options = job_client.job_options(headless_engine)
+    assert options['crf'] == 18
+    assert options['detector'] == "opencv"
+    assert options['no_audio'] is True
+    assert options['no_color_correction'] is False
+    # 引擎上没有设置的选项不提交，由服务使用默认值
+    assert 'swap_method' not in options
+
+
+def test_engine_submits_to_server(job_server_url, sample_video, blank_face, tmp_path):
+    from engine import FaceSwapEngine
+
+    assert job_client.server_available(job_server_url)
+    client = FaceSwapEngine(base_dir=str(tmp_path / "client"))
+    client.detector_var = "opencv"
+    client.video_encoder = "opencv"
+    client.keep_audio = False
+    client.video_path = sample_video
+    client.face_images = [blank_face]
+    client.selected_face_index = 0
+    client.output_path = str(tmp_path / "remote.mp4")
+
+    result = run_with_timeout(lambda: client.process_video_via_server(url=job_server_url, poll_interval=0.1))
+    assert result == client.output_path
+    assert client.job_metrics['frames'] == 30
+    assert read_frame_count(result) == 30
+    # 客户端引擎没有加载任何模型
+    assert client.models.loaded() == []
+
+
+def test_invalid_det_size_rejected_on_submit(job_server_url, sample_video, blank_face):
+    with pytest.raises(RuntimeError):
+        job_client.submit_job(sample_video, blank_face, options={'det_size': "640x480"}, url=job_server_url)
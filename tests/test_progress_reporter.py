@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import logging
+
+from progress_reporter import (ProgressReporter, LoggingSink, TkProgressSink, SignalSink, CliProgressBar,
+                               JsonLinesSink, format_duration, format_progress)
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+
+class FakeSignal:
+    def __init__(self):
+        self.values = []
+
+    def emit(self, value):
+        self.values.append(value)
+
+
+class FakeVar:
+    def __init__(self):
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+
+class FakeLabel:
+    def __init__(self):
+        self.text = None
+
+    def config(self, text):
+        self.text = text
+
+
+class ImmediateRoot:
+    """代替Tk根窗口，after 直接在当前线程执行回调"""
+
+    def after(self, delay, callback):
+        callback()
+
+
+def progress_event(done=50, total=100, fps=10.0, eta=5.0, text=None):
+    return {'kind': 'progress', 'done': done, 'total': total, 'percent': done * 100.0 / total,
+            'fps': fps, 'eta': eta, 'elapsed': 5.0, 'text': text}
+
+
+def status_event(text):
+    return {'kind': 'status', 'done': 0, 'total': 0, 'percent': 0.0, 'fps': 0.0, 'eta': None,
+            'elapsed': 0.0, 'text': text}
+
+
+def test_throttles_progress_but_not_status_or_completion():
+    recorder = Recorder()
+    reporter = ProgressReporter(total=1000, sinks=[recorder], min_interval=60, max_interval=60)
+    for done in range(1, 1001):
+        reporter.update(done)
+    reporter.status("处理中")
+    kinds = [(e['kind'], e['done']) for e in recorder.events]
+    # 第一次更新、最后一帧和状态消息都会发出，中间的更新被限流
+    assert kinds == [('progress', 1), ('progress', 1000), ('status', 1000)]
+    assert recorder.events[1]['percent'] == 100.0
+
+
+def test_finish_and_set_percent_without_total():
+    recorder = Recorder()
+    reporter = ProgressReporter(sinks=[recorder], min_interval=0, min_percent=0)
+    reporter.set_percent(40)
+    assert recorder.events[-1]['percent'] == 40.0
+    reporter.finish("完成")
+    assert recorder.events[-1]['percent'] == 100.0
+    assert recorder.events[-1]['text'] == "完成"
+
+
+def test_failing_sink_does_not_block_others():
+    def broken(event):
+        raise RuntimeError("boom")
+
+    recorder = Recorder()
+    reporter = ProgressReporter(total=10, sinks=[broken, recorder])
+    reporter.status("开始")
+    assert [e['text'] for e in recorder.events] == ["开始"]
+    reporter.remove_sink(recorder)
+    reporter.status("结束")
+    assert len(recorder.events) == 1
+
+
+def test_format_helpers():
+    assert format_duration(None) == "--:--"
+    assert format_duration(65) == "01:05"
+    assert format_duration(3725) == "1:02:05"
+    assert format_progress(progress_event()) == "50.0% (50/100) 10.0帧/秒 剩余 00:05"
+
+
+def test_logging_sink(caplog):
+    log = logging.getLogger("test_progress")
+    sink = LoggingSink(log)
+    with caplog.at_level(logging.INFO, logger="test_progress"):
+        sink(status_event("准备"))
+        sink(progress_event(text="片段1"))
+    assert [r.getMessage() for r in caplog.records] == [
+        "状态: 准备", "进度: 50.0% (50/100) 10.0帧/秒 剩余 00:05 片段1"]
+
+
+def test_tk_sink_updates_variables():
+    progress, status, label = FakeVar(), FakeVar(), FakeLabel()
+    sink = TkProgressSink(ImmediateRoot(), progress, label, status)
+    sink(progress_event(done=25))
+    sink(status_event("完成"))
+    assert progress.value == 25.0
+    assert label.text.startswith("25.0%")
+    assert status.value == "完成"
+
+
+def test_signal_sink_emits_integer_percent():
+    progress, status = FakeSignal(), FakeSignal()
+    sink = SignalSink(progress, status)
+    sink(progress_event(done=333, total=1000))
+    sink(status_event("处理中"))
+    assert progress.values == [33]
+    assert status.values == ["处理中"]
+
+
+def test_cli_progress_bar():
+    stream = io.StringIO()
+    sink = CliProgressBar(stream, width=10)
+    sink(progress_event(done=50))
+    sink(status_event("片段完成"))
+    sink(progress_event(done=100))
+    output = stream.getvalue()
+    assert output.startswith("\r[#####-----] 50.0%")
+    assert "\n片段完成\n" in output
+    assert output.endswith("\n")
+
+
+def test_json_lines_sink(tmp_path):
+    path = str(tmp_path / "progress.jsonl")
+    sink = JsonLinesSink(path)
+    sink(progress_event())
+    sink(status_event("完成"))
+    sink.close()
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [line['kind'] for line in lines] == ['progress', 'status']
+    assert lines[1]['text'] == "完成"
+    assert 'time' in lines[0]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import numpy as np
+
+from reorder_buffer import ReorderBuffer
+
+
+def frame(value):
+    return np.full((2, 2, 3), value, dtype=np.uint8)
+
+
+def test_releases_frames_in_index_order():
+    buffer = ReorderBuffer(4)
+    for index in (2, 0, 3, 1):
+        buffer.put(index, frame(index))
+    buffer.close(4)
+    released = []
+    while True:
+        entry = buffer.get()
+        if entry is None:
+            break
+        released.append(entry[0])
+    assert released == [0, 1, 2, 3]
+
+
+def test_pop_ready_stops_at_gap():
+    buffer = ReorderBuffer(4)
+    buffer.put(0, frame(0))
+    buffer.put(2, frame(2))
+    assert [index for index, _ in buffer.pop_ready()] == [0]
+    buffer.put(1, frame(1))
+    assert [index for index, _ in buffer.pop_ready()] == [1, 2]
+
+
+def test_failed_frame_uses_original_and_missing_frame_is_skipped():
+    buffer = ReorderBuffer(4)
+    buffer.put(0, None, original=frame(7))
+    buffer.put(1, None)
+    buffer.put(2, frame(2))
+    buffer.close(3)
+    index, value = buffer.get()
+    assert index == 0 and value[0, 0, 0] == 7
+    assert buffer.get()[0] == 2
+    assert buffer.get() is None
+
+
+def test_acquire_blocks_until_window_moves():
+    buffer = ReorderBuffer(2)
+    assert buffer.acquire(1)
+    assert not buffer.can_accept(2)
+
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: buffer.acquire(2) and acquired.set(), daemon=True)
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    buffer.put(0, frame(0))
+    assert buffer.get()[0] == 0
+    assert acquired.wait(2)
+    thread.join(2)
+
+
+def test_abort_wakes_waiting_threads():
+    buffer = ReorderBuffer(1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(buffer.acquire(5)), daemon=True),
+               threading.Thread(target=lambda: results.append(buffer.get()), daemon=True)]
+    for thread in threads:
+        thread.start()
+    buffer.abort()
+    for thread in threads:
+        thread.join(2)
+        assert not thread.is_alive()
+    assert sorted(results, key=repr) == sorted([False, None], key=repr)
+
+
+def test_non_zero_start_index():
+    buffer = ReorderBuffer(4, start_index=100)
+    assert buffer.acquire(103)
+    assert not buffer.can_accept(104)
+    for index in (101, 100, 102):
+        buffer.put(index, frame(index % 256))
+    buffer.close(103)
+    assert [buffer.get()[0] for _ in range(3)] == [100, 101, 102]
+    assert buffer.get() is None
+
+
+def test_frames_outside_window_are_dropped():
+    buffer = ReorderBuffer(2, start_index=10)
+    buffer.put(9, frame(9))
+    buffer.put(12, frame(12))
+    assert len(buffer) == 0
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import os
+import concurrent.futures
+
+import cv2
+
+from conftest import read_frame_count, run_with_timeout
+from segmented_video import SegmentManifest, plan_segments
+
+
+def test_encode_segment_starting_mid_video(headless_engine, sample_video, blank_face, tmp_path):
+    video = cv2.VideoCapture(sample_video)
+    try:
+        frames, _ = run_with_timeout(lambda: headless_engine.encode_segment(
+            video, blank_face, {'start': 10, 'end': 20},
+            str(tmp_path / "segment.partial.mp4"), str(tmp_path / "segment.mp4")))
+    finally:
+        video.release()
+    assert frames == 10
+    assert read_frame_count(str(tmp_path / "segment.mp4")) == 10
+
+
+def test_process_video_in_segments(headless_engine, sample_video, blank_face, tmp_path):
+    app = headless_engine
+    app.video_path = sample_video
+    app.face_images = [blank_face]
+    app.selected_face_index = 0
+    app.output_path = str(tmp_path / "output.mp4")
+    app.segment_seconds = 1
+
+    result = run_with_timeout(app.process_video)
+    assert result == app.output_path
+    assert app.job_metrics['segments']['count'] == 3
+    assert app.job_metrics['frames'] == 30
+    assert read_frame_count(result) == 30
+
+
+def test_segments_in_parallel_workers(headless_engine, sample_video, blank_face, tmp_path, caplog):
+    app = headless_engine
+    app.video_path = sample_video
+    app.face_images = [blank_face]
+    app.selected_face_index = 0
+    app.output_path = str(tmp_path / "output.mp4")
+    app.segment_workers = 2
+
+    result = run_with_timeout(app.process_video, timeout=120)
+    assert result == app.output_path
+    # 工作进程中的片段失败会在主进程中重试，这里要求两个片段都由工作进程完成
+    assert not [r for r in caplog.records if "处理失败" in r.getMessage()]
+    assert app.job_metrics['segments']['count'] == 2
+    assert app.job_metrics['frames'] == 30
+    assert read_frame_count(result) == 30
+
+
+def test_plan_segments_by_duration():
+    assert plan_segments(100, 10, 3) == [(0, 30), (30, 60), (60, 90), (90, None)]
+    assert plan_segments(0, 25, 10) == [(0, None)]
+    assert plan_segments(20, 10, 5) == [(0, None)]
+
+
+def test_plan_segments_aligns_to_keyframes():
+    # 边界取不早于名义边界的第一个关键帧，之后的名义边界从该关键帧起算
+    assert plan_segments(100, 10, 3, keyframes=[0, 25, 32, 70, 95]) == [(0, 32), (32, 70), (70, None)]
+    # 名义边界之后没有关键帧时最后一段读到结尾
+    assert plan_segments(100, 10, 3, keyframes=[10]) == [(0, None)]
+
+
+def test_manifest_resumes_completed_segments(tmp_path):
+    work_dir = str(tmp_path / "parts")
+    signature = {'video': 'a.mp4', 'options': {'crf': 20}}
+    segments = [(0, 10), (10, 20), (20, None)]
+
+    manifest = SegmentManifest.open(work_dir, signature, segments)
+    assert [s['index'] for s in manifest.pending()] == [0, 1, 2]
+    open(manifest.segment_path(manifest.segments[0]), "wb").close()
+    manifest.mark_done(0, 10, 1.5)
+    manifest.mark_failed(1, RuntimeError("boom"))
+
+    resumed = SegmentManifest.open(work_dir, signature, segments)
+    assert [s['index'] for s in resumed.pending()] == [1, 2]
+    assert resumed.done_frames() == 10
+    assert resumed.segments[1]['error'] == "boom"
+
+
+def test_manifest_restarts_when_signature_changes(tmp_path):
+    work_dir = str(tmp_path / "parts")
+    segments = [(0, 10), (10, None)]
+    manifest = SegmentManifest.open(work_dir, {'options': {'crf': 20}}, segments)
+    segment_file = manifest.segment_path(manifest.segments[0])
+    open(segment_file, "wb").close()
+    manifest.mark_done(0, 10, 1.0)
+
+    restarted = SegmentManifest.open(work_dir, {'options': {'crf': 18}}, segments)
+    assert [s['index'] for s in restarted.pending()] == [0, 1]
+    assert not os.path.exists(segment_file)
+
+
+def test_manifest_redoes_segment_whose_file_is_missing(tmp_path):
+    work_dir = str(tmp_path / "parts")
+    manifest = SegmentManifest.open(work_dir, {}, [(0, None)])
+    manifest.mark_done(0, 5, 1.0)
+    assert [s['index'] for s in SegmentManifest.open(work_dir, {}, [(0, None)]).pending()] == [0]
+
+
+class RecordingExecutor:
+    """代替进程池：记录提交的片段参数，立即返回完成的结果"""
+
+    submitted = []
+
+    def __init__(self, **kwargs):
+        pass
+
+    def submit(self, fn, *args):
+        RecordingExecutor.submitted.append(args)
+        future = concurrent.futures.Future()
+        future.set_result((10, 0.1))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_parallel_parent_loads_no_models(headless_engine, sample_video, blank_face, tmp_path, monkeypatch):
+    import engine
+
+    monkeypatch.setattr(engine.concurrent.futures, "ProcessPoolExecutor", RecordingExecutor)
+    RecordingExecutor.submitted = []
+    app = headless_engine
+    app.video_path = sample_video
+    app.swapper_var = "inswapper"
+    app.det_size = "320x320"
+    manifest = SegmentManifest.open(str(tmp_path / "parts"), {}, [(0, 10), (10, None)])
+
+    app.run_segments_parallel(manifest, manifest.pending(), blank_face, 2)
+    # 主进程连加载模型都没有尝试
+    assert app.models._models == {}
+    assert [args[-1] for args in RecordingExecutor.submitted] == [320, 320]
+    assert [s['status'] for s in manifest.segments] == ['done', 'done']
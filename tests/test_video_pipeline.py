@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+import pytest
+
+from conftest import run_with_timeout
+from video_pipeline import VideoPipeline, PipelineStage, FrameItem, ProcessingCancelled
+
+
+def make_items(start, count):
+    return [FrameItem(index, np.full((2, 2, 3), index % 256, dtype=np.uint8)) for index in range(start, start + count)]
+
+
+def collect(pipeline_factory):
+    written = []
+    pipeline = pipeline_factory(lambda index, frame: written.append(index))
+    encoded = run_with_timeout(pipeline.run)
+    return pipeline, encoded, written
+
+
+def invert(item):
+    # 帧越靠前处理越慢，让结果乱序到达
+    time.sleep(0.002 * (item.index % 3))
+    item.result = 255 - item.frame
+
+
+def test_parallel_stage_writes_in_order():
+    pipeline, encoded, written = collect(lambda sink: VideoPipeline(
+        make_items(0, 40), [PipelineStage("invert", invert, workers=4)], sink, reorder_capacity=8))
+    assert encoded == 40
+    assert written == list(range(40))
+    assert [s['name'] for s in pipeline.stats()] == ['decode', 'invert', 'encode']
+
+
+def test_batched_stages():
+    def batch_invert(items):
+        for item in items:
+            item.result = 255 - item.frame
+
+    def check(item):
+        assert item.result is not None
+
+    _, encoded, written = collect(lambda sink: VideoPipeline(
+        make_items(0, 25), [PipelineStage("swap", batch_invert, workers=2, batch_size=4),
+                            PipelineStage("check", check, workers=2)], sink))
+    assert encoded == 25
+    assert written == list(range(25))
+
+
+def test_non_zero_start_index():
+    _, encoded, written = collect(lambda sink: VideoPipeline(
+        make_items(100, 30), [PipelineStage("invert", invert, workers=3)], sink,
+        reorder_capacity=16, start_index=100))
+    assert encoded == 30
+    assert written == list(range(100, 130))
+
+
+def test_stage_error_writes_original_frame():
+    def fail_on_odd(item):
+        if item.index % 2:
+            raise ValueError("boom")
+        item.result = item.frame
+
+    frames = []
+    pipeline = VideoPipeline(make_items(0, 6), [PipelineStage("swap", fail_on_odd)],
+                             lambda index, frame: frames.append((index, int(frame[0, 0, 0]))))
+    assert run_with_timeout(pipeline.run) == 6
+    assert frames == [(i, i) for i in range(6)]
+
+
+def test_source_error_stops_pipeline():
+    def source():
+        yield from make_items(0, 3)
+        raise RuntimeError("decode failed")
+
+    pipeline = VideoPipeline(source(), [PipelineStage("invert", invert, workers=2)], lambda index, frame: None)
+    with pytest.raises(RuntimeError):
+        run_with_timeout(pipeline.run)
+
+
+def test_cancelled_source_stops_pipeline():
+    def source():
+        yield from make_items(0, 3)
+        raise ProcessingCancelled("任务已取消")
+
+    pipeline = VideoPipeline(source(), [PipelineStage("invert", invert, workers=2)], lambda index, frame: None)
+    with pytest.raises(ProcessingCancelled):
+        run_with_timeout(pipeline.run)